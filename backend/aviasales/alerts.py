@@ -0,0 +1,201 @@
+'''
+Price alerts for the Telegram bot: "notify me when MOW→BCN on 2025-03-01 costs
+less than 15 000 ₽". Subscriptions live in SQLite (ALERTS_DB_PATH); evaluate()
+runs as a batch, prices every distinct route once for all of its dates and
+appends the triggered alerts to an NDJSON queue file the bot drains.
+
+    python alerts.py --db alerts.sqlite3 --queue alerts.ndjson
+'''
+import argparse
+import json
+import os
+import sqlite3
+import threading
+import time
+from bisect import bisect_right
+from datetime import date
+from itertools import groupby
+from operator import itemgetter
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+MAX_ALERTS_PER_CHAT = 50
+
+# (origin, destination, dates) -> cheapest price for each date
+PriceDates = Callable[[str, str, Sequence[str]], List[int]]
+
+# Row layout of AlertStore.active(), which evaluate() relies on
+ORIGIN, DESTINATION, DATE, MAX_PRICE, ALERT_ID, CHAT_ID, NOTIFIED_PRICE = range(7)
+
+ALERT_COLUMNS = 'id, chat_id, origin, destination, date, max_price, created, notified_price'
+
+class AlertStore:
+    '''
+    SQLite-backed subscriptions, one connection per thread like DiskCache. The
+    file is created on first use, not at import.
+    '''
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+
+    @classmethod
+    def from_env(cls) -> Optional['AlertStore']:
+        # No default: a per-instance temp file would lose subscriptions at the next cold start
+        path = os.environ.get('ALERTS_DB_PATH')
+        return cls(path) if path else None
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5.0, isolation_level=None, check_same_thread=False)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            # The route index hands evaluate() its rows already grouped and sorted by threshold
+            connection.executescript(
+                'CREATE TABLE IF NOT EXISTS alerts ('
+                ' id INTEGER PRIMARY KEY, chat_id TEXT NOT NULL, origin TEXT NOT NULL, destination TEXT NOT NULL,'
+                ' date TEXT NOT NULL, max_price INTEGER NOT NULL, created REAL NOT NULL, notified_price INTEGER);'
+                'CREATE INDEX IF NOT EXISTS alerts_chat ON alerts (chat_id);'
+                'CREATE INDEX IF NOT EXISTS alerts_route ON alerts (origin, destination, date, max_price);'
+            )
+            self._local.connection = connection
+        return connection
+
+    def close(self) -> None:
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
+
+    def add(self, chat_id: str, origin: str, destination: str, departure_date: str, max_price: int) -> Dict[str, Any]:
+        connection = self._connection()
+        count = connection.execute('SELECT COUNT(*) FROM alerts WHERE chat_id = ?', (chat_id,)).fetchone()[0]
+        if count >= MAX_ALERTS_PER_CHAT:
+            raise ValueError(f"At most {MAX_ALERTS_PER_CHAT} alerts per chat")
+        created = time.time()
+        cursor = connection.execute(
+            'INSERT INTO alerts (chat_id, origin, destination, date, max_price, created) VALUES (?, ?, ?, ?, ?, ?)',
+            (chat_id, origin, destination, departure_date, max_price, created)
+        )
+        return alert_dict((cursor.lastrowid, chat_id, origin, destination, departure_date, max_price, created, None))
+
+    def add_many(self, rows: Iterable[Tuple[str, str, str, str, int]]) -> None:
+        # (chat_id, origin, destination, date, max_price); no per-chat limit, for imports and benchmarks
+        connection = self._connection()
+        now = time.time()
+        connection.execute('BEGIN')
+        connection.executemany(
+            'INSERT INTO alerts (chat_id, origin, destination, date, max_price, created) VALUES (?, ?, ?, ?, ?, ?)',
+            (row + (now,) for row in rows)
+        )
+        connection.execute('COMMIT')
+
+    def for_chat(self, chat_id: str) -> List[Dict[str, Any]]:
+        rows = self._connection().execute(
+            f'SELECT {ALERT_COLUMNS} FROM alerts WHERE chat_id = ? ORDER BY date, id', (chat_id,)
+        ).fetchall()
+        return [alert_dict(row) for row in rows]
+
+    def remove(self, chat_id: str, alert_id: int) -> bool:
+        cursor = self._connection().execute('DELETE FROM alerts WHERE id = ? AND chat_id = ?', (alert_id, chat_id))
+        return cursor.rowcount > 0
+
+    def active(self, today: str) -> List[Tuple[str, str, str, int, int, str, Optional[int]]]:
+        '''Alerts for today or later, ordered by route, date and max_price.'''
+        return self._connection().execute(
+            'SELECT origin, destination, date, max_price, id, chat_id, notified_price FROM alerts'
+            ' WHERE date >= ? ORDER BY origin, destination, date, max_price', (today,)
+        ).fetchall()
+
+    def mark_notified(self, notified: Sequence[Tuple[int, int]]) -> None:
+        # (price, alert id)
+        connection = self._connection()
+        connection.execute('BEGIN')
+        connection.executemany('UPDATE alerts SET notified_price = ? WHERE id = ?', notified)
+        connection.execute('COMMIT')
+
+    def purge(self, today: str) -> int:
+        return self._connection().execute('DELETE FROM alerts WHERE date < ?', (today,)).rowcount
+
+def alert_dict(row: Sequence[Any]) -> Dict[str, Any]:
+    return dict(zip(('id', 'chat_id', 'origin', 'destination', 'date', 'max_price', 'created', 'notified_price'), row))
+
+def evaluate(store: AlertStore, price_dates: PriceDates, queue_path: str,
+             today: Optional[str] = None) -> Dict[str, Any]:
+    '''
+    One evaluation pass. An alert triggers when the cheapest fare for its date is
+    below max_price and, if it was sent before, below the price it was sent at.
+    Each route is priced once for all of its dates; within a date, thresholds
+    are sorted, so one bisect finds every alert the price is under.
+    '''
+    started = time.perf_counter()
+    today = today or date.today().isoformat()
+    purged = store.purge(today)
+    rows = store.active(today)
+    thresholds = [row[MAX_PRICE] for row in rows]
+
+    evaluated_at = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+    lines: List[str] = []
+    notified: List[Tuple[int, int]] = []
+    routes = groups = 0
+    position = 0
+    for (origin, destination), route_rows in groupby(rows, key=itemgetter(ORIGIN, DESTINATION)):
+        # [start, end) run of rows per date, in date order
+        runs: List[Tuple[str, int, int]] = []
+        for departure_date, date_rows in groupby(route_rows, key=itemgetter(DATE)):
+            start = position
+            position += sum(1 for _ in date_rows)
+            runs.append((departure_date, start, position))
+        prices = price_dates(origin, destination, [departure_date for departure_date, _, _ in runs])
+        routes += 1
+        groups += len(runs)
+
+        for (departure_date, start, end), price in zip(runs, prices):
+            for row in rows[bisect_right(thresholds, price, start, end):end]:
+                previous = row[NOTIFIED_PRICE]
+                if previous is not None and price >= previous:
+                    continue
+                notified.append((price, row[ALERT_ID]))
+                lines.append(json.dumps({
+                    'alert_id': row[ALERT_ID],
+                    'chat_id': row[CHAT_ID],
+                    'origin': origin,
+                    'destination': destination,
+                    'date': departure_date,
+                    'price': price,
+                    'max_price': row[MAX_PRICE],
+                    'currency': '₽',
+                    'evaluated_at': evaluated_at
+                }, ensure_ascii=False) + '\n')
+
+    if lines:
+        # Queue first, then mark: a crash in between re-sends rather than loses alerts
+        with open(queue_path, 'a', encoding='utf-8') as queue:
+            queue.write(''.join(lines))
+            queue.flush()
+            os.fsync(queue.fileno())
+        store.mark_notified(notified)
+
+    return {
+        'alerts': len(rows),
+        'routes': routes,
+        'groups': groups,
+        'triggered': len(lines),
+        'purged': purged,
+        'elapsed_ms': round((time.perf_counter() - started) * 1000, 1)
+    }
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', default=os.environ.get('ALERTS_DB_PATH'), help='defaults to ALERTS_DB_PATH')
+    parser.add_argument('--queue', default=os.environ.get('ALERTS_QUEUE_PATH', 'alerts.ndjson'))
+    parser.add_argument('--today', help='YYYY-MM-DD; defaults to the current date')
+    args = parser.parse_args()
+    if not args.db:
+        parser.error('--db or ALERTS_DB_PATH is required')
+
+    import index
+    print(json.dumps(evaluate(AlertStore(args.db), index.calendar_min_prices, args.queue, args.today)))
+
+if __name__ == '__main__':
+    main()
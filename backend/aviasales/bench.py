@@ -0,0 +1,450 @@
+'''
+Microbenchmarks for the aviasales function.
+Usage: python bench.py <benchmark> [options]; run with -h for the list.
+'''
+import argparse
+import importlib.util
+import json
+import os
+import random
+import subprocess
+import tempfile
+import time
+from types import ModuleType, SimpleNamespace
+from typing import Any, Callable, Dict, List, Sequence
+
+import alerts
+import index
+import providers
+from fare_stub import start_stub
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+FAKE_CONTEXT = SimpleNamespace(request_id='bench', function_name='aviasales', function_version='bench')
+
+SYLLABLES = ['ка', 'ро', 'ми', 'ла', 'но', 'ва', 'те', 'бу', 'ре', 'ск', 'ан', 'ов', 'ин', 'ск', 'гра', 'дон', 'поль', 'ар']
+COUNTRIES = ['Россия', 'Франция', 'Германия', 'Испания', 'Италия', 'Турция', 'Китай', 'Индия', 'США', 'Бразилия']
+
+def synthetic_cities(count: int, seed: int = 42) -> List[Dict[str, str]]:
+    rng = random.Random(seed)
+    cities = []
+    for i in range(count):
+        name = ''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))).capitalize()
+        if rng.random() < 0.2:
+            name += f" ({''.join(rng.choice(SYLLABLES) for _ in range(3)).capitalize()})"
+        code = ''.join(chr(65 + (i // 26 ** k) % 26) for k in range(3))
+        cities.append({'code': code, 'name': name, 'country': rng.choice(COUNTRIES)})
+    return cities
+
+def load_index(source: str, name: str = 'index_baseline') -> ModuleType:
+    '''
+    Imports another version of index.py, either from a file path or from a git
+    revision (e.g. HEAD~1), so benchmarks can compare before and after.
+    '''
+    path = source
+    if not os.path.exists(source):
+        blob = subprocess.run(['git', 'show', f'{source}:./index.py'], cwd=HERE, capture_output=True, check=True).stdout
+        handle, path = tempfile.mkstemp(suffix='.py', prefix='index_')
+        with os.fdopen(handle, 'wb') as tmp:
+            tmp.write(blob)
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def get_event(action: str, **params: str) -> Dict[str, Any]:
+    return {'httpMethod': 'GET', 'queryStringParameters': dict(params, action=action), 'headers': {}}
+
+def per_call_us(fn: Callable[[Any], Any], inputs: Sequence[Any], min_seconds: float = 0.5) -> float:
+    calls = 0
+    start = time.perf_counter()
+    while True:
+        for item in inputs:
+            fn(item)
+        calls += len(inputs)
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_seconds:
+            return elapsed / calls * 1e6
+
+def bench_cities(args: argparse.Namespace) -> None:
+    def legacy_scan(catalog: List[Dict[str, str]], query: str) -> List[Dict[str, str]]:
+        # The per-request filter action=cities used before the index existed
+        query = query.lower()
+        return [city for city in catalog if query in city['name'].lower() or query in city['country'].lower()]
+
+    # Speedups are over the scan, for unbounded q and for q with limit
+    print(f"{'cities':>8} {'build ms':>9} {'scan us/q':>10} {'index us/q':>11} {'limit us/q':>11} "
+          f"{'index x':>8} {'limit x':>8}")
+    for size in args.sizes:
+        catalog = index.CITIES if size == len(index.CITIES) else synthetic_cities(size)
+        start = time.perf_counter()
+        city_index = index.CityIndex(catalog)
+        build_ms = (time.perf_counter() - start) * 1000
+
+        rng = random.Random(7)
+        queries = []
+        for _ in range(200):
+            name = index.normalize_text(rng.choice(catalog)['name'])
+            start_pos = rng.randrange(len(name))
+            queries.append(name[start_pos:start_pos + rng.randint(1, 6)])
+
+        scan_us = per_call_us(lambda q: legacy_scan(catalog, q), queries, args.seconds)
+        index_us = per_call_us(city_index.search, queries, args.seconds)
+        limit_us = per_call_us(lambda q: city_index.search(q, args.limit), queries, args.seconds)
+        print(f"{size:>8} {build_ms:>9.1f} {scan_us:>10.1f} {index_us:>11.1f} {limit_us:>11.1f} "
+              f"{scan_us / index_us:>7.1f}x {scan_us / limit_us:>7.1f}x")
+
+DISPATCH_EVENTS: Dict[str, Dict[str, Any]] = {
+    'OPTIONS': {'httpMethod': 'OPTIONS'},
+    'unknown': get_event('unknown'),
+    'cities': get_event('cities'),
+    'cities?q': get_event('cities', q='мос'),
+    'telegram': get_event('telegram'),
+    'popular': get_event('popular'),
+    'hotel_cities?q': get_event('hotel_cities', q='па'),
+    'search': get_event('search', **{'from': 'MOW', 'to': 'PAR', 'date': '2025-01-10'}),
+    'hotels': get_event('hotels', city='Париж'),
+}
+
+def bench_dispatch(args: argparse.Namespace) -> None:
+    modules = [('current', index)]
+    if args.baseline:
+        modules.append((f'baseline {args.baseline}', load_index(args.baseline)))
+
+    for label, module in modules:
+        routes = getattr(module, 'ROUTES', None)
+        print(f"{label}\n{'event':>16} {'handler us':>11} {'route us':>9} {'dispatch us':>12}")
+        for name, event in DISPATCH_EVENTS.items():
+            handler_us = per_call_us(lambda e: module.handler(e, FAKE_CONTEXT), [event], args.seconds)
+            params = event.get('queryStringParameters') or {}
+            action_handler = routes.get((event['httpMethod'], params.get('action'))) if routes else None
+            if action_handler is None:
+                print(f"{name:>16} {handler_us:>11.2f} {'-':>9} {'-':>12}")
+                continue
+            route_us = per_call_us(lambda e: action_handler(e, params, FAKE_CONTEXT), [event], args.seconds)
+            print(f"{name:>16} {handler_us:>11.2f} {route_us:>9.2f} {handler_us - route_us:>12.2f}")
+
+def bench_calendar(args: argparse.Namespace) -> None:
+    dates = [f'2025-03-{day:02d}' for day in range(1, 32)]
+    month_event = get_event('calendar', **{'from': 'MOW', 'to': 'PAR', 'month': '2025-03'})
+    search_events = [get_event('search', **{'from': 'MOW', 'to': 'PAR', 'date': date}) for date in dates]
+
+    def calendar_uncached(event: Dict[str, Any]) -> None:
+        index.CALENDAR_CACHE._data.clear()
+        index.handler(event, FAKE_CONTEXT)
+
+    def searches_uncached(events: List[Dict[str, Any]]) -> None:
+        index.SEARCH_CACHE._data.clear()
+        for event in events:
+            index.handler(event, FAKE_CONTEXT)
+
+    print(f"{'31-day window':>28} {'ms':>8}")
+    print(f"{'calendar_min_prices()':>28} {per_call_us(lambda d: index.calendar_min_prices('MOW', 'PAR', d), [dates], args.seconds) / 1000:>8.3f}")
+    print(f"{'action=calendar (miss)':>28} {per_call_us(calendar_uncached, [month_event], args.seconds) / 1000:>8.3f}")
+    print(f"{'action=calendar (hit)':>28} {per_call_us(lambda e: index.handler(e, FAKE_CONTEXT), [month_event], args.seconds) / 1000:>8.3f}")
+    print(f"{'31 x action=search (miss)':>28} {per_call_us(searches_uncached, [search_events], args.seconds) / 1000:>8.3f}")
+
+def legacy_hotels(city: str, checkin: str, checkout: str, count: int) -> List[Dict[str, Any]]:
+    # Replica of the per-row generate_hotels loop that predates HotelColumns
+    from datetime import datetime as dt
+    base_price = index.CITY_HOTEL_BASE_PRICES.get(city.lower(), 6000)
+    hotels = []
+    for _ in range(count):
+        chain = random.choice(index.HOTEL_CHAINS)
+        star_rating = random.randint(3, 5)
+        night_price = int(base_price * chain['multiplier'] * random.uniform(0.9, 1.1))
+        market_night_price = int(night_price / 0.75)
+        try:
+            nights = max((dt.strptime(checkout, '%Y-%m-%d') - dt.strptime(checkin, '%Y-%m-%d')).days, 1)
+        except ValueError:
+            nights = 3
+        total_price = night_price * nights
+        market_total_price = market_night_price * nights
+        hotel_types = list(index.HOTEL_TYPES)
+        amenities = random.sample(list(index.HOTEL_AMENITIES), k=random.randint(4, 7))
+        hotels.append({
+            'id': f"HTL{random.randint(10000, 99999)}",
+            'name': f"{chain['name']} {random.choice(hotel_types)} {city}",
+            'chain': chain['name'],
+            'stars': star_rating,
+            'rating': round(random.uniform(7.5, 9.8), 1),
+            'reviews_count': random.randint(150, 3500),
+            'price_per_night': night_price,
+            'market_price_per_night': market_night_price,
+            'total_price': total_price,
+            'market_total_price': market_total_price,
+            'savings': market_total_price - total_price,
+            'discount_percent': 25,
+            'currency': '₽',
+            'nights': nights,
+            'address': f"{random.choice(list(index.HOTEL_DISTRICTS))}, {city}",
+            'distance_to_center': round(random.uniform(0.3, 5.0), 1),
+            'amenities': amenities,
+            'room_type': random.choice(list(index.ROOM_TYPES)),
+            'cancellation': random.choice(list(index.CANCELLATION_POLICIES)),
+            'breakfast_included': random.choice([True, False]),
+            'image': f"https://images.unsplash.com/photo-{random.randint(1500000000000, 1600000000000)}"
+        })
+    hotels.sort(key=lambda x: x['total_price'])
+    return hotels
+
+def bench_hotels(args: argparse.Namespace) -> None:
+    stay = ('Париж', '2025-01-10', '2025-01-13')
+
+    def columnar(count: int) -> None:
+        index.generate_hotel_columns(*stay, 2, count)
+
+    def columnar_rows(count: int) -> None:
+        columns = index.generate_hotel_columns(*stay, 2, count)
+        json.dumps(list(columns.rows(columns.cheapest())))
+
+    def columnar_top20(count: int) -> None:
+        columns = index.generate_hotel_columns(*stay, 2, count)
+        json.dumps(list(columns.rows(columns.cheapest(20))))
+
+    def legacy_rows(count: int) -> None:
+        json.dumps(legacy_hotels(*stay, count))
+
+    variants = [('legacy rows+dumps', legacy_rows), ('columns only', columnar),
+                ('columns+rows+dumps', columnar_rows), ('columns+top20+dumps', columnar_top20)]
+    print(f"{'hotels/s':>22}" + ''.join(f"{count:>12}" for count in args.counts))
+    for label, fn in variants:
+        rates = [count / (per_call_us(fn, [count], args.seconds) / 1e6) for count in args.counts]
+        print(f"{label:>22}" + ''.join(f"{rate:>12,.0f}" for rate in rates))
+
+def bench_metrics(args: argparse.Namespace) -> None:
+    enabled = index.METRICS_ENABLED
+    print(f"{'event':>16} {'on us':>8} {'off us':>8} {'overhead us':>12}")
+    try:
+        for name, event in DISPATCH_EVENTS.items():
+            timings = []
+            for state in (True, False):
+                index.METRICS_ENABLED = state
+                timings.append(per_call_us(lambda e: index.handler(e, FAKE_CONTEXT), [event], args.seconds))
+            print(f"{name:>16} {timings[0]:>8.2f} {timings[1]:>8.2f} {timings[0] - timings[1]:>12.2f}")
+    finally:
+        index.METRICS_ENABLED = enabled
+
+def bench_providers(args: argparse.Namespace) -> None:
+    # A steady provider, one with a slow tail and one that fails now and then
+    stubs = [start_stub(latency_ms=20), start_stub(latency_ms=25, tail_ms=600, tail_rate=0.1, seed=2),
+             start_stub(latency_ms=30, error_rate=0.1, price_factor=0.97, seed=3)]
+    routes = [('MOW', 'PAR'), ('LED', 'IST'), ('AER', 'DXB'), ('KZN', 'BKK')]
+    try:
+        print(f"{'mode':>10} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'complete':>9} {'upstream calls':>15}")
+        for label, hedge_after in (('no hedge', None), ('hedged', 0.08)):
+            client = providers.FareClient([
+                providers.FareProvider(f'stub{i}', url, timeout=0.4, hedge_after=hedge_after)
+                for i, (_, url) in enumerate(stubs)
+            ])
+            latencies, complete = [], 0
+            for i in range(args.searches):
+                origin, destination = routes[i % len(routes)]
+                started = time.perf_counter()
+                _, status = client.search(origin, destination, f'2025-03-{i % 28 + 1:02d}')
+                latencies.append((time.perf_counter() - started) * 1000)
+                complete += all(value == 'ok' for value in status.values())
+            latencies.sort()
+            pick = lambda q: latencies[min(len(latencies) - 1, int(q * len(latencies)))]
+            print(f"{label:>10} {pick(0.5):>8.1f} {pick(0.95):>8.1f} {pick(0.99):>8.1f} "
+                  f"{complete / len(latencies):>8.0%} {client.stats['requests']:>15}")
+    finally:
+        for server, _ in stubs:
+            server.shutdown()
+
+def bench_cache(args: argparse.Namespace) -> None:
+    handle, path = tempfile.mkstemp(suffix='.sqlite3', prefix='aviasales_cache_')
+    os.close(handle)
+    disk = index.DiskCache(path)
+    cache = index.SEARCH_CACHE
+    saved = cache.disk
+    hit_event = get_event('search', **{'from': 'MOW', 'to': 'PAR', 'date': '2025-03-01'})
+
+    def unique_events(count: int) -> List[Dict[str, Any]]:
+        codes = [city['code'] for city in index.CITIES]
+        return [get_event('search', **{'from': codes[i % len(codes)], 'to': codes[(i * 7 + 1) % len(codes)],
+                                       'date': f'2026-{i % 12 + 1:02d}-{i % 28 + 1:02d}'}) for i in range(count)]
+
+    def miss_us(events: List[Dict[str, Any]]) -> float:
+        start = time.perf_counter()
+        for event in events:
+            cache._data.clear()
+            index.handler(event, FAKE_CONTEXT)
+        return (time.perf_counter() - start) / len(events) * 1e6
+
+    def disk_hit(event: Dict[str, Any]) -> None:
+        cache._data.clear()
+        index.handler(event, FAKE_CONTEXT)
+
+    try:
+        cache.disk = None
+        miss_memory_only = miss_us(unique_events(2000))
+        cache.disk = disk
+        miss_with_disk = miss_us(unique_events(2000))
+        index.handler(hit_event, FAKE_CONTEXT)
+        print(f"{'action=search':>26} {'us':>8}")
+        print(f"{'memory hit':>26} {per_call_us(lambda e: index.handler(e, FAKE_CONTEXT), [hit_event], args.seconds):>8.1f}")
+        print(f"{'disk hit (memory cold)':>26} {per_call_us(disk_hit, [hit_event], args.seconds):>8.1f}")
+        print(f"{'miss, memory only':>26} {miss_memory_only:>8.1f}")
+        print(f"{'miss + disk write':>26} {miss_with_disk:>8.1f}")
+        start = time.perf_counter()
+        warmed = index.TTLCache(cache.maxsize, cache.ttl, disk, 'search')
+        print(f"{'warm start entries':>26} {len(warmed._data):>8}")
+        print(f"{'warm start ms':>26} {(time.perf_counter() - start) * 1000:>8.1f}")
+    finally:
+        cache.disk = saved
+        disk.close()
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+
+def synthetic_route_graph(airports: int, legs: int, hubs: int, hub_transfers: bool, seed: int = 11) -> index.RouteGraph:
+    # Hubs fully interconnected, every airport tied to a few hubs, the rest random regional pairs
+    rng = random.Random(seed)
+    codes = [f'A{i:04d}' for i in range(airports)]
+    pairs = {(a, b) for a in range(hubs) for b in range(hubs) if a != b}
+    for airport in range(hubs, airports):
+        for hub in rng.sample(range(hubs), 4):
+            pairs.update(((airport, hub), (hub, airport)))
+    while len(pairs) < legs:
+        a = rng.randrange(hubs, airports)
+        b = a + rng.randint(-100, 100)
+        if hubs <= b < airports and a != b:
+            pairs.update(((a, b), (b, a)))
+    rows = [(a, b, 5 * rng.randrange(48), rng.choice([240, 480, 1440]), rng.randint(60, 600), rng.randint(3000, 40000))
+            for a, b in pairs]
+    return index.RouteGraph(codes, rows, transfers=codes[:hubs] if hub_transfers else None)
+
+def bench_routes(args: argparse.Namespace) -> None:
+    print(f"{'graph':>34} {'build ms':>9} {'prefer':>9} {'mean ms':>8} {'p95 ms':>8} {'max ms':>8} {'found':>6}")
+    rng = random.Random(5)
+    for label, hub_transfers in (('hub transfers', True), ('transfer anywhere', False)):
+        start = time.perf_counter()
+        graph = synthetic_route_graph(args.airports, args.legs, args.hubs, hub_transfers)
+        build_ms = (time.perf_counter() - start) * 1000
+        queries = [tuple(rng.sample(graph.codes, 2)) for _ in range(args.queries)]
+        for prefer in index.PREFERENCES:
+            timings, found = [], 0
+            for origin, destination in queries:
+                start = time.perf_counter()
+                found += len(graph.itineraries(origin, destination, args.k, by_duration=prefer == 'duration'))
+                timings.append((time.perf_counter() - start) * 1000)
+            timings.sort()
+            name = f"{label} {len(graph.codes)}/{len(graph.targets)}"
+            print(f"{name:>34} {build_ms:>9.0f} {prefer:>9} {sum(timings) / len(timings):>8.2f} "
+                  f"{timings[int(0.95 * len(timings))]:>8.2f} {timings[-1]:>8.2f} {found / len(queries):>6.1f}")
+
+    start = time.perf_counter()
+    index.build_route_graph(index.CITIES)
+    catalog_ms = (time.perf_counter() - start) * 1000
+    print(f"catalog graph: {len(index.ROUTE_GRAPH.codes)} airports, {len(index.ROUTE_GRAPH.targets)} legs, built in {catalog_ms:.1f} ms")
+
+COMPRESSION_EVENTS: Dict[str, Dict[str, Any]] = {
+    'cities': get_event('cities'),
+    'hotel_cities': get_event('hotel_cities'),
+    'popular': get_event('popular'),
+    'search': get_event('search', **{'from': 'MOW', 'to': 'PAR', 'date': '2025-03-01'}),
+    'calendar': get_event('calendar', **{'from': 'MOW', 'to': 'PAR', 'month': '2025-03'}),
+    'hotels': get_event('hotels', city='Париж', checkin='2025-03-01', checkout='2025-03-05'),
+    'package': get_event('package', **{'from': 'MOW', 'to': 'DPS', 'checkin': '2025-03-01', 'checkout': '2025-03-08'}),
+}
+
+def bench_compression(args: argparse.Namespace) -> None:
+    # Static actions are compressed once at import, so they cost no CPU per request
+    static = {'cities', 'hotel_cities', 'popular'}
+    print(f"{'action':>13} {'encoding':>9} {'raw B':>8} {'compressed B':>13} {'base64 B':>9} {'saved':>6} "
+          f"{'compress us':>12} {'handler us':>11}")
+    for name, event in COMPRESSION_EVENTS.items():
+        raw = index.handler(event, FAKE_CONTEXT)['body'].encode('utf-8')
+        identity_us = per_call_us(lambda e: index.handler(e, FAKE_CONTEXT), [event], args.seconds)
+        print(f"{name:>13} {'identity':>9} {len(raw):>8} {'':>13} {'':>9} {'':>6} {'':>12} {identity_us:>11.1f}")
+        for encoding in index.ENCODINGS:
+            encoded_event = dict(event, headers={'Accept-Encoding': encoding})
+            response = index.handler(encoded_event, FAKE_CONTEXT)
+            if not response['isBase64Encoded']:
+                print(f"{'':>13} {encoding:>9} {'below COMPRESS_MIN_BYTES, sent as is':>50}")
+                continue
+            compressed = len(index.base64.b64decode(response['body']))
+            level = index.DYNAMIC_LEVELS[encoding]
+            compress_us = 0.0 if name in static else per_call_us(
+                lambda data: index.compress_body(data, encoding, level), [raw], args.seconds)
+            handler_us = per_call_us(lambda e: index.handler(e, FAKE_CONTEXT), [encoded_event], args.seconds)
+            print(f"{'':>13} {encoding:>9} {'':>8} {compressed:>13} {len(response['body']):>9} "
+                  f"{1 - compressed / len(raw):>6.0%} {compress_us:>12.1f} {handler_us:>11.1f}")
+
+def bench_alerts(args: argparse.Namespace) -> None:
+    rng = random.Random(3)
+    codes = [city['code'] for city in index.CITIES]
+    routes = set()
+    while len(routes) < args.alert_routes:
+        origin, destination = rng.sample(codes, 2)
+        routes.add((origin, destination))
+    routes = sorted(routes)
+    dates = [time.strftime('%Y-%m-%d', time.gmtime(time.time() + day * 86400)) for day in range(1, 91)]
+    # Thresholds around the region price, so a share of the alerts triggers
+    picked = [rng.choice(routes) for _ in range(args.subscriptions)]
+    rows = [(str(i % 20000), origin, destination, rng.choice(dates), int(base_price * rng.uniform(0.5, 1.1)))
+            for i, ((origin, destination), base_price) in enumerate(zip(picked, index.calculate_base_prices(picked)))]
+
+    directory = tempfile.mkdtemp(prefix='aviasales_alerts_')
+    store = alerts.AlertStore(os.path.join(directory, 'alerts.sqlite3'))
+    queue = os.path.join(directory, 'queue.ndjson')
+    try:
+        start = time.perf_counter()
+        store.add_many(rows)
+        print(f"{'insert ' + str(len(rows)) + ' subscriptions':>36} {(time.perf_counter() - start) * 1000:>9.0f} ms")
+
+        index.ITINERARY_CACHE._data.clear()
+        start = time.perf_counter()
+        naive = 0
+        for origin, destination, departure_date, max_price, *_ in store.active('0000-00-00'):
+            # Pricing each alert on its own
+            naive += index.calendar_min_prices(origin, destination, [departure_date])[0] < max_price
+        print(f"{'per-alert pricing and compare':>36} {(time.perf_counter() - start) * 1000:>9.0f} ms  triggered {naive}")
+
+        index.ITINERARY_CACHE._data.clear()
+        for label in ('first pass', 'second pass (nothing new)'):
+            stats = alerts.evaluate(store, index.calendar_min_prices, queue)
+            print(f"{'evaluate, ' + label:>36} {stats['elapsed_ms']:>9.0f} ms  triggered {stats['triggered']}, "
+                  f"{stats['routes']} routes, {stats['groups']} route-dates")
+        print(f"{'queue file':>36} {os.path.getsize(queue) / 1024:>9.0f} KiB")
+    finally:
+        store.close()
+        for name in os.listdir(directory):
+            os.remove(os.path.join(directory, name))
+        os.rmdir(directory)
+
+BENCHMARKS: Dict[str, Callable[[argparse.Namespace], None]] = {
+    'alerts': bench_alerts,
+    'cache': bench_cache,
+    'calendar': bench_calendar,
+    'hotels': bench_hotels,
+    'metrics': bench_metrics,
+    'cities': bench_cities,
+    'compression': bench_compression,
+    'dispatch': bench_dispatch,
+    'providers': bench_providers,
+    'routes': bench_routes,
+}
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('benchmark', choices=sorted(BENCHMARKS))
+    parser.add_argument('--sizes', type=int, nargs='+', default=[len(index.CITIES), 20000])
+    parser.add_argument('--counts', type=int, nargs='+', default=[20, 1000, 100000])
+    parser.add_argument('--limit', type=int, default=8)
+    parser.add_argument('--airports', type=int, default=5000, help='synthetic route graph size')
+    parser.add_argument('--legs', type=int, default=100000)
+    parser.add_argument('--hubs', type=int, default=100)
+    parser.add_argument('--queries', type=int, default=300)
+    parser.add_argument('-k', type=int, default=10, help='itineraries per route query')
+    parser.add_argument('--subscriptions', type=int, default=100000, help='price alerts for the alerts benchmark')
+    parser.add_argument('--alert-routes', type=int, default=2000, help='distinct routes the alerts are spread over')
+    parser.add_argument('--searches', type=int, default=200, help='upstream searches for the providers benchmark')
+    parser.add_argument('--baseline', help='index.py path or git revision to compare against')
+    parser.add_argument('--seconds', type=float, default=0.5, help='minimum run time per measurement')
+    args = parser.parse_args()
+    BENCHMARKS[args.benchmark](args)
+
+if __name__ == '__main__':
+    main()
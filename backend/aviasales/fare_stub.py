@@ -0,0 +1,104 @@
+'''
+Local stand-in for an upstream fare provider, for exercising providers.py.
+Answers GET /?from=&to=&date= with deterministic offers after an injected delay,
+and fails a configurable share of requests.
+
+    python fare_stub.py --port 8701 --latency-ms 40 --tail-ms 900 --tail-rate 0.1 --error-rate 0.05
+    FARE_PROVIDERS='[{"name": "stub", "url": "http://127.0.0.1:8701/", "timeout": 0.5, "hedge_after": 0.15}]'
+'''
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Tuple
+from urllib.parse import parse_qsl, urlsplit
+
+import index
+
+class StubHandler(BaseHTTPRequestHandler):
+    # Keep-alive, so the client's connection pool is actually reused
+    protocol_version = 'HTTP/1.1'
+    # Headers and body go out in separate writes; without this Nagle adds ~40 ms
+    disable_nagle_algorithm = True
+
+    def do_GET(self) -> None:
+        server = self.server
+        params = dict(parse_qsl(urlsplit(self.path).query))
+        with server.lock:
+            roll = server.rng.random()
+            slow = server.rng.random() < server.tail_rate
+        time.sleep((server.tail_ms if slow else server.latency_ms) / 1000)
+
+        if roll < server.error_rate:
+            self.reply(503, {'error': 'injected failure'})
+            return
+
+        flights = index.generate_flights(params.get('from', ''), params.get('to', ''), params.get('date', ''))
+        offers = [{
+            'airline': flight['airline'],
+            'flight_number': flight['id'],
+            'departure_time': flight['departure_time'],
+            'arrival_time': flight['arrival_time'],
+            'duration_minutes': flight['duration_minutes'],
+            'price': int(flight['price'] * server.price_factor),
+            'stops': flight['stops'],
+            'via': flight['via'],
+            'segments': flight['segments'],
+            'arrival_day_offset': flight['arrival_day_offset'],
+            'aircraft': flight['aircraft']
+        } for flight in flights]
+        self.reply(200, {'offers': offers})
+
+    def reply(self, status: int, payload: dict) -> None:
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        try:
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            # The client gave up on this request at its deadline
+            self.close_connection = True
+
+    def log_message(self, format: str, *args) -> None:
+        pass
+
+def start_stub(port: int = 0, latency_ms: float = 30, tail_ms: float = 0, tail_rate: float = 0,
+               error_rate: float = 0, price_factor: float = 1.0, seed: int = 1) -> Tuple[ThreadingHTTPServer, str]:
+    '''
+    Serves in a daemon thread and returns the server (call .shutdown() to stop)
+    and its base URL. port=0 picks a free port.
+    '''
+    server = ThreadingHTTPServer(('127.0.0.1', port), StubHandler)
+    server.daemon_threads = True
+    server.lock = threading.Lock()
+    server.rng = random.Random(seed)
+    server.latency_ms = latency_ms
+    server.tail_ms = tail_ms
+    server.tail_rate = tail_rate
+    server.error_rate = error_rate
+    server.price_factor = price_factor
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/"
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--port', type=int, default=8701)
+    parser.add_argument('--latency-ms', type=float, default=30)
+    parser.add_argument('--tail-ms', type=float, default=0, help='delay for the slow share of requests')
+    parser.add_argument('--tail-rate', type=float, default=0)
+    parser.add_argument('--error-rate', type=float, default=0)
+    parser.add_argument('--price-factor', type=float, default=1.0)
+    args = parser.parse_args()
+    server, url = start_stub(args.port, args.latency_ms, args.tail_ms, args.tail_rate, args.error_rate, args.price_factor)
+    print(f"fare stub listening on {url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+if __name__ == '__main__':
+    main()
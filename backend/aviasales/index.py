@@ -1,10 +1,1103 @@
+import base64
+import binascii
+import gzip
 import json
-import requests
-from typing import Dict, Any, List, Optional
+import re
+import sqlite3
+import sys
+import hashlib
+import hmac
+import heapq
+import itertools
+import math
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Any, Iterable, Iterator, List, Optional, Sequence, Tuple
 from datetime import datetime, timedelta
 import random
 import os
 
+from alerts import AlertStore
+from providers import FareClient
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Airport catalog served by action=cities (200+ popular cities with multiple airports)
+CITIES: List[Dict[str, str]] = [
+    # Россия - 25 городов
+    {'code': 'MOW', 'name': 'Москва', 'country': 'Россия'},
+    {'code': 'SVO', 'name': 'Москва (Шереметьево)', 'country': 'Россия'},
+    {'code': 'DME', 'name': 'Москва (Домодедово)', 'country': 'Россия'},
+    {'code': 'VKO', 'name': 'Москва (Внуково)', 'country': 'Россия'},
+    {'code': 'LED', 'name': 'Санкт-Петербург', 'country': 'Россия'},
+    {'code': 'KZN', 'name': 'Казань', 'country': 'Россия'},
+    {'code': 'ROV', 'name': 'Ростов-на-Дону', 'country': 'Россия'},
+    {'code': 'KRR', 'name': 'Краснодар', 'country': 'Россия'},
+    {'code': 'UFA', 'name': 'Уфа', 'country': 'Россия'},
+    {'code': 'VVO', 'name': 'Владивосток', 'country': 'Россия'},
+    {'code': 'NOZ', 'name': 'Новокузнецк', 'country': 'Россия'},
+    {'code': 'OVB', 'name': 'Новосибирск', 'country': 'Россия'},
+    {'code': 'SVX', 'name': 'Екатеринбург', 'country': 'Россия'},
+    {'code': 'TOF', 'name': 'Томск', 'country': 'Россия'},
+    {'code': 'KHV', 'name': 'Хабаровск', 'country': 'Россия'},
+    {'code': 'YKS', 'name': 'Якутск', 'country': 'Россия'},
+    {'code': 'IKT', 'name': 'Иркутск', 'country': 'Россия'},
+    {'code': 'KEJ', 'name': 'Кемерово', 'country': 'Россия'},
+    {'code': 'MMK', 'name': 'Мурманск', 'country': 'Россия'},
+    {'code': 'AER', 'name': 'Сочи', 'country': 'Россия'},
+    {'code': 'VOG', 'name': 'Волгоград', 'country': 'Россия'},
+    {'code': 'VOZ', 'name': 'Воронеж', 'country': 'Россия'},
+    {'code': 'KUF', 'name': 'Самара', 'country': 'Россия'},
+    {'code': 'NBC', 'name': 'Набережные Челны', 'country': 'Россия'},
+    {'code': 'ASF', 'name': 'Астрахань', 'country': 'Россия'},
+    
+    # Европа - 50 городов
+    {'code': 'CDG', 'name': 'Париж (Шарль де Голль)', 'country': 'Франция'},
+    {'code': 'ORY', 'name': 'Париж (Орли)', 'country': 'Франция'},
+    {'code': 'NCE', 'name': 'Ницца', 'country': 'Франция'},
+    {'code': 'LYS', 'name': 'Лион', 'country': 'Франция'},
+    {'code': 'MRS', 'name': 'Марсель', 'country': 'Франция'},
+    {'code': 'LHR', 'name': 'Лондон (Хитроу)', 'country': 'Великобритания'},
+    {'code': 'LGW', 'name': 'Лондон (Гатвик)', 'country': 'Великобритания'},
+    {'code': 'STN', 'name': 'Лондон (Станстед)', 'country': 'Великобритания'},
+    {'code': 'EDI', 'name': 'Эдинбург', 'country': 'Великобритания'},
+    {'code': 'MAN', 'name': 'Манчестер', 'country': 'Великобритания'},
+    {'code': 'MAD', 'name': 'Мадрид', 'country': 'Испания'},
+    {'code': 'BCN', 'name': 'Барселона', 'country': 'Испания'},
+    {'code': 'VLC', 'name': 'Валенсия', 'country': 'Испания'},
+    {'code': 'BIO', 'name': 'Бильбао', 'country': 'Испания'},
+    {'code': 'AGP', 'name': 'Малага', 'country': 'Испания'},
+    {'code': 'PMI', 'name': 'Пальма-де-Майорка', 'country': 'Испания'},
+    {'code': 'LPA', 'name': 'Лас-Пальмас', 'country': 'Испания'},
+    {'code': 'FCO', 'name': 'Рим (Фьюмичино)', 'country': 'Италия'},
+    {'code': 'CIA', 'name': 'Рим (Чампино)', 'country': 'Италия'},
+    {'code': 'MXP', 'name': 'Милан (Мальпенса)', 'country': 'Италия'},
+    {'code': 'LIN', 'name': 'Милан (Линате)', 'country': 'Италия'},
+    {'code': 'VCE', 'name': 'Венеция', 'country': 'Италия'},
+    {'code': 'NAP', 'name': 'Неаполь', 'country': 'Италия'},
+    {'code': 'CTA', 'name': 'Катания', 'country': 'Италия'},
+    {'code': 'FRA', 'name': 'Франкфурт-на-Майне', 'country': 'Германия'},
+    {'code': 'MUC', 'name': 'Мюнхен', 'country': 'Германия'},
+    {'code': 'TXL', 'name': 'Берлин (Тегель)', 'country': 'Германия'},
+    {'code': 'BER', 'name': 'Берлин (Бранденбург)', 'country': 'Германия'},
+    {'code': 'DUS', 'name': 'Дюссельдорф', 'country': 'Германия'},
+    {'code': 'HAM', 'name': 'Гамбург', 'country': 'Германия'},
+    {'code': 'CGN', 'name': 'Кёльн', 'country': 'Германия'},
+    {'code': 'AMS', 'name': 'Амстердам', 'country': 'Нидерланды'},
+    {'code': 'EIN', 'name': 'Эйндховен', 'country': 'Нидерланды'},
+    {'code': 'BRU', 'name': 'Брюссель', 'country': 'Бельгия'},
+    {'code': 'PRG', 'name': 'Прага', 'country': 'Чехия'},
+    {'code': 'VIE', 'name': 'Вена', 'country': 'Австрия'},
+    {'code': 'ZUR', 'name': 'Цюрих', 'country': 'Швейцария'},
+    {'code': 'GVA', 'name': 'Женева', 'country': 'Швейцария'},
+    {'code': 'BSL', 'name': 'Базель', 'country': 'Швейцария'},
+    {'code': 'HEL', 'name': 'Хельсинки', 'country': 'Финляндия'},
+    {'code': 'CPH', 'name': 'Копенгаген', 'country': 'Дания'},
+    {'code': 'ARN', 'name': 'Стокгольм (Арланда)', 'country': 'Швеция'},
+    {'code': 'GOT', 'name': 'Гётеборг', 'country': 'Швеция'},
+    {'code': 'OSL', 'name': 'Осло', 'country': 'Норвегия'},
+    {'code': 'BGO', 'name': 'Берген', 'country': 'Норвегия'},
+    {'code': 'WAW', 'name': 'Варшава', 'country': 'Польша'},
+    {'code': 'KRK', 'name': 'Краков', 'country': 'Польша'},
+    {'code': 'ATH', 'name': 'Афины', 'country': 'Греция'},
+    {'code': 'LIS', 'name': 'Лиссабон', 'country': 'Португалия'},
+    {'code': 'OPO', 'name': 'Порту', 'country': 'Португалия'},
+    {'code': 'BUD', 'name': 'Будапешт', 'country': 'Венгрия'},
+    
+    # Азия - 40 городов
+    {'code': 'IST', 'name': 'Стамбул (Новый аэропорт)', 'country': 'Турция'},
+    {'code': 'SAW', 'name': 'Стамбул (Сабиха Гёкчен)', 'country': 'Турция'},
+    {'code': 'AYT', 'name': 'Анталья', 'country': 'Турция'},
+    {'code': 'ESB', 'name': 'Анкара', 'country': 'Турция'},
+    {'code': 'ADB', 'name': 'Измир', 'country': 'Турция'},
+    {'code': 'BJV', 'name': 'Бодрум', 'country': 'Турция'},
+    {'code': 'DLM', 'name': 'Даламан', 'country': 'Турция'},
+    {'code': 'DXB', 'name': 'Дубай', 'country': 'ОАЭ'},
+    {'code': 'AUH', 'name': 'Абу-Даби', 'country': 'ОАЭ'},
+    {'code': 'SHJ', 'name': 'Шарджа', 'country': 'ОАЭ'},
+    {'code': 'DOH', 'name': 'Доха', 'country': 'Катар'},
+    {'code': 'KWI', 'name': 'Кувейт', 'country': 'Кувейт'},
+    {'code': 'NRT', 'name': 'Токио (Нарита)', 'country': 'Япония'},
+    {'code': 'HND', 'name': 'Токио (Ханеда)', 'country': 'Япония'},
+    {'code': 'KIX', 'name': 'Осака', 'country': 'Япония'},
+    {'code': 'ICN', 'name': 'Сеул (Инчхон)', 'country': 'Южная Корея'},
+    {'code': 'GMP', 'name': 'Сеул (Гимпо)', 'country': 'Южная Корея'},
+    {'code': 'BKK', 'name': 'Бангкок (Суварнабхуми)', 'country': 'Таиланд'},
+    {'code': 'DMK', 'name': 'Бангкок (Дон Муанг)', 'country': 'Таиланд'},
+    {'code': 'HKT', 'name': 'Пхукет', 'country': 'Таиланд'},
+    {'code': 'CNX', 'name': 'Чиангмай', 'country': 'Таиланд'},
+    {'code': 'KUL', 'name': 'Куала-Лумпур', 'country': 'Малайзия'},
+    {'code': 'SIN', 'name': 'Сингапур', 'country': 'Сингапур'},
+    {'code': 'HKG', 'name': 'Гонконг', 'country': 'Гонконг'},
+    {'code': 'PVG', 'name': 'Шанхай (Пудун)', 'country': 'Китай'},
+    {'code': 'SHA', 'name': 'Шанхай (Хунцяо)', 'country': 'Китай'},
+    {'code': 'PEK', 'name': 'Пекин', 'country': 'Китай'},
+    {'code': 'CAN', 'name': 'Гуанчжоу', 'country': 'Китай'},
+    {'code': 'SZX', 'name': 'Шэньчжэнь', 'country': 'Китай'},
+    {'code': 'DEL', 'name': 'Дели', 'country': 'Индия'},
+    {'code': 'BOM', 'name': 'Мумбаи', 'country': 'Индия'},
+    {'code': 'BLR', 'name': 'Бангалор', 'country': 'Индия'},
+    {'code': 'MAA', 'name': 'Ченнаи', 'country': 'Индия'},
+    {'code': 'GOI', 'name': 'Гоа', 'country': 'Индия'},
+    {'code': 'TAS', 'name': 'Ташкент', 'country': 'Узбекистан'},
+    {'code': 'ALA', 'name': 'Алматы', 'country': 'Казахстан'},
+    {'code': 'NUR', 'name': 'Нур-Султан', 'country': 'Казахстан'},
+    {'code': 'EVN', 'name': 'Ереван', 'country': 'Армения'},
+    {'code': 'TBS', 'name': 'Тбилиси', 'country': 'Грузия'},
+    {'code': 'BAK', 'name': 'Баку', 'country': 'Азербайджан'},
+    
+    # Америка - 30 городов
+    {'code': 'JFK', 'name': 'Нью-Йорк (Кеннеди)', 'country': 'США'},
+    {'code': 'LGA', 'name': 'Нью-Йорк (Ла-Гуардия)', 'country': 'США'},
+    {'code': 'EWR', 'name': 'Нью-Йорк (Ньюарк)', 'country': 'США'},
+    {'code': 'LAX', 'name': 'Лос-Анджелес', 'country': 'США'},
+    {'code': 'MIA', 'name': 'Майами', 'country': 'США'},
+    {'code': 'ORD', 'name': 'Чикаго (О\'Хара)', 'country': 'США'},
+    {'code': 'MDW', 'name': 'Чикаго (Мидуэй)', 'country': 'США'},
+    {'code': 'SFO', 'name': 'Сан-Франциско', 'country': 'США'},
+    {'code': 'LAS', 'name': 'Лас-Вегас', 'country': 'США'},
+    {'code': 'PHX', 'name': 'Финикс', 'country': 'США'},
+    {'code': 'DEN', 'name': 'Денвер', 'country': 'США'},
+    {'code': 'SEA', 'name': 'Сиэтл', 'country': 'США'},
+    {'code': 'DFW', 'name': 'Даллас', 'country': 'США'},
+    {'code': 'IAH', 'name': 'Хьюстон', 'country': 'США'},
+    {'code': 'ATL', 'name': 'Атланта', 'country': 'США'},
+    {'code': 'BOS', 'name': 'Бостон', 'country': 'США'},
+    {'code': 'YYZ', 'name': 'Торонто', 'country': 'Канада'},
+    {'code': 'YVR', 'name': 'Ванкувер', 'country': 'Канада'},
+    {'code': 'YUL', 'name': 'Монреаль', 'country': 'Канада'},
+    {'code': 'YYC', 'name': 'Калгари', 'country': 'Канада'},
+    {'code': 'MEX', 'name': 'Мехико', 'country': 'Мексика'},
+    {'code': 'CUN', 'name': 'Канкун', 'country': 'Мексика'},
+    {'code': 'PVR', 'name': 'Пуэрто-Вальярта', 'country': 'Мексика'},
+    {'code': 'GRU', 'name': 'Сан-Паулу', 'country': 'Бразилия'},
+    {'code': 'GIG', 'name': 'Рио-де-Жанейро', 'country': 'Бразилия'},
+    {'code': 'BSB', 'name': 'Бразилиа', 'country': 'Бразилия'},
+    {'code': 'EZE', 'name': 'Буэнос-Айрес', 'country': 'Аргентина'},
+    {'code': 'SCL', 'name': 'Сантьяго', 'country': 'Чили'},
+    {'code': 'LIM', 'name': 'Лима', 'country': 'Перу'},
+    {'code': 'BOG', 'name': 'Богота', 'country': 'Колумбия'},
+    
+    # Африка и Океания - 25 городов
+    {'code': 'CAI', 'name': 'Каир', 'country': 'Египет'},
+    {'code': 'HRG', 'name': 'Хургада', 'country': 'Египет'},
+    {'code': 'SSH', 'name': 'Шарм-эш-Шейх', 'country': 'Египет'},
+    {'code': 'LXR', 'name': 'Луксор', 'country': 'Египет'},
+    {'code': 'CMN', 'name': 'Касабланка', 'country': 'Марокко'},
+    {'code': 'RAK', 'name': 'Марракеш', 'country': 'Марокко'},
+    {'code': 'TUN', 'name': 'Тунис', 'country': 'Тунис'},
+    {'code': 'ALG', 'name': 'Алжир', 'country': 'Алжир'},
+    {'code': 'CPT', 'name': 'Кейптаун', 'country': 'ЮАР'},
+    {'code': 'JNB', 'name': 'Йоханнесбург', 'country': 'ЮАР'},
+    {'code': 'DUR', 'name': 'Дурбан', 'country': 'ЮАР'},
+    {'code': 'ADD', 'name': 'Аддис-Абеба', 'country': 'Эфиопия'},
+    {'code': 'NBO', 'name': 'Найроби', 'country': 'Кения'},
+    {'code': 'SYD', 'name': 'Сидней', 'country': 'Австралия'},
+    {'code': 'MEL', 'name': 'Мельбурн', 'country': 'Австралия'},
+    {'code': 'BNE', 'name': 'Брисбен', 'country': 'Австралия'},
+    {'code': 'PER', 'name': 'Перт', 'country': 'Австралия'},
+    {'code': 'ADL', 'name': 'Аделаида', 'country': 'Австралия'},
+    {'code': 'AKL', 'name': 'Окленд', 'country': 'Новая Зеландия'},
+    {'code': 'CHC', 'name': 'Крайстчерч', 'country': 'Новая Зеландия'},
+    
+    # Курортные направления - 20 городов
+    {'code': 'MLE', 'name': 'Мале (Мальдивы)', 'country': 'Мальдивы'},
+    {'code': 'DPS', 'name': 'Денпасар (Бали)', 'country': 'Индонезия'},
+    {'code': 'CGK', 'name': 'Джакарта', 'country': 'Индонезия'},
+    {'code': 'MNL', 'name': 'Манила', 'country': 'Филиппины'},
+    {'code': 'CEB', 'name': 'Себу', 'country': 'Филиппины'},
+    {'code': 'SGN', 'name': 'Хошимин', 'country': 'Вьетнам'},
+    {'code': 'HAN', 'name': 'Ханой', 'country': 'Вьетнам'},
+    {'code': 'DAD', 'name': 'Дананг', 'country': 'Вьетнам'},
+    {'code': 'PNH', 'name': 'Пномпень', 'country': 'Камбоджа'},
+    {'code': 'RGN', 'name': 'Янгон', 'country': 'Мьянма'},
+    {'code': 'CMB', 'name': 'Коломбо', 'country': 'Шри-Ланка'},
+    {'code': 'KTM', 'name': 'Катманду', 'country': 'Непал'},
+    {'code': 'ISB', 'name': 'Исламабад', 'country': 'Пакистан'},
+    {'code': 'KHI', 'name': 'Карачи', 'country': 'Пакистан'},
+    {'code': 'DAC', 'name': 'Дакка', 'country': 'Бангладеш'},
+    {'code': 'IKA', 'name': 'Тегеран', 'country': 'Иран'},
+    {'code': 'THR', 'name': 'Тегеран (Мехрабад)', 'country': 'Иран'},
+    {'code': 'BAH', 'name': 'Манама', 'country': 'Бахрейн'},
+    {'code': 'MCT', 'name': 'Маскат', 'country': 'Оман'},
+    {'code': 'RUH', 'name': 'Эр-Рияд', 'country': 'Саудовская Аравия'}
+]
+
+_WORD_RE = re.compile(r'\w+')
+
+def normalize_text(text: str) -> str:
+    return text.lower().replace('ё', 'е')
+
+class CityIndex:
+    '''
+    Immutable autocomplete index over the airport catalog, built once at cold start.
+    Prefix matches come from a sorted key array (a flattened trie over the name and
+    each of its words), substring matches from 1-3 character gram postings over
+    name, country and IATA code. Results are ranked: exact code, name prefix,
+    word prefix, name substring, country prefix, anything else.
+    '''
+    
+    def __init__(self, cities: List[Dict[str, str]]):
+        self.cities = tuple(cities)
+        self._fields: List[Tuple[str, str, str]] = []
+        self._codes: Dict[str, List[int]] = {}
+        prefix_entries: List[Tuple[str, int, int]] = []
+        grams: Dict[str, List[int]] = {}
+        
+        for idx, city in enumerate(self.cities):
+            name = normalize_text(city['name'])
+            country = normalize_text(city['country'])
+            code = city['code'].lower()
+            self._fields.append((name, country, code))
+            self._codes.setdefault(code, []).append(idx)
+            
+            prefix_entries.append((name, idx, 1))
+            for word in _WORD_RE.finditer(name):
+                if word.start() > 0:
+                    prefix_entries.append((name[word.start():], idx, 2))
+            
+            seen = set()
+            for text in (name, country, code):
+                for size in (1, 2, 3):
+                    for start in range(len(text) - size + 1):
+                        seen.add(text[start:start + size])
+            for gram in seen:
+                grams.setdefault(gram, []).append(idx)
+        
+        prefix_entries.sort()
+        self._prefix_keys = [entry[0] for entry in prefix_entries]
+        self._prefix_ids = [entry[1] for entry in prefix_entries]
+        self._prefix_ranks = [entry[2] for entry in prefix_entries]
+        self._grams: Dict[str, Tuple[int, ...]] = {gram: tuple(ids) for gram, ids in grams.items()}
+    
+    def _substring_candidates(self, query: str) -> List[int]:
+        if len(query) <= 3:
+            return list(self._grams.get(query, ()))
+        
+        postings = [self._grams.get(query[i:i + 3], ()) for i in range(len(query) - 2)]
+        if not all(postings):
+            return []
+        postings.sort(key=len)
+        candidates = set(postings[0])
+        for posting in postings[1:]:
+            candidates.intersection_update(posting)
+            if not candidates:
+                break
+        return sorted(candidates)
+    
+    def search(self, query: str, limit: Optional[int] = None) -> List[Dict[str, str]]:
+        query = normalize_text(query.strip())
+        if not query:
+            return list(self.cities[:limit])
+        
+        ranks: Dict[int, int] = {idx: 0 for idx in self._codes.get(query, ())}
+        
+        lo = bisect_left(self._prefix_keys, query)
+        hi = bisect_left(self._prefix_keys, query + '\uffff', lo)
+        for pos in range(lo, hi):
+            idx = self._prefix_ids[pos]
+            rank = self._prefix_ranks[pos]
+            if rank < ranks.get(idx, 9):
+                ranks[idx] = rank
+        
+        # Substring hits always rank below prefix hits, so skip them once the page is full
+        if limit is None or len(ranks) < limit:
+            for idx in self._substring_candidates(query):
+                if idx in ranks:
+                    continue
+                name, country, code = self._fields[idx]
+                if query in name:
+                    ranks[idx] = 3
+                elif country.startswith(query):
+                    ranks[idx] = 4
+                elif query in country or query in code:
+                    ranks[idx] = 5
+        
+        ordered = sorted(ranks, key=lambda idx: (ranks[idx], idx))
+        return [self.cities[idx] for idx in ordered[:limit]]
+
+CITY_INDEX = CityIndex(CITIES)
+
+class DiskCache:
+    '''
+    Optional second cache tier: an SQLite file in WAL mode that outlives the
+    function instance and is shared by every worker process on the host.
+    Values are serialized bodies (str); keys are JSON-encoded tuples grouped
+    by namespace. Any SQLite error is treated as a miss.
+    '''
+    
+    PURGE_EVERY = 256
+    
+    def __init__(self, path: str):
+        self.path = path
+        self.errors = 0
+        self._writes = 0
+        self._local = threading.local()
+        self._connection().executescript(
+            'CREATE TABLE IF NOT EXISTS cache ('
+            ' namespace TEXT NOT NULL, key TEXT NOT NULL, expires REAL NOT NULL, written REAL NOT NULL,'
+            ' body TEXT NOT NULL, PRIMARY KEY (namespace, key)) WITHOUT ROWID;'
+            'CREATE INDEX IF NOT EXISTS cache_written ON cache (namespace, written);'
+        )
+    
+    @classmethod
+    def from_env(cls) -> Optional['DiskCache']:
+        path = os.environ.get('CACHE_DB_PATH')
+        if not path:
+            return None
+        try:
+            return cls(path)
+        except sqlite3.Error as error:
+            # An unusable path must not take the function down; the memory tier keeps serving
+            print(f"CACHE_DB_PATH {path!r} unusable, disk cache disabled: {error}", file=sys.stderr)
+            return None
+    
+    def _connection(self) -> sqlite3.Connection:
+        # sqlite3 connections must not be shared between threads
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=1.0, isolation_level=None, check_same_thread=False)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self._local.connection = connection
+        return connection
+    
+    def close(self) -> None:
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
+    
+    def get(self, namespace: str, key: Any) -> Optional[Tuple[str, float]]:
+        '''Returns (body, seconds left) for a live entry.'''
+        try:
+            row = self._connection().execute(
+                'SELECT body, expires FROM cache WHERE namespace = ? AND key = ? AND expires > ?',
+                (namespace, json.dumps(key), time.time())
+            ).fetchone()
+        except sqlite3.Error:
+            self.errors += 1
+            return None
+        return None if row is None else (row[0], row[1] - time.time())
+    
+    def put(self, namespace: str, key: Any, body: str, ttl: float) -> None:
+        now = time.time()
+        try:
+            connection = self._connection()
+            connection.execute(
+                'INSERT OR REPLACE INTO cache (namespace, key, expires, written, body) VALUES (?, ?, ?, ?, ?)',
+                (namespace, json.dumps(key), now + ttl, now, body)
+            )
+            self._writes += 1
+            if self._writes % self.PURGE_EVERY == 0:
+                connection.execute('DELETE FROM cache WHERE expires <= ?', (now,))
+        except sqlite3.Error:
+            self.errors += 1
+    
+    def recent(self, namespace: str, limit: int) -> List[Tuple[Any, str, float]]:
+        '''Most recently written live entries as (key, body, seconds left).'''
+        now = time.time()
+        try:
+            rows = self._connection().execute(
+                'SELECT key, body, expires FROM cache WHERE namespace = ? AND expires > ? ORDER BY written DESC LIMIT ?',
+                (namespace, now, limit)
+            ).fetchall()
+        except sqlite3.Error:
+            self.errors += 1
+            return []
+        return [(tuple(json.loads(key)), body, expires - now) for key, body, expires in rows]
+
+DISK_CACHE: Optional[DiskCache] = DiskCache.from_env()
+
+class TTLCache:
+    '''
+    Bounded in-process LRU cache whose entries also expire after ttl seconds.
+    Lives as long as the function instance, so it only helps warm instances.
+    '''
+    
+    def __init__(self, maxsize: int, ttl: float, disk: Optional[DiskCache] = None, namespace: str = ''):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.disk = disk
+        self.namespace = namespace
+        self.disk_hits = 0
+        self.disk_misses = 0
+        self._data: 'OrderedDict[Any, Tuple[float, Any]]' = OrderedDict()
+        self._lock = threading.Lock()
+        if disk is not None:
+            # Warm start: the newest entries other instances left on disk
+            for key, value, remaining in reversed(disk.recent(namespace, maxsize)):
+                self._store(key, value, remaining)
+    
+    def get(self, key: Any) -> Any:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                if entry[0] > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+                del self._data[key]
+            self.misses += 1
+        if self.disk is None:
+            return None
+        
+        with timed('disk_read'):
+            found = self.disk.get(self.namespace, key)
+        with self._lock:
+            if found is None:
+                self.disk_misses += 1
+                return None
+            self.disk_hits += 1
+        note('disk_hit')
+        value, remaining = found
+        self._store(key, value, remaining)
+        return value
+    
+    def put(self, key: Any, value: Any) -> None:
+        self._store(key, value, self.ttl)
+        if self.disk is not None:
+            with timed('disk_write'):
+                self.disk.put(self.namespace, key, value, self.ttl)
+    
+    def _store(self, key: Any, value: Any, ttl: float) -> None:
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+    
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'size': len(self._data),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+            'disk_hits': self.disk_hits,
+            'disk_misses': self.disk_misses
+        }
+
+# Serialized action=search bodies keyed by (from, to, date)
+SEARCH_CACHE = TTLCache(
+    maxsize=int(os.environ.get('SEARCH_CACHE_SIZE', '512')),
+    ttl=float(os.environ.get('SEARCH_CACHE_TTL', '300')),
+    disk=DISK_CACHE,
+    namespace='search'
+)
+
+# Serialized action=calendar bodies keyed by (from, to, first date, days)
+CALENDAR_CACHE = TTLCache(
+    maxsize=int(os.environ.get('CALENDAR_CACHE_SIZE', '256')),
+    ttl=float(os.environ.get('SEARCH_CACHE_TTL', '300')),
+    disk=DISK_CACHE,
+    namespace='calendar'
+)
+
+# Serialized default action=hotels bodies keyed by (city, checkin, checkout, guests, limit)
+HOTEL_CACHE = TTLCache(
+    maxsize=int(os.environ.get('HOTEL_CACHE_SIZE', '256')),
+    ttl=float(os.environ.get('SEARCH_CACHE_TTL', '300')),
+    disk=DISK_CACHE,
+    namespace='hotels'
+)
+
+MAX_CALENDAR_WINDOW = 30
+
+MAX_BATCH_QUERIES = 100
+
+DEFAULT_PACKAGE_BUNDLES = 10
+MAX_PACKAGE_BUNDLES = 50
+
+# Runs the independent halves of action=package side by side
+PACKAGE_POOL = ThreadPoolExecutor(max_workers=int(os.environ.get('PACKAGE_WORKERS', '4')), thread_name_prefix='package')
+
+# Generated result sets with their OfferIndex, so further pages skip generation
+RESULT_SETS = TTLCache(
+    maxsize=int(os.environ.get('RESULT_SET_CACHE_SIZE', '128')),
+    ttl=float(os.environ.get('SEARCH_CACHE_TTL', '300'))
+)
+
+class InFlight:
+    __slots__ = ('done', 'value', 'failed')
+    
+    def __init__(self):
+        self.done = threading.Event()
+        self.value: Any = None
+        self.failed = False
+
+class SingleFlight:
+    '''
+    Coalesces concurrent identical computations: the first caller for a key
+    computes, callers arriving meanwhile wait for it and share its result.
+    A follower that waits longer than timeout, or whose leader raised or was
+    cancelled, computes on its own instead of failing with the leader.
+    '''
+    
+    def __init__(self, timeout: float):
+        self.timeout = timeout
+        self.leaders = 0
+        self.coalesced = 0
+        self.timeouts = 0
+        self.leader_failures = 0
+        self._calls: Dict[Any, InFlight] = {}
+        self._lock = threading.Lock()
+    
+    def do(self, key: Any, compute: Callable[[], Any]) -> Any:
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = InFlight()
+                self.leaders += 1
+        
+        if leader:
+            try:
+                call.value = compute()
+            except BaseException:
+                call.failed = True
+                raise
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                call.done.set()
+            return call.value
+        
+        with timed('coalesce_wait'):
+            finished = call.done.wait(self.timeout)
+        with self._lock:
+            if not finished:
+                self.timeouts += 1
+            elif call.failed:
+                self.leader_failures += 1
+            else:
+                self.coalesced += 1
+        if not finished or call.failed:
+            note('coalesce_fallback')
+            return compute()
+        note('coalesced')
+        return call.value
+    
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'in_flight': len(self._calls),
+            'leaders': self.leaders,
+            'coalesced': self.coalesced,
+            'timeouts': self.timeouts,
+            'leader_failures': self.leader_failures
+        }
+
+# Shared by search and hotels; keys are prefixed with the kind of result
+COALESCER = SingleFlight(timeout=float(os.environ.get('COALESCE_TIMEOUT', '3')))
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+class OfferIndex:
+    '''
+    Per-result-set index for server-side filtering, sorting and cursor paging.
+    Columns hold one value per offer; a sort order is computed on first use and
+    kept with the result set, so a page only evaluates filters on the offers it
+    walks past and only materializes the rows it returns.
+    '''
+    
+    def __init__(self, columns: Dict[str, Sequence[Any]], row: Callable[[int], Dict[str, Any]], count: int):
+        self.columns = columns
+        self.row = row
+        self.count = count
+        self._orders: Dict[Tuple[str, bool], List[int]] = {}
+    
+    def order(self, column: str, descending: bool = False) -> List[int]:
+        order = self._orders.get((column, descending))
+        if order is None:
+            values = self.columns[column]
+            order = sorted(range(self.count), key=values.__getitem__, reverse=descending)
+            self._orders[(column, descending)] = order
+        return order
+    
+    def _predicate(self, column: str, op: str, value: Any) -> Callable[[int], bool]:
+        values = self.columns[column]
+        if op == 'max':
+            return lambda i: values[i] <= value
+        if op == 'min':
+            return lambda i: values[i] >= value
+        if op == 'all':
+            return lambda i: values[i] & value == value
+        return lambda i: values[i] == value
+    
+    def page(self, filters: Sequence[Tuple[str, str, Any]], column: str, descending: bool,
+             start: int, size: int) -> Tuple[List[Dict[str, Any]], Optional[int]]:
+        '''
+        Returns up to size rows matching every (column, op, value) filter, walking
+        the sort order from position start, and the position of the next match.
+        '''
+        order = self.order(column, descending)
+        predicates = [self._predicate(*spec) for spec in filters]
+        found: List[int] = []
+        for pos in range(start, len(order)):
+            i = order[pos]
+            if all(predicate(i) for predicate in predicates):
+                if len(found) == size:
+                    return [self.row(i) for i in found], pos
+                found.append(i)
+        return [self.row(i) for i in found], None
+
+def parse_bool(value: str) -> bool:
+    if value.lower() in ('1', 'true', 'yes'):
+        return True
+    if value.lower() in ('0', 'false', 'no'):
+        return False
+    raise ValueError(f"Expected true or false, got {value}")
+
+def parse_amenities(value: str) -> int:
+    mask = 0
+    for amenity in value.split(','):
+        amenity = amenity.strip()
+        if amenity:
+            if amenity not in HOTEL_AMENITIES:
+                raise ValueError(f"Unknown amenity: {amenity}")
+            mask |= 1 << HOTEL_AMENITIES.index(amenity)
+    return mask
+
+# Query parameter -> (column, op, parser) for each result kind
+FILTER_PARAMS: Dict[str, Dict[str, Tuple[str, str, Callable[[str], Any]]]] = {
+    'flights': {
+        'max_stops': ('stops', 'max', int),
+        'max_price': ('price', 'max', int)
+    },
+    'hotels': {
+        'max_price': ('total_price', 'max', int),
+        'min_stars': ('stars', 'min', int),
+        'amenities': ('amenity_mask', 'all', parse_amenities),
+        'breakfast_included': ('breakfast_included', 'eq', parse_bool),
+        'refundable': ('refundable', 'eq', parse_bool)
+    }
+}
+
+# sort parameter -> (column, descending) for each result kind
+SORT_KEYS: Dict[str, Dict[str, Tuple[str, bool]]] = {
+    'flights': {
+        'price': ('price', False),
+        'duration': ('duration_minutes', False),
+        'departure_time': ('departure_minutes', False)
+    },
+    'hotels': {
+        'price': ('total_price', False),
+        'rating': ('rating', True),
+        'stars': ('stars', True),
+        'distance_to_center': ('distance_to_center', False)
+    }
+}
+
+PAGE_PARAMS = {'sort', 'cursor'}.union(*FILTER_PARAMS.values())
+
+def wants_page(params: Dict[str, str]) -> bool:
+    return not PAGE_PARAMS.isdisjoint(params)
+
+def encode_cursor(sort: str, position: int) -> str:
+    return base64.urlsafe_b64encode(f"{sort}:{position}".encode('ascii')).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor: str, sort: str) -> int:
+    try:
+        cursor_sort, _, position = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode('ascii').partition(':')
+        start = int(position)
+    except (ValueError, UnicodeDecodeError, binascii.Error):
+        raise ValueError('invalid cursor') from None
+    if cursor_sort != sort:
+        raise ValueError('cursor was issued for a different sort')
+    if start < 0:
+        raise ValueError('invalid cursor')
+    return start
+
+def paged_response(offer_index: OfferIndex, params: Dict[str, str], kind: str,
+                   search_params: Dict[str, Any], event: Dict[str, Any]) -> Dict[str, Any]:
+    sort = params.get('sort', 'price')
+    try:
+        if sort not in SORT_KEYS[kind]:
+            raise ValueError(f"sort must be one of: {', '.join(SORT_KEYS[kind])}")
+        
+        filters = []
+        for name, (column, op, parse) in FILTER_PARAMS[kind].items():
+            if params.get(name):
+                try:
+                    filters.append((column, op, parse(params[name])))
+                except ValueError as error:
+                    raise ValueError(f"Invalid {name}: {error}") from None
+        for name in PAGE_PARAMS.intersection(params).difference(FILTER_PARAMS[kind], ('sort', 'cursor')):
+            raise ValueError(f"{name} is not supported for {kind}")
+        
+        size = min(positive_int_param(params, 'limit') or DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE)
+        start = decode_cursor(params['cursor'], sort) if params.get('cursor') else 0
+    except ValueError as error:
+        return error_response(400, str(error))
+    
+    with timed('sort'):
+        rows, next_position = offer_index.page(filters, *SORT_KEYS[kind][sort], start, size)
+    page = {
+        'sort': sort,
+        'limit': size,
+        'next_cursor': encode_cursor(sort, next_position) if next_position is not None else None
+    }
+    
+    if params.get('format') == 'ndjson':
+        return ndjson_response(event, iter_ndjson(dict(search_params, page=page), rows))
+    with timed('serialize'):
+        body = json.dumps({kind: rows, 'search_params': search_params, 'page': page})
+    return json_response(body)
+
+# Latency instrumentation; METRICS_ENABLED=0 leaves a single None check per phase
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '1') != '0'
+
+# Upper bounds in milliseconds; the last bucket is +Inf
+LATENCY_BUCKETS_MS: Tuple[float, ...] = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, float('inf'))
+
+class Histogram:
+    __slots__ = ('counts', 'total', 'sum_ms', 'exemplars')
+    
+    def __init__(self):
+        self.counts = [0] * len(LATENCY_BUCKETS_MS)
+        self.total = 0
+        self.sum_ms = 0.0
+        # Last request id seen per bucket, so slow requests can be traced back
+        self.exemplars: List[Optional[Tuple[str, float]]] = [None] * len(LATENCY_BUCKETS_MS)
+    
+    def observe(self, ms: float, request_id: str) -> None:
+        bucket = bisect_left(LATENCY_BUCKETS_MS, ms)
+        self.counts[bucket] += 1
+        self.total += 1
+        self.sum_ms += ms
+        self.exemplars[bucket] = (request_id, ms)
+    
+    def percentile(self, q: float) -> float:
+        # Linear interpolation inside the bucket holding the q-th observation
+        if not self.total:
+            return 0.0
+        rank = q * self.total
+        seen = 0
+        for bucket, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                lower = LATENCY_BUCKETS_MS[bucket - 1] if bucket else 0.0
+                upper = LATENCY_BUCKETS_MS[bucket]
+                if upper == float('inf'):
+                    return lower
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+        return LATENCY_BUCKETS_MS[-2]
+
+class RequestTimer:
+    __slots__ = ('request_id', 'action', 'started', 'phases', 'events')
+    
+    def __init__(self, request_id: str):
+        self.request_id = request_id
+        self.action = 'unknown'
+        self.started = time.perf_counter()
+        self.phases: List[Tuple[str, float]] = []
+        self.events: List[str] = []
+
+class PhaseTimer:
+    __slots__ = ('timer', 'name', 'started')
+    
+    def __init__(self, timer: RequestTimer, name: str):
+        self.timer = timer
+        self.name = name
+    
+    def __enter__(self) -> 'PhaseTimer':
+        self.started = time.perf_counter()
+        return self
+    
+    def __exit__(self, *exc_info: Any) -> None:
+        self.timer.phases.append((self.name, (time.perf_counter() - self.started) * 1000))
+
+class NullPhase:
+    __slots__ = ()
+    
+    def __enter__(self) -> 'NullPhase':
+        return self
+    
+    def __exit__(self, *exc_info: Any) -> None:
+        pass
+
+NULL_PHASE = NullPhase()
+
+_request_state = threading.local()
+
+def timed(phase: str) -> Any:
+    '''
+    Context manager timing one phase (generate, sort, serialize, ...) of the
+    current request; phases may nest.
+    '''
+    timer = getattr(_request_state, 'timer', None)
+    if timer is None:
+        return NULL_PHASE
+    return PhaseTimer(timer, phase)
+
+def note(event_name: str) -> None:
+    # Counts an event such as cache_hit against the current request's action
+    timer = getattr(_request_state, 'timer', None)
+    if timer is not None:
+        timer.events.append(event_name)
+
+class Metrics:
+    '''
+    In-process per-action latency histograms (total and per phase) and event
+    counters. Lives as long as the function instance.
+    '''
+    
+    def __init__(self):
+        self.started = time.time()
+        self._latency: Dict[Tuple[str, str], Histogram] = {}
+        self._events: Dict[Tuple[str, str], int] = {}
+        self._lock = threading.Lock()
+    
+    def record(self, timer: RequestTimer, total_ms: float) -> None:
+        with self._lock:
+            for phase, ms in [('total', total_ms)] + timer.phases:
+                histogram = self._latency.get((timer.action, phase))
+                if histogram is None:
+                    histogram = self._latency[(timer.action, phase)] = Histogram()
+                histogram.observe(ms, timer.request_id)
+            for event_name in timer.events:
+                key = (timer.action, event_name)
+                self._events[key] = self._events.get(key, 0) + 1
+    
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            actions: Dict[str, Any] = {}
+            for (action, phase), histogram in sorted(self._latency.items()):
+                slowest = next(exemplar for exemplar in reversed(histogram.exemplars) if exemplar is not None)
+                actions.setdefault(action, {'phases': {}, 'events': {}})['phases'][phase] = {
+                    'count': histogram.total,
+                    'sum_ms': round(histogram.sum_ms, 3),
+                    'p50_ms': round(histogram.percentile(0.5), 3),
+                    'p95_ms': round(histogram.percentile(0.95), 3),
+                    'p99_ms': round(histogram.percentile(0.99), 3),
+                    'slowest_bucket_example': {'request_id': slowest[0], 'ms': round(slowest[1], 3)}
+                }
+            for (action, event_name), count in sorted(self._events.items()):
+                actions.setdefault(action, {'phases': {}, 'events': {}})['events'][event_name] = count
+            return {'uptime_s': round(time.time() - self.started, 1), 'actions': actions,
+                    'coalescing': COALESCER.stats()}
+    
+    def prometheus(self) -> str:
+        lines = [
+            '# HELP aviasales_latency_ms Handler latency per action and phase in milliseconds',
+            '# TYPE aviasales_latency_ms histogram'
+        ]
+        with self._lock:
+            latency = sorted(self._latency.items())
+            events = sorted(self._events.items())
+            quantiles = []
+            for (action, phase), histogram in latency:
+                labels = f'action="{action}",phase="{phase}"'
+                cumulative = 0
+                for bound, count in zip(LATENCY_BUCKETS_MS, histogram.counts):
+                    cumulative += count
+                    le = '+Inf' if bound == float('inf') else f'{bound:g}'
+                    lines.append(f'aviasales_latency_ms_bucket{{{labels},le="{le}"}} {cumulative}')
+                lines.append(f'aviasales_latency_ms_sum{{{labels}}} {histogram.sum_ms:.3f}')
+                lines.append(f'aviasales_latency_ms_count{{{labels}}} {histogram.total}')
+                for q in (0.5, 0.95, 0.99):
+                    quantiles.append(f'aviasales_latency_quantile_ms{{{labels},quantile="{q}"}} {histogram.percentile(q):.3f}')
+        
+        lines.append('# HELP aviasales_latency_quantile_ms Latency percentiles estimated from the histogram buckets')
+        lines.append('# TYPE aviasales_latency_quantile_ms gauge')
+        lines.extend(quantiles)
+        lines.append('# HELP aviasales_events_total Per-action events such as cache hits')
+        lines.append('# TYPE aviasales_events_total counter')
+        for (action, event_name), count in events:
+            lines.append(f'aviasales_events_total{{action="{action}",event="{event_name}"}} {count}')
+        cache_stats = {name: cache.stats() for name, cache in CACHES.items()}
+        for metric, field, kind in (('entries', 'size', 'gauge'), ('hits_total', 'hits', 'counter'), ('misses_total', 'misses', 'counter'),
+                                    ('disk_hits_total', 'disk_hits', 'counter'), ('disk_misses_total', 'disk_misses', 'counter')):
+            lines.append(f'# TYPE aviasales_cache_{metric} {kind}')
+            for name, stats in cache_stats.items():
+                lines.append(f'aviasales_cache_{metric}{{cache="{name}"}} {stats[field]}')
+        coalescing = COALESCER.stats()
+        lines.append('# HELP aviasales_coalesce_in_flight Computations other requests can currently join')
+        lines.append('# TYPE aviasales_coalesce_in_flight gauge')
+        lines.append(f"aviasales_coalesce_in_flight {coalescing['in_flight']}")
+        lines.append('# HELP aviasales_coalesce_total Outcomes of coalesced lookups: leader computed, follower shared, follower gave up')
+        lines.append('# TYPE aviasales_coalesce_total counter')
+        for outcome in ('leaders', 'coalesced', 'timeouts', 'leader_failures'):
+            lines.append(f'aviasales_coalesce_total{{outcome="{outcome}"}} {coalescing[outcome]}')
+        return '\n'.join(lines) + '\n'
+
+METRICS = Metrics()
+
+CACHES: Dict[str, TTLCache] = {
+    'search': SEARCH_CACHE,
+    'calendar': CALENDAR_CACHE,
+    'hotels': HOTEL_CACHE,
+    'result_sets': RESULT_SETS
+}
+
+JSON_HEADERS: Dict[str, str] = {
+    'Content-Type': 'application/json',
+    'Access-Control-Allow-Origin': '*'
+}
+
+CACHE_HIT_HEADERS: Dict[str, str] = dict(JSON_HEADERS, **{'X-Cache': 'HIT'})
+CACHE_MISS_HEADERS: Dict[str, str] = dict(JSON_HEADERS, **{'X-Cache': 'MISS'})
+
+CORS_PREFLIGHT_HEADERS: Dict[str, str] = {
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Allow-Methods': 'GET, POST, DELETE, OPTIONS',
+    'Access-Control-Allow-Headers': 'Content-Type, X-User-Id, X-Auth-Token, X-Session-Id',
+    'Access-Control-Max-Age': '86400'
+}
+
+def json_response(body: str, status: int = 200, headers: Dict[str, str] = JSON_HEADERS) -> Dict[str, Any]:
+    # Header dicts are shared between responses and must not be mutated
+    return {
+        'statusCode': status,
+        'headers': headers,
+        'isBase64Encoded': False,
+        'body': body
+    }
+
+def error_response(status: int, message: str) -> Dict[str, Any]:
+    return json_response(json.dumps({'error': message}), status)
+
+METRICS_HEADERS: Dict[str, str] = {
+    'Content-Type': 'text/plain; version=0.0.4',
+    'Access-Control-Allow-Origin': '*'
+}
+
+NDJSON_HEADERS: Dict[str, str] = {
+    'Content-Type': 'application/x-ndjson',
+    'Access-Control-Allow-Origin': '*'
+}
+
+def iter_ndjson(search_params: Dict[str, Any], records: Iterable[Dict[str, Any]]) -> Iterator[str]:
+    # First line echoes the search parameters, every following line is one offer
+    yield json.dumps({'search_params': search_params}) + '\n'
+    for record in records:
+        yield json.dumps(record) + '\n'
+
+def ndjson_response(event: Dict[str, Any], lines: Iterator[str]) -> Dict[str, Any]:
+    '''
+    Adapters that can write chunked responses set event['streaming'] and get the
+    line iterator as the body; the cloud function runtime needs a plain string.
+    '''
+    if event.get('streaming'):
+        return {'statusCode': 200, 'headers': NDJSON_HEADERS, 'isBase64Encoded': False, 'body': lines}
+    with timed('serialize'):
+        body = ''.join(lines)
+    return json_response(body, headers=NDJSON_HEADERS)
+
+# Response compression, negotiated from Accept-Encoding in server preference order
+COMPRESS_MIN_BYTES = int(os.environ.get('COMPRESS_MIN_BYTES', '1024'))
+ENCODINGS: Tuple[str, ...] = ('br', 'gzip') if brotli is not None else ('gzip',)
+
+# Dynamic bodies are compressed per request at a cheap level; static ones once at the highest
+DYNAMIC_LEVELS: Dict[str, int] = {'br': 4, 'gzip': 5}
+STATIC_LEVELS: Dict[str, int] = {'br': 11, 'gzip': 9}
+
+def accepted_encoding(event: Dict[str, Any]) -> Optional[str]:
+    header = get_header(event, 'Accept-Encoding')
+    if not header:
+        return None
+    qualities: Dict[str, float] = {}
+    for part in header.split(','):
+        name, _, params = part.partition(';')
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        qualities[name.strip().lower()] = quality
+    best, best_quality = None, 0.0
+    for encoding in ENCODINGS:
+        quality = qualities.get(encoding, qualities.get('*', 0.0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+def compress_body(data: bytes, encoding: str, level: int) -> bytes:
+    if encoding == 'br':
+        return brotli.compress(data, quality=level)
+    # mtime=0 keeps the output, and so the static ETags, identical across cold starts
+    return gzip.compress(data, compresslevel=level, mtime=0)
+
+def compress_response(event: Dict[str, Any], response: Dict[str, Any]) -> Dict[str, Any]:
+    '''
+    Compresses plain string bodies of at least COMPRESS_MIN_BYTES when the client
+    accepts an encoding; smaller bodies cost more CPU than the bytes they save.
+    Streamed and already encoded bodies pass through.
+    '''
+    body = response.get('body')
+    if response.get('isBase64Encoded') or not isinstance(body, str) or len(body) < COMPRESS_MIN_BYTES:
+        return response
+    headers = dict(response.get('headers') or {}, Vary='Accept-Encoding')
+    encoding = accepted_encoding(event)
+    if encoding is None:
+        return dict(response, headers=headers)
+    with timed('compress'):
+        data = compress_body(body.encode('utf-8'), encoding, DYNAMIC_LEVELS[encoding])
+        encoded = base64.b64encode(data).decode('ascii')
+    headers['Content-Encoding'] = encoding
+    return dict(response, headers=headers, isBase64Encoded=True, body=encoded)
+
+def airport_code(value: Any) -> str:
+    # Every action keys seeds, caches and region lookups on the same spelling of a code
+    return str(value or '').strip().upper()
+
+def route_error(from_city: str, to_city: str) -> Optional[str]:
+    # Unknown codes would be priced at the fallback region fare instead of failing
+    if not from_city or not to_city:
+        return 'from and to are required'
+    for code in (from_city, to_city):
+        if code not in AIRPORTS:
+            return f"Unknown airport code: {code}"
+    if from_city == to_city:
+        return 'from and to must differ'
+    return None
+
+def positive_int_param(params: Dict[str, str], name: str) -> Optional[int]:
+    if not params.get(name):
+        return None
+    try:
+        value = int(params[name])
+    except ValueError:
+        value = 0
+    if value < 1:
+        raise ValueError(f"{name} must be a positive integer")
+    return value
+
+ActionHandler = Callable[[Dict[str, Any], Dict[str, str], Any], Dict[str, Any]]
+
+# (httpMethod, action) -> handler(event, params, context)
+ROUTES: Dict[Tuple[str, str], ActionHandler] = {}
+
+DEFAULT_ACTIONS: Dict[str, str] = {'GET': 'cities'}
+
+def parse_json_body(event: Dict[str, Any]) -> Any:
+    body = event.get('body') or ''
+    if event.get('isBase64Encoded'):
+        body = base64.b64decode(body).decode('utf-8')
+    try:
+        return json.loads(body) if body else {}
+    except (TypeError, json.JSONDecodeError) as error:
+        raise ValueError(str(error)) from error
+
+def route(method: str, action: str) -> Callable[[ActionHandler], ActionHandler]:
+    def register(action_handler: ActionHandler) -> ActionHandler:
+        ROUTES[(method, action)] = action_handler
+        return action_handler
+    return register
+
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
     Business: Travel platform with flights (20% discount) and hotels (25% discount)
@@ -12,529 +1105,1178 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
           context - object with attributes: request_id, function_name, function_version
     Returns: HTTP response dict with competitive prices for flights and hotels
     '''
+    if not METRICS_ENABLED:
+        return compress_response(event, dispatch(event, context))
+    
+    timer = RequestTimer(getattr(context, 'request_id', None) or '-')
+    _request_state.timer = timer
+    try:
+        response = compress_response(event, dispatch(event, context))
+    finally:
+        _request_state.timer = None
+    
+    total_ms = (time.perf_counter() - timer.started) * 1000
+    METRICS.record(timer, total_ms)
+    server_timing = ', '.join([f'{phase};dur={ms:.3f}' for phase, ms in timer.phases] + [f'total;dur={total_ms:.3f}'])
+    response['headers'] = dict(response.get('headers') or {}, **{'Server-Timing': server_timing})
+    return response
+
+def dispatch(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     method: str = event.get('httpMethod', 'GET')
     
     # Handle CORS OPTIONS request
     if method == 'OPTIONS':
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, X-User-Id, X-Auth-Token, X-Session-Id',
-                'Access-Control-Max-Age': '86400'
-            },
-            'body': ''
-        }
+        return {'statusCode': 200, 'headers': CORS_PREFLIGHT_HEADERS, 'body': ''}
+    
+    timer = getattr(_request_state, 'timer', None)
+    with timed('dispatch'):
+        params = event.get('queryStringParameters') or {}
+        action = params.get('action') or DEFAULT_ACTIONS.get(method, '')
+        action_handler = ROUTES.get((method, action))
+    
+    if action_handler is None:
+        if not any(route_method == method for route_method, _ in ROUTES):
+            return error_response(405, 'Method not allowed')
+        return error_response(404, f"Unknown action: {action}")
     
-    if method == 'GET':
-        params = event.get('queryStringParameters', {})
-        action = params.get('action', 'cities')
+    if timer is not None:
+        timer.action = action
+    return action_handler(event, params, context)
+
+@route('GET', 'metrics')
+def metrics_action(event: Dict[str, Any], params: Dict[str, str], context: Any) -> Dict[str, Any]:
+    token = os.environ.get('METRICS_TOKEN')
+    if token and get_header(event, 'X-Auth-Token') != token:
+        return error_response(403, 'Forbidden')
+    if params.get('format') == 'json':
+        return json_response(json.dumps(METRICS.snapshot()))
+    return json_response(METRICS.prometheus(), headers=METRICS_HEADERS)
+
+@route('GET', 'cities')
+def cities_action(event: Dict[str, Any], params: Dict[str, str], context: Any) -> Dict[str, Any]:
+    query = params.get('q', '')
+    try:
+        limit = positive_int_param(params, 'limit')
+    except ValueError as error:
+        return error_response(400, str(error))
+    
+    if not query.strip() and limit is None:
+        return static_response(event, 'cities')
+    
+    with timed('search'):
+        cities_data = CITY_INDEX.search(query, limit)
+    with timed('serialize'):
+        body = json.dumps({'cities': cities_data})
+    return json_response(body)
+
+@route('GET', 'search')
+def search_action(event: Dict[str, Any], params: Dict[str, str], context: Any) -> Dict[str, Any]:
+    from_city = airport_code(params.get('from'))
+    to_city = airport_code(params.get('to'))
+    departure_date = params.get('date', '2024-12-15').strip()
+    prefer = params.get('prefer', 'price')
+    if prefer not in PREFERENCES:
+        return error_response(400, f"prefer must be one of: {', '.join(PREFERENCES)}")
+    search_params: Dict[str, Any] = {'origin': from_city, 'destination': to_city, 'date': departure_date}
+    if prefer != 'price':
+        search_params['prefer'] = prefer
+    
+    if wants_page(params) or params.get('format') == 'ndjson':
+        flights, offer_index, sources = flight_result_set(from_city, to_city, departure_date, prefer)
+        if sources is not None:
+            search_params['providers'] = sources
+        if params.get('format') == 'ndjson' and not wants_page(params):
+            return ndjson_response(event, iter_ndjson(search_params, flights))
+        return paged_response(offer_index, params, 'flights', search_params, event)
+    
+    cache_key = (from_city, to_city, departure_date, prefer)
+    body = SEARCH_CACHE.get(cache_key)
+    if body is not None:
+        note('cache_hit')
+        return json_response(body, headers=CACHE_HIT_HEADERS)
+    
+    note('cache_miss')
+    
+    def build_body() -> str:
+        flights, sources = find_flights(from_city, to_city, departure_date, prefer)
+        if sources is not None:
+            search_params['providers'] = sources
+        with timed('serialize'):
+            body = json.dumps({
+                'flights': flights,
+                'search_params': search_params
+            })
+        if is_complete(sources):
+            SEARCH_CACHE.put(cache_key, body)
+        return body
+    
+    body = COALESCER.do(('search',) + cache_key, build_body)
+    return json_response(body, headers=CACHE_MISS_HEADERS)
+
+@route('GET', 'telegram')
+def telegram_action(event: Dict[str, Any], params: Dict[str, str], context: Any) -> Dict[str, Any]:
+    return static_response(event, 'telegram')
+
+# Subscriptions for price alerts; alerts.py evaluates them in batches for the bot.
+# Opt-in: the store must outlive the instance, and only the bot (holding
+# ALERTS_TOKEN) may act on a chat_id
+ALERT_STORE: Optional[AlertStore] = AlertStore.from_env()
+
+def alerts_denied(event: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    token = os.environ.get('ALERTS_TOKEN')
+    if ALERT_STORE is None or not token:
+        return error_response(503, 'Price alerts are not configured')
+    if not hmac.compare_digest(get_header(event, 'X-Auth-Token') or '', token):
+        return error_response(403, 'Forbidden')
+    return None
+
+@route('POST', 'alerts')
+def create_alert_action(event: Dict[str, Any], params: Dict[str, str], context: Any) -> Dict[str, Any]:
+    denied = alerts_denied(event)
+    if denied is not None:
+        return denied
+    try:
+        payload = parse_json_body(event)
+    except ValueError:
+        return error_response(400, 'Body must be JSON')
+    if not isinstance(payload, dict):
+        payload = {}
+    
+    chat_id = str(payload.get('chat_id') or '').strip()
+    from_city = airport_code(payload.get('from'))
+    to_city = airport_code(payload.get('to'))
+    departure_date = str(payload.get('date') or '').strip()
+    max_price = payload.get('max_price')
+    if not chat_id or not from_city or not to_city:
+        return error_response(400, 'Expected {"chat_id", "from", "to", "date", "max_price"}')
+    for code in (from_city, to_city):
+        if code not in AIRPORTS:
+            return error_response(400, f"Unknown airport code: {code}")
+    if from_city == to_city:
+        return error_response(400, 'from and to must differ')
+    try:
+        departure_day = datetime.strptime(departure_date, '%Y-%m-%d').date()
+    except ValueError:
+        return error_response(400, 'date must be YYYY-MM-DD')
+    # evaluate() purges past dates, so such an alert could never fire
+    if departure_day < datetime.now().date():
+        return error_response(400, 'date must not be in the past')
+    if not isinstance(max_price, int) or isinstance(max_price, bool) or max_price < 1:
+        return error_response(400, 'max_price must be a positive integer')
+    
+    try:
+        alert = ALERT_STORE.add(chat_id, from_city, to_city, departure_date, max_price)
+    except ValueError as error:
+        return error_response(400, str(error))
+    return json_response(json.dumps({'alert': alert}))
+
+@route('GET', 'alerts')
+def list_alerts_action(event: Dict[str, Any], params: Dict[str, str], context: Any) -> Dict[str, Any]:
+    denied = alerts_denied(event)
+    if denied is not None:
+        return denied
+    chat_id = params.get('chat_id', '').strip()
+    if not chat_id:
+        return error_response(400, 'chat_id is required')
+    return json_response(json.dumps({'alerts': ALERT_STORE.for_chat(chat_id)}))
+
+@route('DELETE', 'alerts')
+def delete_alert_action(event: Dict[str, Any], params: Dict[str, str], context: Any) -> Dict[str, Any]:
+    denied = alerts_denied(event)
+    if denied is not None:
+        return denied
+    chat_id = params.get('chat_id', '').strip()
+    try:
+        alert_id = int(params.get('id', ''))
+    except ValueError:
+        return error_response(400, 'id must be an integer')
+    if not chat_id:
+        return error_response(400, 'chat_id is required')
+    if not ALERT_STORE.remove(chat_id, alert_id):
+        return error_response(404, 'Alert not found')
+    return json_response(json.dumps({'deleted': alert_id}))
+
+@route('GET', 'hotels')
+def hotels_action(event: Dict[str, Any], params: Dict[str, str], context: Any) -> Dict[str, Any]:
+    city = params.get('city', 'Москва').strip()
+    checkin = params.get('checkin', '2024-12-15').strip()
+    checkout = params.get('checkout', '2024-12-18').strip()
+    try:
+        guests = positive_int_param(params, 'guests') or 2
+        limit = positive_int_param(params, 'limit')
         
-        if action == 'cities':
-            # Return 200+ popular cities with multiple airports
-            cities_data = [
-                # Россия - 25 городов
-                {'code': 'MOW', 'name': 'Москва', 'country': 'Россия'},
-                {'code': 'SVO', 'name': 'Москва (Шереметьево)', 'country': 'Россия'},
-                {'code': 'DME', 'name': 'Москва (Домодедово)', 'country': 'Россия'},
-                {'code': 'VKO', 'name': 'Москва (Внуково)', 'country': 'Россия'},
-                {'code': 'LED', 'name': 'Санкт-Петербург', 'country': 'Россия'},
-                {'code': 'KZN', 'name': 'Казань', 'country': 'Россия'},
-                {'code': 'ROV', 'name': 'Ростов-на-Дону', 'country': 'Россия'},
-                {'code': 'KRR', 'name': 'Краснодар', 'country': 'Россия'},
-                {'code': 'UFA', 'name': 'Уфа', 'country': 'Россия'},
-                {'code': 'VVO', 'name': 'Владивосток', 'country': 'Россия'},
-                {'code': 'NOZ', 'name': 'Новокузнецк', 'country': 'Россия'},
-                {'code': 'OVB', 'name': 'Новосибирск', 'country': 'Россия'},
-                {'code': 'SVX', 'name': 'Екатеринбург', 'country': 'Россия'},
-                {'code': 'TOF', 'name': 'Томск', 'country': 'Россия'},
-                {'code': 'KHV', 'name': 'Хабаровск', 'country': 'Россия'},
-                {'code': 'YKS', 'name': 'Якутск', 'country': 'Россия'},
-                {'code': 'IKT', 'name': 'Иркутск', 'country': 'Россия'},
-                {'code': 'KEJ', 'name': 'Кемерово', 'country': 'Россия'},
-                {'code': 'MMK', 'name': 'Мурманск', 'country': 'Россия'},
-                {'code': 'AER', 'name': 'Сочи', 'country': 'Россия'},
-                {'code': 'VOG', 'name': 'Волгоград', 'country': 'Россия'},
-                {'code': 'VOZ', 'name': 'Воронеж', 'country': 'Россия'},
-                {'code': 'KUF', 'name': 'Самара', 'country': 'Россия'},
-                {'code': 'NBC', 'name': 'Набережные Челны', 'country': 'Россия'},
-                {'code': 'ASF', 'name': 'Астрахань', 'country': 'Россия'},
-                
-                # Европа - 50 городов
-                {'code': 'CDG', 'name': 'Париж (Шарль де Голль)', 'country': 'Франция'},
-                {'code': 'ORY', 'name': 'Париж (Орли)', 'country': 'Франция'},
-                {'code': 'NCE', 'name': 'Ницца', 'country': 'Франция'},
-                {'code': 'LYS', 'name': 'Лион', 'country': 'Франция'},
-                {'code': 'MRS', 'name': 'Марсель', 'country': 'Франция'},
-                {'code': 'LHR', 'name': 'Лондон (Хитроу)', 'country': 'Великобритания'},
-                {'code': 'LGW', 'name': 'Лондон (Гатвик)', 'country': 'Великобритания'},
-                {'code': 'STN', 'name': 'Лондон (Станстед)', 'country': 'Великобритания'},
-                {'code': 'EDI', 'name': 'Эдинбург', 'country': 'Великобритания'},
-                {'code': 'MAN', 'name': 'Манчестер', 'country': 'Великобритания'},
-                {'code': 'MAD', 'name': 'Мадрид', 'country': 'Испания'},
-                {'code': 'BCN', 'name': 'Барселона', 'country': 'Испания'},
-                {'code': 'VLC', 'name': 'Валенсия', 'country': 'Испания'},
-                {'code': 'BIO', 'name': 'Бильбао', 'country': 'Испания'},
-                {'code': 'AGP', 'name': 'Малага', 'country': 'Испания'},
-                {'code': 'PMI', 'name': 'Пальма-де-Майорка', 'country': 'Испания'},
-                {'code': 'LPA', 'name': 'Лас-Пальмас', 'country': 'Испания'},
-                {'code': 'FCO', 'name': 'Рим (Фьюмичино)', 'country': 'Италия'},
-                {'code': 'CIA', 'name': 'Рим (Чампино)', 'country': 'Италия'},
-                {'code': 'MXP', 'name': 'Милан (Мальпенса)', 'country': 'Италия'},
-                {'code': 'LIN', 'name': 'Милан (Линате)', 'country': 'Италия'},
-                {'code': 'VCE', 'name': 'Венеция', 'country': 'Италия'},
-                {'code': 'NAP', 'name': 'Неаполь', 'country': 'Италия'},
-                {'code': 'CTA', 'name': 'Катания', 'country': 'Италия'},
-                {'code': 'FRA', 'name': 'Франкфурт-на-Майне', 'country': 'Германия'},
-                {'code': 'MUC', 'name': 'Мюнхен', 'country': 'Германия'},
-                {'code': 'TXL', 'name': 'Берлин (Тегель)', 'country': 'Германия'},
-                {'code': 'BER', 'name': 'Берлин (Бранденбург)', 'country': 'Германия'},
-                {'code': 'DUS', 'name': 'Дюссельдорф', 'country': 'Германия'},
-                {'code': 'HAM', 'name': 'Гамбург', 'country': 'Германия'},
-                {'code': 'CGN', 'name': 'Кёльн', 'country': 'Германия'},
-                {'code': 'AMS', 'name': 'Амстердам', 'country': 'Нидерланды'},
-                {'code': 'EIN', 'name': 'Эйндховен', 'country': 'Нидерланды'},
-                {'code': 'BRU', 'name': 'Брюссель', 'country': 'Бельгия'},
-                {'code': 'PRG', 'name': 'Прага', 'country': 'Чехия'},
-                {'code': 'VIE', 'name': 'Вена', 'country': 'Австрия'},
-                {'code': 'ZUR', 'name': 'Цюрих', 'country': 'Швейцария'},
-                {'code': 'GVA', 'name': 'Женева', 'country': 'Швейцария'},
-                {'code': 'BSL', 'name': 'Базель', 'country': 'Швейцария'},
-                {'code': 'HEL', 'name': 'Хельсинки', 'country': 'Финляндия'},
-                {'code': 'CPH', 'name': 'Копенгаген', 'country': 'Дания'},
-                {'code': 'ARN', 'name': 'Стокгольм (Арланда)', 'country': 'Швеция'},
-                {'code': 'GOT', 'name': 'Гётеборг', 'country': 'Швеция'},
-                {'code': 'OSL', 'name': 'Осло', 'country': 'Норвегия'},
-                {'code': 'BGO', 'name': 'Берген', 'country': 'Норвегия'},
-                {'code': 'WAW', 'name': 'Варшава', 'country': 'Польша'},
-                {'code': 'KRK', 'name': 'Краков', 'country': 'Польша'},
-                {'code': 'ATH', 'name': 'Афины', 'country': 'Греция'},
-                {'code': 'LIS', 'name': 'Лиссабон', 'country': 'Португалия'},
-                {'code': 'OPO', 'name': 'Порту', 'country': 'Португалия'},
-                {'code': 'BUD', 'name': 'Будапешт', 'country': 'Венгрия'},
-                
-                # Азия - 40 городов
-                {'code': 'IST', 'name': 'Стамбул (Новый аэропорт)', 'country': 'Турция'},
-                {'code': 'SAW', 'name': 'Стамбул (Сабиха Гёкчен)', 'country': 'Турция'},
-                {'code': 'AYT', 'name': 'Анталья', 'country': 'Турция'},
-                {'code': 'ESB', 'name': 'Анкара', 'country': 'Турция'},
-                {'code': 'ADB', 'name': 'Измир', 'country': 'Турция'},
-                {'code': 'BJV', 'name': 'Бодрум', 'country': 'Турция'},
-                {'code': 'DLM', 'name': 'Даламан', 'country': 'Турция'},
-                {'code': 'DXB', 'name': 'Дубай', 'country': 'ОАЭ'},
-                {'code': 'AUH', 'name': 'Абу-Даби', 'country': 'ОАЭ'},
-                {'code': 'SHJ', 'name': 'Шарджа', 'country': 'ОАЭ'},
-                {'code': 'DOH', 'name': 'Доха', 'country': 'Катар'},
-                {'code': 'KWI', 'name': 'Кувейт', 'country': 'Кувейт'},
-                {'code': 'NRT', 'name': 'Токио (Нарита)', 'country': 'Япония'},
-                {'code': 'HND', 'name': 'Токио (Ханеда)', 'country': 'Япония'},
-                {'code': 'KIX', 'name': 'Осака', 'country': 'Япония'},
-                {'code': 'ICN', 'name': 'Сеул (Инчхон)', 'country': 'Южная Корея'},
-                {'code': 'GMP', 'name': 'Сеул (Гимпо)', 'country': 'Южная Корея'},
-                {'code': 'BKK', 'name': 'Бангкок (Суварнабхуми)', 'country': 'Таиланд'},
-                {'code': 'DMK', 'name': 'Бангкок (Дон Муанг)', 'country': 'Таиланд'},
-                {'code': 'HKT', 'name': 'Пхукет', 'country': 'Таиланд'},
-                {'code': 'CNX', 'name': 'Чиангмай', 'country': 'Таиланд'},
-                {'code': 'KUL', 'name': 'Куала-Лумпур', 'country': 'Малайзия'},
-                {'code': 'SIN', 'name': 'Сингапур', 'country': 'Сингапур'},
-                {'code': 'HKG', 'name': 'Гонконг', 'country': 'Гонконг'},
-                {'code': 'PVG', 'name': 'Шанхай (Пудун)', 'country': 'Китай'},
-                {'code': 'SHA', 'name': 'Шанхай (Хунцяо)', 'country': 'Китай'},
-                {'code': 'PEK', 'name': 'Пекин', 'country': 'Китай'},
-                {'code': 'CAN', 'name': 'Гуанчжоу', 'country': 'Китай'},
-                {'code': 'SZX', 'name': 'Шэньчжэнь', 'country': 'Китай'},
-                {'code': 'DEL', 'name': 'Дели', 'country': 'Индия'},
-                {'code': 'BOM', 'name': 'Мумбаи', 'country': 'Индия'},
-                {'code': 'BLR', 'name': 'Бангалор', 'country': 'Индия'},
-                {'code': 'MAA', 'name': 'Ченнаи', 'country': 'Индия'},
-                {'code': 'GOI', 'name': 'Гоа', 'country': 'Индия'},
-                {'code': 'TAS', 'name': 'Ташкент', 'country': 'Узбекистан'},
-                {'code': 'ALA', 'name': 'Алматы', 'country': 'Казахстан'},
-                {'code': 'NUR', 'name': 'Нур-Султан', 'country': 'Казахстан'},
-                {'code': 'EVN', 'name': 'Ереван', 'country': 'Армения'},
-                {'code': 'TBS', 'name': 'Тбилиси', 'country': 'Грузия'},
-                {'code': 'BAK', 'name': 'Баку', 'country': 'Азербайджан'},
-                
-                # Америка - 30 городов
-                {'code': 'JFK', 'name': 'Нью-Йорк (Кеннеди)', 'country': 'США'},
-                {'code': 'LGA', 'name': 'Нью-Йорк (Ла-Гуардия)', 'country': 'США'},
-                {'code': 'EWR', 'name': 'Нью-Йорк (Ньюарк)', 'country': 'США'},
-                {'code': 'LAX', 'name': 'Лос-Анджелес', 'country': 'США'},
-                {'code': 'MIA', 'name': 'Майами', 'country': 'США'},
-                {'code': 'ORD', 'name': 'Чикаго (О\'Хара)', 'country': 'США'},
-                {'code': 'MDW', 'name': 'Чикаго (Мидуэй)', 'country': 'США'},
-                {'code': 'SFO', 'name': 'Сан-Франциско', 'country': 'США'},
-                {'code': 'LAS', 'name': 'Лас-Вегас', 'country': 'США'},
-                {'code': 'PHX', 'name': 'Финикс', 'country': 'США'},
-                {'code': 'DEN', 'name': 'Денвер', 'country': 'США'},
-                {'code': 'SEA', 'name': 'Сиэтл', 'country': 'США'},
-                {'code': 'DFW', 'name': 'Даллас', 'country': 'США'},
-                {'code': 'IAH', 'name': 'Хьюстон', 'country': 'США'},
-                {'code': 'ATL', 'name': 'Атланта', 'country': 'США'},
-                {'code': 'BOS', 'name': 'Бостон', 'country': 'США'},
-                {'code': 'YYZ', 'name': 'Торонто', 'country': 'Канада'},
-                {'code': 'YVR', 'name': 'Ванкувер', 'country': 'Канада'},
-                {'code': 'YUL', 'name': 'Монреаль', 'country': 'Канада'},
-                {'code': 'YYC', 'name': 'Калгари', 'country': 'Канада'},
-                {'code': 'MEX', 'name': 'Мехико', 'country': 'Мексика'},
-                {'code': 'CUN', 'name': 'Канкун', 'country': 'Мексика'},
-                {'code': 'PVR', 'name': 'Пуэрто-Вальярта', 'country': 'Мексика'},
-                {'code': 'GRU', 'name': 'Сан-Паулу', 'country': 'Бразилия'},
-                {'code': 'GIG', 'name': 'Рио-де-Жанейро', 'country': 'Бразилия'},
-                {'code': 'BSB', 'name': 'Бразилиа', 'country': 'Бразилия'},
-                {'code': 'EZE', 'name': 'Буэнос-Айрес', 'country': 'Аргентина'},
-                {'code': 'SCL', 'name': 'Сантьяго', 'country': 'Чили'},
-                {'code': 'LIM', 'name': 'Лима', 'country': 'Перу'},
-                {'code': 'BOG', 'name': 'Богота', 'country': 'Колумбия'},
-                
-                # Африка и Океания - 25 городов
-                {'code': 'CAI', 'name': 'Каир', 'country': 'Египет'},
-                {'code': 'HRG', 'name': 'Хургада', 'country': 'Египет'},
-                {'code': 'SSH', 'name': 'Шарм-эш-Шейх', 'country': 'Египет'},
-                {'code': 'LXR', 'name': 'Луксор', 'country': 'Египет'},
-                {'code': 'CMN', 'name': 'Касабланка', 'country': 'Марокко'},
-                {'code': 'RAK', 'name': 'Марракеш', 'country': 'Марокко'},
-                {'code': 'TUN', 'name': 'Тунис', 'country': 'Тунис'},
-                {'code': 'ALG', 'name': 'Алжир', 'country': 'Алжир'},
-                {'code': 'CPT', 'name': 'Кейптаун', 'country': 'ЮАР'},
-                {'code': 'JNB', 'name': 'Йоханнесбург', 'country': 'ЮАР'},
-                {'code': 'DUR', 'name': 'Дурбан', 'country': 'ЮАР'},
-                {'code': 'ADD', 'name': 'Аддис-Абеба', 'country': 'Эфиопия'},
-                {'code': 'NBO', 'name': 'Найроби', 'country': 'Кения'},
-                {'code': 'SYD', 'name': 'Сидней', 'country': 'Австралия'},
-                {'code': 'MEL', 'name': 'Мельбурн', 'country': 'Австралия'},
-                {'code': 'BNE', 'name': 'Брисбен', 'country': 'Австралия'},
-                {'code': 'PER', 'name': 'Перт', 'country': 'Австралия'},
-                {'code': 'ADL', 'name': 'Аделаида', 'country': 'Австралия'},
-                {'code': 'AKL', 'name': 'Окленд', 'country': 'Новая Зеландия'},
-                {'code': 'CHC', 'name': 'Крайстчерч', 'country': 'Новая Зеландия'},
-                
-                # Курортные направления - 20 городов
-                {'code': 'MLE', 'name': 'Мале (Мальдивы)', 'country': 'Мальдивы'},
-                {'code': 'DPS', 'name': 'Денпасар (Бали)', 'country': 'Индонезия'},
-                {'code': 'CGK', 'name': 'Джакарта', 'country': 'Индонезия'},
-                {'code': 'MNL', 'name': 'Манила', 'country': 'Филиппины'},
-                {'code': 'CEB', 'name': 'Себу', 'country': 'Филиппины'},
-                {'code': 'SGN', 'name': 'Хошимин', 'country': 'Вьетнам'},
-                {'code': 'HAN', 'name': 'Ханой', 'country': 'Вьетнам'},
-                {'code': 'DAD', 'name': 'Дананг', 'country': 'Вьетнам'},
-                {'code': 'PNH', 'name': 'Пномпень', 'country': 'Камбоджа'},
-                {'code': 'RGN', 'name': 'Янгон', 'country': 'Мьянма'},
-                {'code': 'CMB', 'name': 'Коломбо', 'country': 'Шри-Ланка'},
-                {'code': 'KTM', 'name': 'Катманду', 'country': 'Непал'},
-                {'code': 'ISB', 'name': 'Исламабад', 'country': 'Пакистан'},
-                {'code': 'KHI', 'name': 'Карачи', 'country': 'Пакистан'},
-                {'code': 'DAC', 'name': 'Дакка', 'country': 'Бангладеш'},
-                {'code': 'IKA', 'name': 'Тегеран', 'country': 'Иран'},
-                {'code': 'THR', 'name': 'Тегеран (Мехрабад)', 'country': 'Иран'},
-                {'code': 'BAH', 'name': 'Манама', 'country': 'Бахрейн'},
-                {'code': 'MCT', 'name': 'Маскат', 'country': 'Оман'},
-                {'code': 'RUH', 'name': 'Эр-Рияд', 'country': 'Саудовская Аравия'}
-            ]
-            
-            query = params.get('q', '').lower()
-            if query:
-                cities_data = [
-                    city for city in cities_data 
-                    if query in city['name'].lower() or query in city['country'].lower()
-                ]
-            
-            return {
-                'statusCode': 200,
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*'
-                },
-                'isBase64Encoded': False,
-                'body': json.dumps({'cities': cities_data})
-            }
+        body_key = (city, checkin, checkout, guests, limit)
+        plain = not wants_page(params) and params.get('format') != 'ndjson'
+        if plain:
+            body = HOTEL_CACHE.get(body_key)
+            if body is not None:
+                note('cache_hit')
+                return json_response(body, headers=CACHE_HIT_HEADERS)
         
-        elif action == 'search':
-            from_city = params.get('from', '')
-            to_city = params.get('to', '')
-            departure_date = params.get('date', '2024-12-15')
-            
-            # Enhanced flight data with more airlines and competitive pricing (30% below market)
-            airlines = [
-                {'name': 'Аэрофлот', 'code': 'SU', 'multiplier': 0.95},
-                {'name': 'S7 Airlines', 'code': 'S7', 'multiplier': 0.85},
-                {'name': 'Turkish Airlines', 'code': 'TK', 'multiplier': 1.1},
-                {'name': 'Emirates', 'code': 'EK', 'multiplier': 1.25},
-                {'name': 'Qatar Airways', 'code': 'QR', 'multiplier': 1.15},
-                {'name': 'Lufthansa', 'code': 'LH', 'multiplier': 1.05},
-                {'name': 'Air France', 'code': 'AF', 'multiplier': 1.0},
-                {'name': 'KLM', 'code': 'KL', 'multiplier': 1.0},
-                {'name': 'Flydubai', 'code': 'FZ', 'multiplier': 0.8},
-                {'name': 'Wizz Air', 'code': 'W6', 'multiplier': 0.7},
-                {'name': 'Pobeda', 'code': 'DP', 'multiplier': 0.65},
-                {'name': 'Red Wings', 'code': 'WZ', 'multiplier': 0.75}
-            ]
-            
-            aircrafts = ['Airbus A320', 'Airbus A321', 'Boeing 737', 'Boeing 777', 'Boeing 787', 'Airbus A330', 'Embraer E190']
-            
-            # Base price calculation (20% below market prices)
-            def calculate_base_price(from_code, to_code):
-                base_prices = {
-                    'domestic': 9600,   # Market: 12000
-                    'europe': 20000,    # Market: 25000
-                    'asia': 24000,      # Market: 30000
-                    'america': 40000,   # Market: 50000
-                    'africa': 32000,    # Market: 40000
-                    'oceania': 48000    # Market: 60000
-                }
-                
-                if from_code in ['MOW', 'LED', 'SVO', 'KZN', 'ROV'] and to_code in ['MOW', 'LED', 'SVO', 'KZN', 'ROV']:
-                    return base_prices['domestic']
-                elif to_code in ['PAR', 'LON', 'BCN', 'BER', 'ROM', 'AMS', 'PRG', 'CDG', 'LHR', 'MAD', 'FCO', 'MXP', 'FRA', 'MUC']:
-                    return base_prices['europe']
-                elif to_code in ['BKK', 'SIN', 'TYO', 'PEK', 'DXB', 'DEL', 'NRT', 'ICN', 'HKG', 'IST', 'AYT', 'DOH']:
-                    return base_prices['asia']
-                elif to_code in ['NYC', 'LAX', 'MIA', 'YTO', 'MEX', 'JFK', 'GRU']:
-                    return base_prices['america']
-                elif to_code in ['CAI', 'JNB', 'CMN', 'HRG', 'SSH']:
-                    return base_prices['africa']
-                else:
-                    return base_prices['oceania']
-            
-            base_price = calculate_base_price(from_city, to_city)
-            market_price_base = int(base_price / 0.8)
-            
-            mock_flights = []
-            for i, airline in enumerate(random.sample(airlines, min(6, len(airlines)))):
-                flight_num = f"{airline['code']}{random.randint(100, 9999)}"
-                our_price = int(base_price * airline['multiplier'] * random.uniform(0.9, 1.1))
-                market_price = int(our_price / 0.8)
-                savings = market_price - our_price
-                
-                departure_hour = 6 + i * 3
-                arrival_hour = departure_hour + random.randint(2, 8)
-                
-                stops = 0 if random.random() > 0.4 else 1
-                duration_base = 2 if stops == 0 else 4
-                duration = f"{duration_base + random.randint(0, 3)}ч {random.randint(0, 59)}м"
-                
-                mock_flights.append({
-                    'id': flight_num,
-                    'airline': airline['name'],
-                    'origin': from_city,
-                    'destination': to_city,
-                    'departure_time': f"{departure_hour:02d}:{random.randint(0, 59):02d}",
-                    'arrival_time': f"{arrival_hour % 24:02d}:{random.randint(0, 59):02d}",
-                    'duration': duration,
-                    'price': our_price,
-                    'market_price': market_price,
-                    'savings': savings,
-                    'discount_percent': 20,
-                    'currency': '₽',
-                    'stops': stops,
-                    'aircraft': random.choice(aircrafts)
-                })
-            
-            mock_flights.sort(key=lambda x: x['price'])
-            
-            return {
-                'statusCode': 200,
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*'
-                },
-                'isBase64Encoded': False,
-                'body': json.dumps({
-                    'flights': mock_flights,
-                    'search_params': {
-                        'origin': from_city,
-                        'destination': to_city,
-                        'date': departure_date
-                    }
-                })
-            }
-        
-        elif action == 'telegram':
-            telegram_url = os.environ.get('TELEGRAM_BOT_URL', 'https://t.me/your_bot')
-            
-            return {
-                'statusCode': 200,
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*'
-                },
-                'isBase64Encoded': False,
-                'body': json.dumps({'telegram_url': telegram_url})
+        columns = hotel_result_set(city, checkin, checkout, guests)
+    except ValueError as error:
+        return error_response(400, str(error))
+    
+    search_params = {
+        'city': city,
+        'checkin': checkin,
+        'checkout': checkout,
+        'guests': guests
+    }
+    
+    if wants_page(params):
+        return paged_response(columns.offer_index(), params, 'hotels', search_params, event)
+    
+    with timed('sort'):
+        order = columns.cheapest(limit)
+    hotels = columns.rows(order)
+    
+    if params.get('format') == 'ndjson':
+        return ndjson_response(event, iter_ndjson(search_params, hotels))
+    
+    with timed('serialize'):
+        body = json.dumps({
+            'hotels': list(hotels),
+            'search_params': search_params
+        })
+    HOTEL_CACHE.put(body_key, body)
+    return json_response(body, headers=CACHE_MISS_HEADERS)
+
+def k_smallest_sums(first: Sequence[int], second: Sequence[int], k: int) -> List[Tuple[int, int, int]]:
+    '''
+    The k smallest first[i] + second[j] as (sum, i, j), for lists sorted
+    ascending. Walks the i x j grid from its corner with a heap of at most k
+    entries instead of building the whole cross product.
+    '''
+    heap = [(first[i] + second[0], i, 0) for i in range(min(k, len(first)))] if second else []
+    heapq.heapify(heap)
+    result = []
+    while heap and len(result) < k:
+        total, i, j = heapq.heappop(heap)
+        result.append((total, i, j))
+        if j + 1 < len(second):
+            heapq.heappush(heap, (first[i] + second[j + 1], i, j + 1))
+    return result
+
+def hotel_result_set(city: str, checkin: str, checkout: str, guests: int) -> 'HotelColumns':
+    # Raises ValueError for an invalid stay
+    result_key = ('hotels', city, checkin, checkout, guests)
+    columns = RESULT_SETS.get(result_key)
+    if columns is not None:
+        note('cache_hit')
+        return columns
+    
+    def build_columns() -> HotelColumns:
+        with timed('generate'):
+            columns = generate_hotel_columns(city, checkin, checkout, guests)
+        RESULT_SETS.put(result_key, columns)
+        return columns
+    
+    return COALESCER.do(result_key, build_columns)
+
+@route('GET', 'package')
+def package_action(event: Dict[str, Any], params: Dict[str, str], context: Any) -> Dict[str, Any]:
+    from_city = airport_code(params.get('from'))
+    to_city = airport_code(params.get('to'))
+    checkin = params.get('checkin', '').strip()
+    checkout = params.get('checkout', '').strip()
+    if not from_city or not to_city or not checkin or not checkout:
+        return error_response(400, 'Expected from, to, checkin and checkout')
+    error = route_error(from_city, to_city)
+    if error is not None:
+        return error_response(400, error)
+    
+    city = HOTEL_CITY_BY_AIRPORT.get(to_city)
+    if city is None:
+        return error_response(400, f"Unknown destination airport: {to_city}")
+    try:
+        parse_stay(checkin, checkout)
+        guests = positive_int_param(params, 'guests') or 2
+        limit = min(positive_int_param(params, 'limit') or DEFAULT_PACKAGE_BUNDLES, MAX_PACKAGE_BUNDLES)
+    except ValueError as error:
+        return error_response(400, str(error))
+    
+    # Both flight directions and the hotels are independent; upstream fare calls overlap this way
+    with timed('gather'):
+        outbound = PACKAGE_POOL.submit(flight_result_set, from_city, to_city, checkin)
+        inbound = PACKAGE_POOL.submit(flight_result_set, to_city, from_city, checkout)
+        columns = hotel_result_set(city, checkin, checkout, guests)
+        outbound_flights = outbound.result()[0]
+        inbound_flights = inbound.result()[0]
+    
+    with timed('sort'):
+        # Per-traveller fares are already sorted by price, hotels give their cheapest order
+        hotel_order = columns.cheapest(limit)
+        round_trips = k_smallest_sums([flight['price'] for flight in outbound_flights],
+                                      [flight['price'] for flight in inbound_flights], limit)
+        bundles = k_smallest_sums([price * guests for price, _, _ in round_trips],
+                                  [columns.total_price[i] for i in hotel_order], limit)
+    
+    hotels = columns.rows([hotel_order[j] for _, _, j in bundles])
+    packages = []
+    for (total, trip, _), hotel in zip(bundles, hotels):
+        flights_price, outbound_index, inbound_index = round_trips[trip]
+        packages.append({
+            'total_price': total,
+            'flights_price': flights_price * guests,
+            'hotel_price': hotel['total_price'],
+            'currency': '₽',
+            'outbound': outbound_flights[outbound_index],
+            'return': inbound_flights[inbound_index],
+            'hotel': hotel
+        })
+    
+    with timed('serialize'):
+        body = json.dumps({
+            'packages': packages,
+            'search_params': {
+                'origin': from_city,
+                'destination': to_city,
+                'city': city,
+                'checkin': checkin,
+                'checkout': checkout,
+                'guests': guests
             }
+        })
+    return json_response(body)
+
+@route('GET', 'hotel_cities')
+def hotel_cities_action(event: Dict[str, Any], params: Dict[str, str], context: Any) -> Dict[str, Any]:
+    query = params.get('q', '').lower()
+    if not query:
+        return static_response(event, 'hotel_cities')
+    
+    cities = [city for city in get_hotel_cities() if query in city.lower()]
+    return json_response(json.dumps({'cities': cities[:50]}))
+
+@route('GET', 'popular')
+def popular_action(event: Dict[str, Any], params: Dict[str, str], context: Any) -> Dict[str, Any]:
+    return prebuilt_response(event, POPULAR.current())
+
+@route('GET', 'calendar')
+def calendar_action(event: Dict[str, Any], params: Dict[str, str], context: Any) -> Dict[str, Any]:
+    from_city = airport_code(params.get('from'))
+    to_city = airport_code(params.get('to'))
+    error = route_error(from_city, to_city)
+    if error is not None:
+        return error_response(400, error)
+    
+    try:
+        if params.get('date', '').strip():
+            window = int(params.get('window', '3'))
+            if not 0 <= window <= MAX_CALENDAR_WINDOW:
+                return error_response(400, f"window must be between 0 and {MAX_CALENDAR_WINDOW}")
+            center = datetime.strptime(params['date'].strip(), '%Y-%m-%d')
+            start = center - timedelta(days=window)
+            days = 2 * window + 1
+        else:
+            month = params.get('month', '').strip() or datetime.now().strftime('%Y-%m')
+            start = datetime.strptime(month, '%Y-%m')
+            days = (start.replace(year=start.year + start.month // 12, month=start.month % 12 + 1) - start).days
+        # The whole window must stay within datetime's year range
+        start + timedelta(days=days - 1)
+    except (ValueError, OverflowError):
+        return error_response(400, 'Expected month=YYYY-MM or date=YYYY-MM-DD with an integer window')
+    
+    start_date = start.strftime('%Y-%m-%d')
+    cache_key = (from_city, to_city, start_date, days)
+    body = CALENDAR_CACHE.get(cache_key)
+    if body is not None:
+        note('cache_hit')
+        return json_response(body, headers=CACHE_HIT_HEADERS)
+    
+    note('cache_miss')
+    with timed('generate'):
+        dates = [(start + timedelta(days=offset)).strftime('%Y-%m-%d') for offset in range(days)]
+        prices = calendar_min_prices(from_city, to_city, dates)
+        cheapest = min(range(days), key=prices.__getitem__)
+    
+    with timed('serialize'):
+        body = json.dumps({
+            'calendar': {
+                'origin': from_city,
+                'destination': to_city,
+                'start': start_date,
+                'days': days,
+                'prices': prices,
+                'currency': '₽'
+            },
+            'cheapest': {'date': dates[cheapest], 'price': prices[cheapest]}
+        })
+    CALENDAR_CACHE.put(cache_key, body)
+    return json_response(body, headers=CACHE_MISS_HEADERS)
+
+@route('POST', 'batch_search')
+def batch_search_action(event: Dict[str, Any], params: Dict[str, str], context: Any) -> Dict[str, Any]:
+    try:
+        payload = parse_json_body(event)
+    except ValueError:
+        return error_response(400, 'Body must be JSON')
+    
+    queries = payload.get('queries') if isinstance(payload, dict) else payload
+    if not isinstance(queries, list) or not queries:
+        return error_response(400, 'Expected {"queries": [{"from", "to", "date"}, ...]}')
+    if len(queries) > MAX_BATCH_QUERIES:
+        return error_response(400, f"At most {MAX_BATCH_QUERIES} queries per batch")
+    
+    keys = []
+    for position, query in enumerate(queries):
+        if not isinstance(query, dict) or not airport_code(query.get('from')) or not airport_code(query.get('to')):
+            return error_response(400, f"Query {position} needs from and to")
+        keys.append((airport_code(query['from']), airport_code(query['to']),
+                     str(query.get('date') or '').strip() or '2024-12-15'))
+    
+    started = time.perf_counter()
+    with timed('generate'):
+        # Repeated queries share one generated result; the itinerary search for a
+        # pair runs once and is shared through ITINERARY_CACHE
+        generated: Dict[Tuple[str, str, str], List[Dict[str, Any]]] = {}
+        results = []
+        for key in keys:
+            query_started = time.perf_counter()
+            flights = generated.get(key)
+            if flights is None:
+                flights = generated[key] = generate_flights(*key)
+            results.append({
+                'flights': flights,
+                'search_params': {'origin': key[0], 'destination': key[1], 'date': key[2]},
+                'timing_ms': round((time.perf_counter() - query_started) * 1000, 3)
+            })
+    
+    with timed('serialize'):
+        body = json.dumps({
+            'results': results,
+            'count': len(results),
+            'timing_ms': round((time.perf_counter() - started) * 1000, 3)
+        })
+    return json_response(body)
+
+# Enhanced flight data with more airlines and competitive pricing (30% below market)
+AIRLINES: List[Dict[str, Any]] = [
+    {'name': 'Аэрофлот', 'code': 'SU', 'multiplier': 0.95},
+    {'name': 'S7 Airlines', 'code': 'S7', 'multiplier': 0.85},
+    {'name': 'Turkish Airlines', 'code': 'TK', 'multiplier': 1.1},
+    {'name': 'Emirates', 'code': 'EK', 'multiplier': 1.25},
+    {'name': 'Qatar Airways', 'code': 'QR', 'multiplier': 1.15},
+    {'name': 'Lufthansa', 'code': 'LH', 'multiplier': 1.05},
+    {'name': 'Air France', 'code': 'AF', 'multiplier': 1.0},
+    {'name': 'KLM', 'code': 'KL', 'multiplier': 1.0},
+    {'name': 'Flydubai', 'code': 'FZ', 'multiplier': 0.8},
+    {'name': 'Wizz Air', 'code': 'W6', 'multiplier': 0.7},
+    {'name': 'Pobeda', 'code': 'DP', 'multiplier': 0.65},
+    {'name': 'Red Wings', 'code': 'WZ', 'multiplier': 0.75}
+]
+
+AIRCRAFTS = ['Airbus A320', 'Airbus A321', 'Boeing 737', 'Boeing 777', 'Boeing 787', 'Airbus A330', 'Embraer E190']
+
+FLIGHTS_PER_SEARCH = 6
+
+# Base price calculation (20% below market prices)
+REGION_BASE_PRICES: Dict[str, int] = {
+    'domestic': 9600,   # Market: 12000
+    'europe': 20000,    # Market: 25000
+    'asia': 24000,      # Market: 30000
+    'america': 40000,   # Market: 50000
+    'africa': 32000,    # Market: 40000
+    'oceania': 48000    # Market: 60000
+}
+
+# Routes with an unknown end fall back to the long-haul price
+FALLBACK_REGION = 'oceania'
+
+COUNTRY_REGIONS: Dict[str, str] = {
+    'Россия': 'domestic',
+    'Франция': 'europe', 'Великобритания': 'europe', 'Испания': 'europe', 'Италия': 'europe',
+    'Германия': 'europe', 'Нидерланды': 'europe', 'Бельгия': 'europe', 'Чехия': 'europe',
+    'Австрия': 'europe', 'Швейцария': 'europe', 'Финляндия': 'europe', 'Дания': 'europe',
+    'Швеция': 'europe', 'Норвегия': 'europe', 'Польша': 'europe', 'Греция': 'europe',
+    'Португалия': 'europe', 'Венгрия': 'europe',
+    'Турция': 'asia', 'ОАЭ': 'asia', 'Катар': 'asia', 'Кувейт': 'asia', 'Япония': 'asia',
+    'Южная Корея': 'asia', 'Таиланд': 'asia', 'Малайзия': 'asia', 'Сингапур': 'asia',
+    'Гонконг': 'asia', 'Китай': 'asia', 'Индия': 'asia', 'Узбекистан': 'asia',
+    'Казахстан': 'asia', 'Армения': 'asia', 'Грузия': 'asia', 'Азербайджан': 'asia',
+    'Мальдивы': 'asia', 'Индонезия': 'asia', 'Филиппины': 'asia', 'Вьетнам': 'asia',
+    'Камбоджа': 'asia', 'Мьянма': 'asia', 'Шри-Ланка': 'asia', 'Непал': 'asia',
+    'Пакистан': 'asia', 'Бангладеш': 'asia', 'Иран': 'asia', 'Бахрейн': 'asia',
+    'Оман': 'asia', 'Саудовская Аравия': 'asia',
+    'США': 'america', 'Канада': 'america', 'Мексика': 'america', 'Бразилия': 'america',
+    'Аргентина': 'america', 'Чили': 'america', 'Перу': 'america', 'Колумбия': 'america',
+    'Египет': 'africa', 'Марокко': 'africa', 'Тунис': 'africa', 'Алжир': 'africa',
+    'ЮАР': 'africa', 'Эфиопия': 'africa', 'Кения': 'africa',
+    'Австралия': 'oceania', 'Новая Зеландия': 'oceania'
+}
+
+# City codes used by action=popular and older links, mapped to their main airport
+METRO_CODES: Dict[str, str] = {
+    'PAR': 'CDG', 'LON': 'LHR', 'ROM': 'FCO', 'MIL': 'MXP', 'TYO': 'NRT',
+    'NYC': 'JFK', 'YTO': 'YYZ', 'CHI': 'ORD', 'SEL': 'ICN', 'BJS': 'PEK'
+}
+
+REGIONS: Tuple[str, ...] = tuple(REGION_BASE_PRICES)
+UNKNOWN_REGION_ID = len(REGIONS)
+
+AIRPORTS: Dict[str, Dict[str, str]] = {city['code']: city for city in CITIES}
+AIRPORTS.update({metro: AIRPORTS[airport] for metro, airport in METRO_CODES.items()})
+
+# Airport code -> index into REGIONS; a KeyError here means a catalog country lacks a region
+AIRPORT_REGION_IDS: Dict[str, int] = {
+    code: REGIONS.index(COUNTRY_REGIONS[city['country']]) for code, city in AIRPORTS.items()
+}
+
+def _pair_region(from_id: int, to_id: int) -> str:
+    domestic_id = REGIONS.index('domestic')
+    if from_id == domestic_id and to_id == domestic_id:
+        return 'domestic'
+    # Priced by the foreign end of the trip, destination first
+    for region_id in (to_id, from_id):
+        if region_id != domestic_id and region_id != UNKNOWN_REGION_ID:
+            return REGIONS[region_id]
+    return FALLBACK_REGION
+
+# PAIR_BASE_PRICES[from_region_id][to_region_id], including the unknown region
+PAIR_BASE_PRICES: Tuple[Tuple[int, ...], ...] = tuple(
+    tuple(REGION_BASE_PRICES[_pair_region(from_id, to_id)] for to_id in range(UNKNOWN_REGION_ID + 1))
+    for from_id in range(UNKNOWN_REGION_ID + 1)
+)
+
+def airport_region(code: str) -> Optional[str]:
+    region_id = AIRPORT_REGION_IDS.get(code)
+    return REGIONS[region_id] if region_id is not None else None
+
+def calculate_base_price(from_code: str, to_code: str) -> int:
+    return PAIR_BASE_PRICES[AIRPORT_REGION_IDS.get(from_code, UNKNOWN_REGION_ID)][AIRPORT_REGION_IDS.get(to_code, UNKNOWN_REGION_ID)]
+
+def calculate_base_prices(pairs: Sequence[Tuple[str, str]]) -> List[int]:
+    '''
+    Bulk variant of calculate_base_price for many (from, to) pairs in one call.
+    '''
+    region_ids = AIRPORT_REGION_IDS.get
+    matrix = PAIR_BASE_PRICES
+    unknown = UNKNOWN_REGION_ID
+    return [matrix[region_ids(from_code, unknown)][region_ids(to_code, unknown)] for from_code, to_code in pairs]
+
+def search_seed(*parts: str) -> int:
+    # Stable across processes, unlike hash(), so every instance quotes the same offers
+    digest = hashlib.blake2b('|'.join(parts).encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big')
+
+def draw_fares(rng: random.Random, base_prices: Sequence[int]) -> List[Tuple[Dict[str, Any], int]]:
+    # One airline and price per base price, i.e. per itinerary
+    airlines = rng.sample(AIRLINES, min(len(base_prices), len(AIRLINES)))
+    return [(airline, int(base_price * airline['multiplier'] * rng.uniform(0.9, 1.1)))
+            for airline, base_price in zip(airlines, base_prices)]
+
+# action=search prefer=: which k itineraries to offer
+PREFERENCES: Tuple[str, ...] = ('price', 'duration')
+
+MIN_CONNECTION_MINUTES = int(os.environ.get('MIN_CONNECTION_MINUTES', '60'))
+MAX_CONNECTION_MINUTES = int(os.environ.get('MAX_CONNECTION_MINUTES', '720'))
+MAX_STOPS = 2
+# Itineraries start no earlier than 05:00 on the search date
+FIRST_DEPARTURE_MINUTE = 300
+
+class RouteGraph:
+    '''
+    Directed flight network in compressed sparse row form: the legs leaving
+    airport i are entries offsets[i]..offsets[i + 1] of the parallel leg arrays.
+    A leg departs at its first departure minute and again every headway
+    minutes (a divisor of 1440), every day. Passengers only change planes at
+    transfer airports (all of them unless given).
+    '''
+    
+    def __init__(self, codes: Sequence[str], legs: Iterable[Tuple[int, int, int, int, int, int]],
+                 transfers: Optional[Iterable[str]] = None):
+        # legs: (source id, target id, first departure minute, headway, duration minutes, price)
+        self.codes = list(codes)
+        self.ids = {code: i for i, code in enumerate(self.codes)}
+        self.transfers = frozenset(range(len(self.codes)) if transfers is None else (self.ids[code] for code in transfers))
+        ordered = sorted(legs)
+        self.offsets = self._offsets([leg[0] for leg in ordered])
+        self.targets = array('i', [leg[1] for leg in ordered])
+        self.departures = array('i', [leg[2] for leg in ordered])
+        self.headways = array('i', [leg[3] for leg in ordered])
+        self.durations = array('i', [leg[4] for leg in ordered])
+        self.prices = array('i', [leg[5] for leg in ordered])
+        # Reverse adjacency, to know which airports reach a destination in one leg
+        incoming = sorted((leg[1], leg[0]) for leg in ordered)
+        self.in_offsets = self._offsets([target for target, _ in incoming])
+        self.in_sources = array('i', [source for _, source in incoming])
+    
+    def _offsets(self, sorted_ids: List[int]) -> array:
+        offsets = array('i', [0]) * (len(self.codes) + 1)
+        for node in sorted_ids:
+            offsets[node + 1] += 1
+        for node in range(len(self.codes)):
+            offsets[node + 1] += offsets[node]
+        return offsets
+    
+    def itineraries(self, origin: str, destination: str, k: int, by_duration: bool = False,
+                    max_stops: int = MAX_STOPS, min_connection: int = MIN_CONNECTION_MINUTES,
+                    max_flying: Optional[int] = None) -> List[Dict[str, Any]]:
+        '''
+        The k cheapest (or fastest, first departure to last arrival) itineraries
+        departing on one day, with at most max_stops connections of between
+        min_connection and MAX_CONNECTION_MINUTES minutes. Best-first search over
+        partial itineraries in which every (airport, legs flown) state is
+        expanded at most k times, which bounds the work at hubs. max_flying caps
+        the minutes spent in the air, which rules out long detours.
+        '''
+        source = self.ids.get(origin)
+        target = self.ids.get(destination)
+        if source is None or target is None or source == target:
+            return []
         
-        elif action == 'hotels':
-            city = params.get('city', 'Москва')
-            checkin = params.get('checkin', '2024-12-15')
-            checkout = params.get('checkout', '2024-12-18')
-            guests = int(params.get('guests', '2'))
-            
-            hotels = generate_hotels(city, checkin, checkout, guests)
-            
-            return {
-                'statusCode': 200,
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*'
-                },
-                'isBase64Encoded': False,
-                'body': json.dumps({
-                    'hotels': hotels,
-                    'search_params': {
-                        'city': city,
-                        'checkin': checkin,
-                        'checkout': checkout,
-                        'guests': guests
-                    }
-                })
-            }
+        offsets, targets, departures, headways = self.offsets, self.targets, self.departures, self.headways
+        durations, prices, transfers = self.durations, self.prices, self.transfers
+        feeders = set(self.in_sources[self.in_offsets[target]:self.in_offsets[target + 1]])
+        max_legs = max_stops + 1
+        expanded: Dict[Tuple[int, int], int] = {}
+        tiebreak = itertools.count()
+        max_flying = max_flying or 1 << 30
+        # (cost, tiebreak, airport, price, minutes flown, first departure, arrival, legs as (edge, departure, arrival))
+        heap: List[Tuple[Any, ...]] = [(0, next(tiebreak), source, 0, 0, 0, 0, ())]
+        found = []
         
-        elif action == 'hotel_cities':
-            cities = get_hotel_cities()
-            
-            query = params.get('q', '').lower()
-            if query:
-                cities = [city for city in cities if query in city.lower()]
+        while heap and len(found) < k:
+            _, _, node, price, flown, first_departure, arrival, legs = heapq.heappop(heap)
+            if node == target:
+                found.append((price, legs))
+                continue
+            depth = len(legs)
+            times_expanded = expanded.get((node, depth), 0)
+            if times_expanded >= k or depth == max_legs:
+                continue
+            expanded[(node, depth)] = times_expanded + 1
             
-            return {
-                'statusCode': 200,
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*'
-                },
-                'isBase64Encoded': False,
-                'body': json.dumps({'cities': cities[:50]})
-            }
+            legs_left = max_legs - depth - 1
+            visited = {source}
+            visited.update(targets[edge] for edge, _, _ in legs)
+            for edge in range(offsets[node], offsets[node + 1]):
+                next_node = targets[edge]
+                if next_node != target and (legs_left == 0 or next_node in visited or next_node not in transfers
+                                            or (legs_left == 1 and next_node not in feeders)):
+                    continue
+                total = price + prices[edge]
+                flying = flown + durations[edge]
+                if flying > max_flying:
+                    continue
+                if depth == 0:
+                    # Any departure that day may give the fastest trip; for price only the first matters
+                    first = FIRST_DEPARTURE_MINUTE + (departures[edge] - FIRST_DEPARTURE_MINUTE) % headways[edge]
+                    for departure in range(first, 1440 if by_duration else first + 1, headways[edge]):
+                        landing = departure + durations[edge]
+                        heapq.heappush(heap, (landing - departure if by_duration else total, next(tiebreak), next_node,
+                                              total, flying, departure, landing, ((edge, departure, landing),)))
+                    continue
+                ready = arrival + min_connection
+                departure = ready + (departures[edge] - ready) % headways[edge]
+                if departure - arrival > MAX_CONNECTION_MINUTES:
+                    continue
+                landing = departure + durations[edge]
+                heapq.heappush(heap, (landing - first_departure if by_duration else total, next(tiebreak), next_node,
+                                      total, flying, first_departure, landing, legs + ((edge, departure, landing),)))
         
-        elif action == 'popular':
-            popular_destinations = [
-                {'city': 'Париж', 'country': 'Франция', 'price': 'от 17 900 ₽', 'code': 'PAR', 'trend': '+5%'},
-                {'city': 'Нью-Йорк', 'country': 'США', 'price': 'от 34 200 ₽', 'code': 'NYC', 'trend': '-2%'},
-                {'city': 'Токио', 'country': 'Япония', 'price': 'от 37 900 ₽', 'code': 'TYO', 'trend': '+8%'},
-                {'city': 'Лондон', 'country': 'Великобритания', 'price': 'от 19 800 ₽', 'code': 'LON', 'trend': '0%'},
-                {'city': 'Дубай', 'country': 'ОАЭ', 'price': 'от 22 700 ₽', 'code': 'DXB', 'trend': '-3%'},
-                {'city': 'Барселона', 'country': 'Испания', 'price': 'от 15 900 ₽', 'code': 'BCN', 'trend': '+1%'}
-            ]
-            
-            return {
-                'statusCode': 200,
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*'
-                },
-                'isBase64Encoded': False,
-                'body': json.dumps({'destinations': popular_destinations})
-            }
+        if found and len(found) < k and not by_duration:
+            found += self._later_departures(found, k - len(found), min_connection)
+        return [{'price': price, 'duration_minutes': legs[-1][2] - legs[0][1], 'legs': self._segments(source, legs)}
+                for price, legs in found]
     
-    return {
-        'statusCode': 405,
-        'headers': {'Access-Control-Allow-Origin': '*'},
-        'body': json.dumps({'error': 'Method not allowed'})
-    }
-
-def generate_hotels(city: str, checkin: str, checkout: str, guests: int) -> List[Dict[str, Any]]:
-    hotel_chains = [
-        {'name': 'Marriott', 'multiplier': 1.3},
-        {'name': 'Hilton', 'multiplier': 1.25},
-        {'name': 'Hyatt', 'multiplier': 1.2},
-        {'name': 'Radisson', 'multiplier': 1.0},
-        {'name': 'Novotel', 'multiplier': 0.95},
-        {'name': 'ibis', 'multiplier': 0.7},
-        {'name': 'Holiday Inn', 'multiplier': 0.85},
-        {'name': 'Best Western', 'multiplier': 0.8},
-        {'name': 'DoubleTree', 'multiplier': 1.1},
-        {'name': 'Crowne Plaza', 'multiplier': 1.15}
-    ]
+    def _later_departures(self, found: List[Tuple[int, Any]], missing: int, min_connection: int) -> List[Tuple[int, Any]]:
+        # Too few distinct routes: offer the same routes again on later flights that day
+        extra = []
+        for step in range(1, 1440 // min(self.headways[legs[0][0]] for _, legs in found)):
+            for price, legs in found:
+                departure = legs[0][1] + step * self.headways[legs[0][0]]
+                if departure >= 1440:
+                    continue
+                retimed = self._schedule([edge for edge, _, _ in legs], departure, min_connection)
+                if retimed is not None:
+                    extra.append((price, retimed))
+                    if len(extra) == missing:
+                        return extra
+        return extra
     
-    city_base_prices = {
-        'москва': 8000,
-        'санкт-петербург': 6000,
-        'сочи': 7000,
-        'казань': 4500,
-        'екатеринбург': 4000,
-        'париж': 12000,
-        'лондон': 15000,
-        'нью-йорк': 18000,
-        'дубай': 14000,
-        'токио': 13000,
-        'барселона': 9000,
-        'рим': 10000,
-        'стамбул': 5000,
-        'бангкок': 4000,
-        'сингапур': 11000,
-        'бали': 6000,
-        'пхукет': 5500,
-        'майами': 16000,
-        'лас-вегас': 12000
-    }
+    def _schedule(self, edges: List[int], departure: int, min_connection: int) -> Optional[Tuple[Tuple[int, int, int], ...]]:
+        legs: List[Tuple[int, int, int]] = []
+        for edge in edges:
+            if legs:
+                ready = legs[-1][2] + min_connection
+                departure = ready + (self.departures[edge] - ready) % self.headways[edge]
+                if departure - legs[-1][2] > MAX_CONNECTION_MINUTES:
+                    return None
+            legs.append((edge, departure, departure + self.durations[edge]))
+        return tuple(legs)
+    
+    def _segments(self, source: int, legs: Sequence[Tuple[int, int, int]]) -> List[Dict[str, Any]]:
+        segments = []
+        node = source
+        for edge, departure, arrival in legs:
+            segments.append({
+                'origin': self.codes[node],
+                'destination': self.codes[self.targets[edge]],
+                'departure_minute': departure,
+                'arrival_minute': arrival,
+                'duration_minutes': self.durations[edge]
+            })
+            node = self.targets[edge]
+        return segments
+
+# Airports every other airport of the same region connects through; hubs also link to each other
+HUB_AIRPORTS: Tuple[str, ...] = (
+    'SVO', 'DME', 'LED', 'FRA', 'CDG', 'LHR', 'AMS', 'IST', 'DXB', 'DOH', 'SIN', 'HKG', 'PEK',
+    'DEL', 'NRT', 'ICN', 'BKK', 'JFK', 'ATL', 'LAX', 'ORD', 'CAI', 'ADD', 'JNB', 'SYD'
+)
+
+# Typical block time in minutes between two regions, before per-route variation
+REGION_LEG_MINUTES: Dict[Tuple[str, str], int] = {
+    ('domestic', 'domestic'): 150, ('domestic', 'europe'): 240, ('asia', 'domestic'): 330,
+    ('america', 'domestic'): 660, ('africa', 'domestic'): 330, ('domestic', 'oceania'): 1000,
+    ('europe', 'europe'): 140, ('asia', 'europe'): 360, ('america', 'europe'): 540,
+    ('africa', 'europe'): 300, ('europe', 'oceania'): 1300, ('asia', 'asia'): 300,
+    ('america', 'asia'): 780, ('africa', 'asia'): 480, ('asia', 'oceania'): 540,
+    ('america', 'america'): 300, ('africa', 'america'): 720, ('america', 'oceania'): 900,
+    ('africa', 'africa'): 240, ('africa', 'oceania'): 780, ('oceania', 'oceania'): 180
+}
+
+# Itineraries may spend at most twice the typical direct block time in the air, plus four hours
+MAX_DETOUR_FACTOR = 2.0
+DETOUR_ALLOWANCE_MINUTES = 240
+
+# Share of same-region airport pairs (neither a hub) with a direct flight
+DIRECT_ROUTE_SHARE = 0.15
+
+# Search codes that are cities rather than airports, resolved to the airport the graph uses
+GRAPH_ALIASES: Dict[str, str] = dict(METRO_CODES, MOW='SVO')
+
+def airport_name_parts(code: str) -> Tuple[str, str]:
+    # 'Париж (Шарль де Голль)' -> ('Париж', 'Шарль де Голль'); ('Москва', '') without a detail
+    name, _, detail = AIRPORTS[code]['name'].partition(' (')
+    return name, detail.rstrip(')')
+
+def leg_profile(from_code: str, to_code: str, headway: int) -> Tuple[int, int, int, int]:
+    '''
+    Seeded (first departure, headway, duration, price) of a direct flight,
+    drawn straight from search_seed bits since seeding a Random per leg would
+    dominate the cold start. Durations are symmetric; legs touching a hub are
+    priced below the region fare, since that is where carriers compete.
+    '''
+    regions = tuple(sorted((airport_region(from_code), airport_region(to_code))))
+    route_bits = search_seed('leg', *sorted((from_code, to_code)))
+    leg_bits = search_seed('leg', from_code, to_code)
+    duration = 5 * round(REGION_LEG_MINUTES[regions] * (0.75 + (route_bits % 1000) / 2000) / 5)
+    departure = 5 * (leg_bits % (headway // 5))
+    share = 0.75 if from_code in HUB_AIRPORTS or to_code in HUB_AIRPORTS else 1.0
+    price_factor = 0.8 + (leg_bits >> 20) % 1000 / 3333
+    return departure, headway, duration, int(calculate_base_price(from_code, to_code) * share * price_factor)
+
+def build_route_graph(catalog: List[Dict[str, str]]) -> RouteGraph:
+    codes = [city['code'] for city in catalog if city['code'] not in GRAPH_ALIASES]
+    region_of = {code: airport_region(code) for code in codes}
+    hubs = [code for code in HUB_AIRPORTS if code in region_of]
     
-    city_lower = city.lower()
-    base_price = city_base_prices.get(city_lower, 6000)
+    # (from, to) -> minutes between departures: hub trunks fly every 4 hours, feeders every 8, the rest daily
+    routes: Dict[Tuple[str, str], int] = {(a, b): 240 for a in hubs for b in hubs}
+    for code in codes:
+        for hub in hubs:
+            if region_of[hub] == region_of[code] and code not in hubs:
+                routes[(code, hub)] = routes[(hub, code)] = 480
+    for a, b in itertools.combinations([code for code in codes if code not in hubs], 2):
+        if region_of[a] == region_of[b] and search_seed('direct', *sorted((a, b))) % 1000 < DIRECT_ROUTE_SHARE * 1000:
+            routes[(a, b)] = routes[(b, a)] = 1440
     
-    hotels = []
-    num_hotels = min(random.randint(12, 20), 20)
+    ids = {code: i for i, code in enumerate(codes)}
+    # No legs between airports of one city, e.g. SVO and DME
+    return RouteGraph(codes, [(ids[a], ids[b]) + leg_profile(a, b, headway) for (a, b), headway in routes.items()
+                              if airport_name_parts(a)[0] != airport_name_parts(b)[0]], transfers=hubs)
+
+ROUTE_GRAPH = build_route_graph(CITIES)
+
+# Itineraries per (from, to, prefer); the graph is fixed, so entries never expire
+ITINERARY_CACHE = TTLCache(maxsize=int(os.environ.get('ITINERARY_CACHE_SIZE', '4096')), ttl=float('inf'))
+
+def route_itineraries(from_code: str, to_code: str, prefer: str = 'price') -> List[Dict[str, Any]]:
+    key = (from_code, to_code, prefer)
+    itineraries = ITINERARY_CACHE.get(key)
+    if itineraries is None:
+        origin = GRAPH_ALIASES.get(from_code, from_code)
+        destination = GRAPH_ALIASES.get(to_code, to_code)
+        itineraries = []
+        if origin in ROUTE_GRAPH.ids and destination in ROUTE_GRAPH.ids:
+            regions = tuple(sorted((airport_region(origin), airport_region(destination))))
+            with timed('route'):
+                itineraries = ROUTE_GRAPH.itineraries(origin, destination, FLIGHTS_PER_SEARCH, by_duration=prefer == 'duration',
+                                                      max_flying=int(REGION_LEG_MINUTES[regions] * MAX_DETOUR_FACTOR) + DETOUR_ALLOWANCE_MINUTES)
+        ITINERARY_CACHE.put(key, itineraries)
+    return itineraries
+
+def fare_bases(from_city: str, to_city: str, prefer: str = 'price') -> List[int]:
+    '''
+    Base price of each offer action=search draws fares for: one per itinerary,
+    or the region price for codes outside the route graph.
+    '''
+    itineraries = route_itineraries(from_city, to_city, prefer)
+    if itineraries:
+        return [itinerary['price'] for itinerary in itineraries]
+    return [calculate_base_price(from_city, to_city)] * FLIGHTS_PER_SEARCH
+
+def calendar_min_prices(from_city: str, to_city: str, dates: Sequence[str]) -> List[int]:
+    '''
+    Cheapest action=search price for each date, using the same seeded fare draws
+    but skipping everything else an offer needs (flight numbers, times, dumps).
+    '''
+    base_prices = fare_bases(from_city, to_city)
+    prices = []
+    for departure_date in dates:
+        rng = random.Random(search_seed(from_city, to_city, departure_date))
+        prices.append(min(price for _, price in draw_fares(rng, base_prices)))
+    return prices
+
+def clock(minute: int) -> str:
+    return f"{minute // 60 % 24:02d}:{minute % 60:02d}"
+
+def generate_flights(from_city: str, to_city: str, departure_date: str, rng: Optional[random.Random] = None,
+                     prefer: str = 'price') -> List[Dict[str, Any]]:
+    '''
+    Offers are reproducible for the same (origin, destination, date) unless an
+    explicit rng is passed in. Routes in the graph get one offer per itinerary;
+    other codes get direct offers at the region price.
+    '''
+    if rng is None:
+        rng = random.Random(search_seed(from_city, to_city, departure_date))
+    itineraries = route_itineraries(from_city, to_city, prefer)
+    if not itineraries:
+        return generate_direct_flights(from_city, to_city, rng, calculate_base_price(from_city, to_city))
     
-    for i in range(num_hotels):
-        chain = random.choice(hotel_chains)
-        star_rating = random.randint(3, 5)
+    flights = []
+    for itinerary, (airline, our_price) in zip(itineraries, draw_fares(rng, [itinerary['price'] for itinerary in itineraries])):
+        market_price = int(our_price / 0.8)
+        segments = [{
+            'flight_number': f"{airline['code']}{rng.randint(100, 9999)}",
+            'origin': leg['origin'],
+            'destination': leg['destination'],
+            'departure_time': clock(leg['departure_minute']),
+            'arrival_time': clock(leg['arrival_minute']),
+            'duration_minutes': leg['duration_minutes']
+        } for leg in itinerary['legs']]
+        legs = itinerary['legs']
+        duration_minutes = itinerary['duration_minutes']
         
-        night_price = int(base_price * chain['multiplier'] * random.uniform(0.9, 1.1))
-        market_night_price = int(night_price / 0.75)
+        flights.append({
+            'id': segments[0]['flight_number'],
+            'airline': airline['name'],
+            'origin': from_city,
+            'destination': to_city,
+            'departure_time': segments[0]['departure_time'],
+            'arrival_time': segments[-1]['arrival_time'],
+            'arrival_day_offset': legs[-1]['arrival_minute'] // 1440 - legs[0]['departure_minute'] // 1440,
+            'duration': f"{duration_minutes // 60}ч {duration_minutes % 60}м",
+            'duration_minutes': duration_minutes,
+            'price': our_price,
+            'market_price': market_price,
+            'savings': market_price - our_price,
+            'discount_percent': 20,
+            'currency': '₽',
+            'stops': len(segments) - 1,
+            'via': [segment['destination'] for segment in segments[:-1]],
+            'segments': segments,
+            'aircraft': rng.choice(AIRCRAFTS)
+        })
+    
+    with timed('sort'):
+        flights.sort(key=lambda x: x['duration_minutes'] if prefer == 'duration' else x['price'])
+    return flights
+
+def generate_direct_flights(from_city: str, to_city: str, rng: random.Random, base_price: int) -> List[Dict[str, Any]]:
+    mock_flights = []
+    for i, (airline, our_price) in enumerate(draw_fares(rng, [base_price] * FLIGHTS_PER_SEARCH)):
+        flight_num = f"{airline['code']}{rng.randint(100, 9999)}"
+        market_price = int(our_price / 0.8)
+        savings = market_price - our_price
         
-        try:
-            from datetime import datetime as dt
-            checkin_date = dt.strptime(checkin, '%Y-%m-%d')
-            checkout_date = dt.strptime(checkout, '%Y-%m-%d')
-            nights = max((checkout_date - checkin_date).days, 1)
-        except:
-            nights = 3
+        stops = 0 if rng.random() > 0.4 else 1
+        duration_base = 2 if stops == 0 else 4
+        duration_hours = duration_base + rng.randint(0, 3)
+        duration_minutes = duration_hours * 60 + rng.randint(0, 59)
+        duration = f"{duration_hours}ч {duration_minutes % 60}м"
         
-        total_price = night_price * nights
-        market_total_price = market_night_price * nights
-        savings = market_total_price - total_price
+        # Same shape as graph offers: arrival follows from departure plus duration
+        departure_minute = (6 + i * 3) * 60 + rng.randint(0, 59)
+        arrival_minute = departure_minute + duration_minutes
+        segment = {
+            'flight_number': flight_num,
+            'origin': from_city,
+            'destination': to_city,
+            'departure_time': clock(departure_minute),
+            'arrival_time': clock(arrival_minute),
+            'duration_minutes': duration_minutes
+        }
         
-        hotel_types = ['Hotel', 'Resort', 'Inn', 'Suites', 'Plaza']
-        hotel_name = f"{chain['name']} {random.choice(hotel_types)} {city}"
+        mock_flights.append({
+            'id': flight_num,
+            'airline': airline['name'],
+            'origin': from_city,
+            'destination': to_city,
+            'departure_time': segment['departure_time'],
+            'arrival_time': segment['arrival_time'],
+            'arrival_day_offset': arrival_minute // 1440 - departure_minute // 1440,
+            'duration': duration,
+            'duration_minutes': duration_minutes,
+            'price': our_price,
+            'market_price': market_price,
+            'savings': savings,
+            'discount_percent': 20,
+            'currency': '₽',
+            'stops': stops,
+            'via': [],
+            'segments': [segment],
+            'aircraft': rng.choice(AIRCRAFTS)
+        })
+    
+    with timed('sort'):
+        mock_flights.sort(key=lambda x: x['price'])
+    return mock_flights
+
+# Upstream fare sources; None keeps search on the synthetic generator
+FARE_CLIENT: Optional[FareClient] = FareClient.from_env()
+
+def find_flights(from_city: str, to_city: str, departure_date: str,
+                 prefer: str = 'price') -> Tuple[List[Dict[str, Any]], Optional[Dict[str, str]]]:
+    '''
+    Returns offers plus the status of every upstream provider (None when no
+    providers are configured). Falls back to generated offers if no provider
+    answered in time.
+    '''
+    if FARE_CLIENT is None:
+        with timed('generate'):
+            return generate_flights(from_city, to_city, departure_date, prefer=prefer), None
+    
+    with timed('upstream'):
+        flights, sources = FARE_CLIENT.search(from_city, to_city, departure_date)
+    if not is_complete(sources):
+        note('upstream_partial')
+    if not flights:
+        with timed('generate'):
+            flights = generate_flights(from_city, to_city, departure_date, prefer=prefer)
+    elif prefer == 'duration':
+        flights.sort(key=lambda flight: flight['duration_minutes'])
+    return flights, sources
+
+def flight_result_set(from_city: str, to_city: str, departure_date: str,
+                      prefer: str = 'price') -> Tuple[List[Dict[str, Any]], OfferIndex, Optional[Dict[str, str]]]:
+    # Offers kept for paging and streaming; concurrent misses share one upstream call
+    result_key = ('flights', from_city, to_city, departure_date, prefer)
+    cached = RESULT_SETS.get(result_key)
+    if cached is not None:
+        note('cache_hit')
+        return cached
+    
+    def build() -> Tuple[List[Dict[str, Any]], OfferIndex, Optional[Dict[str, str]]]:
+        flights, sources = find_flights(from_city, to_city, departure_date, prefer)
+        result = (flights, flight_offer_index(flights), sources)
+        if is_complete(sources):
+            RESULT_SETS.put(result_key, result)
+        return result
+    
+    return COALESCER.do(result_key, build)
+
+def is_complete(sources: Optional[Dict[str, str]]) -> bool:
+    # Partial upstream answers are served but not cached
+    return sources is None or all(status == 'ok' for status in sources.values())
+
+def flight_offer_index(flights: List[Dict[str, Any]]) -> OfferIndex:
+    columns = {
+        'price': [flight['price'] for flight in flights],
+        'stops': [flight['stops'] for flight in flights],
+        'duration_minutes': [flight['duration_minutes'] for flight in flights],
+        'departure_minutes': [int(flight['departure_time'][:2]) * 60 + int(flight['departure_time'][3:]) for flight in flights]
+    }
+    return OfferIndex(columns, flights.__getitem__, len(flights))
+
+HOTEL_CHAINS: List[Dict[str, Any]] = [
+    {'name': 'Marriott', 'multiplier': 1.3},
+    {'name': 'Hilton', 'multiplier': 1.25},
+    {'name': 'Hyatt', 'multiplier': 1.2},
+    {'name': 'Radisson', 'multiplier': 1.0},
+    {'name': 'Novotel', 'multiplier': 0.95},
+    {'name': 'ibis', 'multiplier': 0.7},
+    {'name': 'Holiday Inn', 'multiplier': 0.85},
+    {'name': 'Best Western', 'multiplier': 0.8},
+    {'name': 'DoubleTree', 'multiplier': 1.1},
+    {'name': 'Crowne Plaza', 'multiplier': 1.15}
+]
+
+CITY_HOTEL_BASE_PRICES: Dict[str, int] = {
+    'москва': 8000,
+    'санкт-петербург': 6000,
+    'сочи': 7000,
+    'казань': 4500,
+    'екатеринбург': 4000,
+    'париж': 12000,
+    'лондон': 15000,
+    'нью-йорк': 18000,
+    'дубай': 14000,
+    'токио': 13000,
+    'барселона': 9000,
+    'рим': 10000,
+    'стамбул': 5000,
+    'бангкок': 4000,
+    'сингапур': 11000,
+    'бали': 6000,
+    'пхукет': 5500,
+    'майами': 16000,
+    'лас-вегас': 12000
+}
+
+HOTEL_TYPES = ['Hotel', 'Resort', 'Inn', 'Suites', 'Plaza']
+HOTEL_DISTRICTS = ['Центральный район', 'Исторический центр', 'Деловой район', 'Прибрежная зона']
+ROOM_TYPES = ['Стандартный номер', 'Делюкс', 'Люкс', 'Семейный номер', 'Апартаменты']
+CANCELLATION_POLICIES = ['Бесплатная отмена', 'Отмена за 48 часов', 'Без возврата']
+HOTEL_AMENITIES = [
+    'Wi-Fi бесплатно',
+    'Бассейн',
+    'Спа-центр',
+    'Фитнес-зал',
+    'Ресторан',
+    'Парковка',
+    'Трансфер',
+    'Кондиционер',
+    'Мини-бар',
+    'Сейф'
+]
+
+# Every 4-7 amenity combination, weighted so each size is equally likely, and
+# the matching bitmasks over HOTEL_AMENITIES for cheap filtering
+AMENITY_SETS: List[Tuple[str, ...]] = [
+    combo for size in range(4, 8) for combo in itertools.combinations(HOTEL_AMENITIES, size)
+]
+AMENITY_MASKS: List[int] = [
+    sum(1 << HOTEL_AMENITIES.index(amenity) for amenity in combo) for combo in AMENITY_SETS
+]
+AMENITY_CUM_WEIGHTS: List[float] = list(itertools.accumulate(1 / math.comb(10, len(combo)) for combo in AMENITY_SETS))
+
+MAX_HOTEL_NIGHTS = 60
+
+def parse_stay(checkin: str, checkout: str) -> int:
+    '''
+    Number of nights between two YYYY-MM-DD dates; raises ValueError with a
+    message fit for a 400 response.
+    '''
+    try:
+        checkin_date = datetime.strptime(checkin, '%Y-%m-%d')
+        checkout_date = datetime.strptime(checkout, '%Y-%m-%d')
+    except ValueError:
+        raise ValueError('checkin and checkout must be dates in YYYY-MM-DD format') from None
+    nights = (checkout_date - checkin_date).days
+    if nights < 0:
+        raise ValueError('checkout must not be before checkin')
+    if nights > MAX_HOTEL_NIGHTS:
+        raise ValueError(f"Stays longer than {MAX_HOTEL_NIGHTS} nights are not supported")
+    return max(nights, 1)
+
+class HotelColumns:
+    '''
+    Hotel offers stored column-wise: one list per field, filled in a single pass
+    per column. Row dicts are only built by row()/rows() when serializing.
+    '''
+    
+    def __init__(self, city: str, nights: int, count: int, rng: random.Random):
+        self.city = city
+        self.nights = nights
+        self.count = count
         
-        amenities = random.sample([
-            'Wi-Fi бесплатно',
-            'Бассейн',
-            'Спа-центр',
-            'Фитнес-зал',
-            'Ресторан',
-            'Парковка',
-            'Трансфер',
-            'Кондиционер',
-            'Мини-бар',
-            'Сейф'
-        ], k=random.randint(4, 7))
+        base_price = CITY_HOTEL_BASE_PRICES.get(city.lower(), 6000)
+        multipliers = [chain['multiplier'] for chain in HOTEL_CHAINS]
+        positions = range(count)
+        uniform = rng.random
         
-        hotels.append({
-            'id': f"HTL{random.randint(10000, 99999)}",
-            'name': hotel_name,
-            'chain': chain['name'],
-            'stars': star_rating,
-            'rating': round(random.uniform(7.5, 9.8), 1),
-            'reviews_count': random.randint(150, 3500),
+        self.chain = rng.choices(range(len(HOTEL_CHAINS)), k=count)
+        self.night_price = [int(base_price * multipliers[chain] * (0.9 + 0.2 * uniform())) for chain in self.chain]
+        self.market_night_price = [int(price / 0.75) for price in self.night_price]
+        self.total_price = [price * nights for price in self.night_price]
+        self.stars = rng.choices((3, 4, 5), k=count)
+        self.rating = [round(7.5 + 2.3 * uniform(), 1) for _ in positions]
+        self.reviews_count = [150 + int(3351 * uniform()) for _ in positions]
+        self.distance_to_center = [round(0.3 + 4.7 * uniform(), 1) for _ in positions]
+        self.amenity_set = rng.choices(range(len(AMENITY_SETS)), cum_weights=AMENITY_CUM_WEIGHTS, k=count)
+        self.hotel_type = rng.choices(range(len(HOTEL_TYPES)), k=count)
+        self.district = rng.choices(range(len(HOTEL_DISTRICTS)), k=count)
+        self.room_type = rng.choices(range(len(ROOM_TYPES)), k=count)
+        self.cancellation = rng.choices(range(len(CANCELLATION_POLICIES)), k=count)
+        self.breakfast_included = [uniform() < 0.5 for _ in positions]
+        self.hotel_id = [10000 + int(90000 * uniform()) for _ in positions]
+        self.image_id = [1500000000000 + int(100000000000 * uniform()) for _ in positions]
+        self._offer_index: Optional[OfferIndex] = None
+    
+    def cheapest(self, limit: Optional[int] = None) -> List[int]:
+        positions = range(self.count)
+        if limit is None or limit >= self.count:
+            return sorted(positions, key=self.total_price.__getitem__)
+        return heapq.nsmallest(limit, positions, key=self.total_price.__getitem__)
+    
+    def row(self, i: int) -> Dict[str, Any]:
+        chain_name = HOTEL_CHAINS[self.chain[i]]['name']
+        night_price = self.night_price[i]
+        market_night_price = self.market_night_price[i]
+        total_price = self.total_price[i]
+        market_total_price = market_night_price * self.nights
+        return {
+            'id': f"HTL{self.hotel_id[i]}",
+            'name': f"{chain_name} {HOTEL_TYPES[self.hotel_type[i]]} {self.city}",
+            'chain': chain_name,
+            'stars': self.stars[i],
+            'rating': self.rating[i],
+            'reviews_count': self.reviews_count[i],
             'price_per_night': night_price,
             'market_price_per_night': market_night_price,
             'total_price': total_price,
             'market_total_price': market_total_price,
-            'savings': savings,
+            'savings': market_total_price - total_price,
             'discount_percent': 25,
             'currency': '₽',
-            'nights': nights,
-            'address': f"{random.choice(['Центральный район', 'Исторический центр', 'Деловой район', 'Прибрежная зона'])}, {city}",
-            'distance_to_center': round(random.uniform(0.3, 5.0), 1),
-            'amenities': amenities,
-            'room_type': random.choice(['Стандартный номер', 'Делюкс', 'Люкс', 'Семейный номер', 'Апартаменты']),
-            'cancellation': random.choice(['Бесплатная отмена', 'Отмена за 48 часов', 'Без возврата']),
-            'breakfast_included': random.choice([True, False]),
-            'image': f"https://images.unsplash.com/photo-{random.randint(1500000000000, 1600000000000)}"
-        })
+            'nights': self.nights,
+            'address': f"{HOTEL_DISTRICTS[self.district[i]]}, {self.city}",
+            'distance_to_center': self.distance_to_center[i],
+            'amenities': list(AMENITY_SETS[self.amenity_set[i]]),
+            'room_type': ROOM_TYPES[self.room_type[i]],
+            'cancellation': CANCELLATION_POLICIES[self.cancellation[i]],
+            'breakfast_included': self.breakfast_included[i],
+            'image': f"https://images.unsplash.com/photo-{self.image_id[i]}"
+        }
     
-    hotels.sort(key=lambda x: x['total_price'])
-    return hotels
+    def rows(self, order: Iterable[int]) -> Iterator[Dict[str, Any]]:
+        return map(self.row, order)
+    
+    def offer_index(self) -> 'OfferIndex':
+        if self._offer_index is None:
+            non_refundable = CANCELLATION_POLICIES.index('Без возврата')
+            self._offer_index = OfferIndex({
+                'total_price': self.total_price,
+                'stars': self.stars,
+                'rating': self.rating,
+                'distance_to_center': self.distance_to_center,
+                'breakfast_included': self.breakfast_included,
+                'amenity_mask': [AMENITY_MASKS[amenity_set] for amenity_set in self.amenity_set],
+                'refundable': [policy != non_refundable for policy in self.cancellation]
+            }, self.row, self.count)
+        return self._offer_index
+
+def generate_hotel_columns(city: str, checkin: str, checkout: str, guests: int,
+                           count: Optional[int] = None) -> HotelColumns:
+    '''
+    Offers are reproducible for the same (city, checkin, checkout, guests);
+    raises ValueError for unusable dates.
+    '''
+    nights = parse_stay(checkin, checkout)
+    rng = random.Random(search_seed('hotels', city, checkin, checkout, str(guests)))
+    if count is None:
+        count = rng.randint(12, 20)
+    return HotelColumns(city, nights, count, rng)
+
+def generate_hotels(city: str, checkin: str, checkout: str, guests: int,
+                    limit: Optional[int] = None) -> List[Dict[str, Any]]:
+    # Cheapest first; a limit keeps only that many through a bounded heap
+    columns = generate_hotel_columns(city, checkin, checkout, guests)
+    return list(columns.rows(columns.cheapest(limit)))
 
 def get_hotel_cities() -> List[str]:
     return [
@@ -547,4 +2289,182 @@ def get_hotel_cities() -> List[str]:
         'Бангкок', 'Пхукет', 'Сингапур', 'Токио', 'Сеул', 'Гонконг',
         'Дели', 'Мумбаи', 'Гоа', 'Бали', 'Джакарта', 'Ханой', 'Хошимин',
         'Мальдивы', 'Сейшелы', 'Маврикий', 'Занзибар', 'Кейптаун'
-    ]
\ No newline at end of file
+    ]
+
+def hotel_city_for_airport(code: str) -> str:
+    # 'Денпасар (Бали)' -> 'Бали' and 'Лондон (Хитроу)' -> 'Лондон': whichever part hotels are listed under
+    name, detail = airport_name_parts(code)
+    listed = set(get_hotel_cities())
+    for candidate in (name, detail):
+        if candidate in listed:
+            return candidate
+    return name
+
+# Airport (or metro) code -> city name used by action=hotels, for action=package
+HOTEL_CITY_BY_AIRPORT: Dict[str, str] = {code: hotel_city_for_airport(code) for code in AIRPORTS}
+
+STATIC_CACHE_CONTROL = 'public, max-age=300'
+
+def get_header(event: Dict[str, Any], name: str) -> Optional[str]:
+    headers = event.get('headers') or {}
+    value = headers.get(name)
+    if value is None:
+        name = name.lower()
+        for key, header_value in headers.items():
+            if key.lower() == name:
+                return header_value
+    return value
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(','):
+        candidate = candidate.strip()
+        if candidate == '*' or candidate == etag or candidate == 'W/' + etag:
+            return True
+    return False
+
+def prebuild_static(payload: Any) -> Dict[str, Any]:
+    '''
+    Serializes, hashes and precompresses a body once. Each representation gets
+    its own ETag; encodings that do not make the body smaller are left out.
+    '''
+    body = json.dumps(payload)
+    raw = body.encode('utf-8')
+    etag = hashlib.blake2b(raw, digest_size=12).hexdigest()
+    variants: Dict[Optional[str], Dict[str, Any]] = {None: static_variant(body, False, f'"{etag}"')}
+    for encoding in ENCODINGS:
+        data = compress_body(raw, encoding, STATIC_LEVELS[encoding])
+        if len(data) < len(raw):
+            variant = static_variant(base64.b64encode(data).decode('ascii'), True, f'"{etag}-{encoding}"')
+            variant['headers']['Content-Encoding'] = encoding
+            variants[encoding] = variant
+    return {
+        'variants': variants,
+        'etags': [variant['etag'] for variant in variants.values()],
+        'raw_bytes': len(raw)
+    }
+
+def static_variant(body: str, encoded: bool, etag: str) -> Dict[str, Any]:
+    return {
+        'body': body,
+        'isBase64Encoded': encoded,
+        'etag': etag,
+        'headers': {
+            'Content-Type': 'application/json',
+            'Access-Control-Allow-Origin': '*',
+            'Cache-Control': STATIC_CACHE_CONTROL,
+            'ETag': etag,
+            'Vary': 'Accept-Encoding'
+        },
+        'not_modified_headers': {
+            'Access-Control-Allow-Origin': '*',
+            'Cache-Control': STATIC_CACHE_CONTROL,
+            'ETag': etag,
+            'Vary': 'Accept-Encoding'
+        }
+    }
+
+# Bodies that only change between deploys: serialized and hashed once per cold start
+STATIC_BODIES: Dict[str, Dict[str, Any]] = {
+    'cities': prebuild_static({'cities': CITIES}),
+    'hotel_cities': prebuild_static({'cities': get_hotel_cities()[:50]}),
+    'telegram': prebuild_static({'telegram_url': os.environ.get('TELEGRAM_BOT_URL', 'https://t.me/your_bot')})
+}
+
+def static_response(event: Dict[str, Any], action: str) -> Dict[str, Any]:
+    return prebuilt_response(event, STATIC_BODIES[action])
+
+def prebuilt_response(event: Dict[str, Any], static: Dict[str, Any]) -> Dict[str, Any]:
+    variants = static['variants']
+    variant = variants.get(accepted_encoding(event)) or variants[None]
+    if_none_match = get_header(event, 'If-None-Match')
+    # A cached copy in any encoding is still current
+    if any(etag_matches(if_none_match, etag) for etag in static['etags']):
+        note('not_modified')
+        return json_response('', 304, variant['not_modified_headers'])
+    return {
+        'statusCode': 200,
+        'headers': variant['headers'],
+        'isBase64Encoded': variant['isBase64Encoded'],
+        'body': variant['body']
+    }
+
+# Homepage destinations, priced from the same fares action=search and action=calendar quote
+POPULAR_ORIGIN = os.environ.get('POPULAR_ORIGIN', 'MOW')
+POPULAR_ROUTES: List[str] = os.environ.get('POPULAR_ROUTES', 'PAR,NYC,TYO,LON,DXB,BCN').split(',')
+POPULAR_DAYS = int(os.environ.get('POPULAR_DAYS', '30'))
+POPULAR_REFRESH_SECONDS = float(os.environ.get('POPULAR_REFRESH_SECONDS', '600'))
+
+def format_rub(amount: int) -> str:
+    return f"{amount:,}".replace(',', ' ') + ' ₽'
+
+def format_trend(current: int, previous: Optional[int]) -> str:
+    if not previous:
+        return '0%'
+    change = round((current - previous) * 100 / previous)
+    return f"{change:+d}%" if change else '0%'
+
+class PopularDestinations:
+    '''
+    Precomputed action=popular body: the minimum fare over the next `days` days
+    for each route, rebuilt every refresh_seconds. A stale snapshot keeps being
+    served while a background thread builds the next one, so the endpoint never
+    prices anything itself. Trends compare against the previous snapshot.
+    '''
+    
+    def __init__(self, origin: str, routes: List[str], days: int, refresh_seconds: float):
+        self.origin = origin
+        self.routes = [code for code in routes if code in AIRPORTS and code != origin]
+        self.days = days
+        self.refresh_seconds = refresh_seconds
+        self.refreshes = 0
+        self._prices: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._refreshing = False
+        self._static, self._built_at = self.build()
+    
+    def build(self) -> Tuple[Dict[str, Any], float]:
+        built_at = time.monotonic()
+        today = datetime.now()
+        dates = [(today + timedelta(days=offset)).strftime('%Y-%m-%d') for offset in range(1, self.days + 1)]
+        
+        destinations = []
+        prices = {}
+        for code in self.routes:
+            daily = calendar_min_prices(self.origin, code, dates)
+            cheapest = min(range(len(dates)), key=daily.__getitem__)
+            prices[code] = daily[cheapest]
+            destinations.append(dict(
+                city=airport_name_parts(code)[0],
+                country=AIRPORTS[code]['country'],
+                price=f"от {format_rub(daily[cheapest])}",
+                code=code,
+                trend=format_trend(daily[cheapest], self._prices.get(code)),
+                min_price=daily[cheapest],
+                date=dates[cheapest]
+            ))
+        self._prices = prices
+        return prebuild_static({'destinations': destinations, 'origin': self.origin, 'days': self.days}), built_at
+    
+    def refresh(self) -> None:
+        try:
+            static, built_at = self.build()
+            with self._lock:
+                self._static, self._built_at = static, built_at
+                self.refreshes += 1
+        finally:
+            self._refreshing = False
+    
+    def current(self) -> Dict[str, Any]:
+        static = self._static
+        if time.monotonic() - self._built_at >= self.refresh_seconds:
+            with self._lock:
+                start = not self._refreshing
+                self._refreshing = True
+            if start:
+                note('stale')
+                threading.Thread(target=self.refresh, name='popular-refresh', daemon=True).start()
+        return static
+
+POPULAR = PopularDestinations(POPULAR_ORIGIN, POPULAR_ROUTES, POPULAR_DAYS, POPULAR_REFRESH_SECONDS)
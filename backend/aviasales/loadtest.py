@@ -0,0 +1,357 @@
+'''
+Load test and regression check for the aviasales function.
+Replays weighted scenario mixes (and the cases from tests.json) against handler()
+with synthetic events, then reports throughput, latency percentiles, transient
+allocations per request (tracemalloc) and cold import time as JSON.
+
+    python loadtest.py --mix autocomplete=5,search=3,hotels=1,calendar=1 --output run.json
+    python loadtest.py --baseline run.json --threshold 0.25   # exit 1 on regression
+
+With --url the same events are sent over keep-alive HTTP connections to a
+running server.py instead, from --processes client processes:
+
+    python server.py --port 8080 --workers 1 &
+    python loadtest.py --url http://127.0.0.1:8080/ --processes 4 --concurrency 8 --output single.json
+    python server.py --port 8080 &    # one worker per core
+    python loadtest.py --url http://127.0.0.1:8080/ --processes 4 --concurrency 8 --baseline single.json
+'''
+import argparse
+import http.client
+import itertools
+import json
+import multiprocessing
+import os
+import random
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+import index
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+Event = Dict[str, Any]
+Scenario = Callable[[random.Random], List[Event]]
+# Serves one event and returns the response status
+Sender = Callable[[Event], int]
+
+ROUTE_CODES = ['MOW', 'LED', 'AER', 'KZN', 'SVX', 'PAR', 'LON', 'BCN', 'IST', 'DXB', 'BKK', 'NYC', 'TBS', 'EVN', 'AYT']
+
+def get_event(**params: str) -> Event:
+    return {'httpMethod': 'GET', 'queryStringParameters': params, 'headers': {}}
+
+def random_date(rng: random.Random) -> str:
+    return time.strftime('%Y-%m-%d', time.gmtime(time.time() + rng.randint(1, 60) * 86400))
+
+def autocomplete_burst(rng: random.Random) -> List[Event]:
+    # One request per keystroke while a user types a city name
+    name = rng.choice(index.CITIES)['name']
+    return [get_event(action='cities', q=name[:length], limit='8') for length in range(1, min(len(name), 6) + 1)]
+
+def search_session(rng: random.Random) -> List[Event]:
+    origin, destination = rng.sample(ROUTE_CODES, 2)
+    return [get_event(action='search', **{'from': origin, 'to': destination, 'date': random_date(rng)})]
+
+def hotels_session(rng: random.Random) -> List[Event]:
+    city = rng.choice(index.get_hotel_cities())
+    checkin = random_date(rng)
+    checkout = time.strftime('%Y-%m-%d', time.gmtime(time.mktime(time.strptime(checkin, '%Y-%m-%d')) + rng.randint(1, 7) * 86400))
+    first = get_event(action='hotels', city=city, checkin=checkin, checkout=checkout)
+    refine = get_event(action='hotels', city=city, checkin=checkin, checkout=checkout, sort='rating', min_stars='4')
+    return [first, refine]
+
+def calendar_session(rng: random.Random) -> List[Event]:
+    origin, destination = rng.sample(ROUTE_CODES, 2)
+    return [get_event(action='calendar', **{'from': origin, 'to': destination, 'month': random_date(rng)[:7]})]
+
+def static_session(rng: random.Random) -> List[Event]:
+    return [get_event(action=rng.choice(['cities', 'popular', 'telegram', 'hotel_cities']))]
+
+SCENARIOS: Dict[str, Scenario] = {
+    'autocomplete': autocomplete_burst,
+    'search': search_session,
+    'hotels': hotels_session,
+    'calendar': calendar_session,
+    'static': static_session,
+}
+
+def event_from_test(case: Dict[str, Any]) -> Event:
+    url = urlsplit(case.get('path', '/'))
+    event: Event = {
+        'httpMethod': case.get('method', 'GET'),
+        'queryStringParameters': dict(parse_qsl(url.query)),
+        'headers': case.get('headers', {})
+    }
+    if 'body' in case:
+        event['body'] = case['body'] if isinstance(case['body'], str) else json.dumps(case['body'])
+    return event
+
+def load_test_cases(path: str) -> List[Tuple[str, Event, int]]:
+    with open(path, encoding='utf-8') as handle:
+        cases = json.load(handle)['tests']
+    return [(case['name'], event_from_test(case), case.get('expectedStatus', 200)) for case in cases]
+
+class HttpSender:
+    '''
+    Sends events as real requests over one keep-alive connection; each load-test
+    thread owns its own sender.
+    '''
+
+    def __init__(self, url: str):
+        parts = urlsplit(url)
+        self.path = parts.path or '/'
+        self.connection = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=30)
+
+    def __call__(self, event: Event) -> int:
+        params = event.get('queryStringParameters') or {}
+        path = self.path + ('?' + urlencode(params) if params else '')
+        body = event.get('body')
+        for attempt in range(2):
+            try:
+                self.connection.request(event['httpMethod'], path, body=body.encode('utf-8') if body else None,
+                                        headers=event.get('headers') or {})
+                response = self.connection.getresponse()
+                response.read()
+                return response.status
+            except (http.client.RemoteDisconnected, ConnectionError):
+                # The server closed an idle keep-alive connection; reconnect once
+                self.connection.close()
+                if attempt:
+                    raise
+        return 0
+
+def local_sender(label: str) -> Sender:
+    ids = itertools.count()
+
+    def send(event: Event) -> int:
+        context = SimpleNamespace(request_id=f'{label}-{next(ids)}', function_name='aviasales', function_version='load')
+        return index.handler(event, context)['statusCode']
+    return send
+
+def parse_mix(spec: str) -> Dict[str, float]:
+    mix = {}
+    for part in spec.split(','):
+        name, _, weight = part.partition('=')
+        if name not in SCENARIOS:
+            raise SystemExit(f"Unknown scenario {name!r}; choose from {', '.join(SCENARIOS)}")
+        mix[name] = float(weight or 1)
+    return mix
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    ordered = sorted(samples)
+    pick = lambda q: ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+    return {
+        'count': len(ordered),
+        'mean_ms': round(statistics.fmean(ordered), 4),
+        'p50_ms': round(pick(0.5), 4),
+        'p95_ms': round(pick(0.95), 4),
+        'p99_ms': round(pick(0.99), 4),
+        'max_ms': round(ordered[-1], 4)
+    }
+
+class Runner:
+    def __init__(self, mix: Dict[str, float], seed: int, url: Optional[str] = None):
+        self.mix = mix
+        self.names = list(mix)
+        self.weights = [mix[name] for name in self.names]
+        self.seed = seed
+        self.url = url
+        self.latencies: Dict[str, List[float]] = {name: [] for name in self.names}
+        self.errors: Dict[str, int] = {name: 0 for name in self.names}
+        self._lock = threading.Lock()
+
+    def worker(self, worker_id: int, deadline: float) -> int:
+        rng = random.Random(self.seed + worker_id)
+        send = HttpSender(self.url) if self.url else local_sender(f'load-{worker_id}')
+        local: Dict[str, List[float]] = {name: [] for name in self.names}
+        errors = dict.fromkeys(self.names, 0)
+        requests_done = 0
+        while time.perf_counter() < deadline:
+            name = rng.choices(self.names, self.weights)[0]
+            for event in SCENARIOS[name](rng):
+                started = time.perf_counter()
+                status = send(event)
+                local[name].append((time.perf_counter() - started) * 1000)
+                if status >= 400:
+                    errors[name] += 1
+                requests_done += 1
+        with self._lock:
+            for name in self.names:
+                self.latencies[name].extend(local[name])
+                self.errors[name] += errors[name]
+        return requests_done
+
+    def drive(self, concurrency: int, seconds: float) -> int:
+        deadline = time.perf_counter() + seconds
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            return sum(pool.map(lambda worker_id: self.worker(worker_id, deadline), range(concurrency)))
+
+    def run(self, concurrency: int, seconds: float, processes: int = 1) -> Dict[str, Any]:
+        started = time.perf_counter()
+        if processes == 1:
+            total = self.drive(concurrency, seconds)
+        else:
+            # One GIL-bound client process cannot saturate a multi-worker server
+            jobs = [(self.mix, self.seed + part * 1000, self.url, concurrency, seconds) for part in range(processes)]
+            with multiprocessing.get_context('fork').Pool(processes) as pool:
+                parts = pool.starmap(drive_part, jobs)
+            total = 0
+            for done, latencies, errors in parts:
+                total += done
+                for name in self.names:
+                    self.latencies[name].extend(latencies[name])
+                    self.errors[name] += errors[name]
+        elapsed = time.perf_counter() - started
+        overall = [ms for samples in self.latencies.values() for ms in samples]
+        return {
+            'requests': total,
+            'elapsed_s': round(elapsed, 3),
+            'throughput_rps': round(total / elapsed, 1),
+            'latency': percentiles(overall) if overall else {},
+            'scenarios': {
+                name: dict(percentiles(samples), errors=self.errors[name])
+                for name, samples in self.latencies.items() if samples
+            }
+        }
+
+def drive_part(mix: Dict[str, float], seed: int, url: Optional[str], concurrency: int,
+               seconds: float) -> Tuple[int, Dict[str, List[float]], Dict[str, int]]:
+    runner = Runner(mix, seed, url)
+    done = runner.drive(concurrency, seconds)
+    return done, runner.latencies, runner.errors
+
+def measure_allocations(mix: Dict[str, float], seed: int, samples: int) -> Dict[str, Dict[str, float]]:
+    '''
+    Peak transient bytes traced while serving one request, averaged per scenario.
+    Runs separately from the timed pass because tracemalloc slows everything down.
+    '''
+    rng = random.Random(seed)
+    context = SimpleNamespace(request_id='alloc', function_name='aviasales', function_version='load')
+    result = {}
+    tracemalloc.start()
+    try:
+        for name in mix:
+            peaks, retained = [], []
+            while len(peaks) < samples:
+                for event in SCENARIOS[name](rng):
+                    before, _ = tracemalloc.get_traced_memory()
+                    tracemalloc.reset_peak()
+                    index.handler(event, context)
+                    current, peak = tracemalloc.get_traced_memory()
+                    peaks.append(peak - before)
+                    retained.append(current - before)
+            result[name] = {
+                'alloc_peak_kib': round(statistics.fmean(peaks) / 1024, 2),
+                'retained_kib': round(statistics.fmean(retained) / 1024, 2)
+            }
+    finally:
+        tracemalloc.stop()
+    return result
+
+def measure_cold_import(runs: int) -> Dict[str, float]:
+    code = 'import time; started = time.perf_counter(); import index; print(time.perf_counter() - started)'
+    timings = []
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, '-c', code], cwd=HERE, capture_output=True, text=True, check=True).stdout
+        timings.append(float(output) * 1000)
+    return {'median_ms': round(statistics.median(timings), 2), 'max_ms': round(max(timings), 2)}
+
+def check_test_cases(path: str, url: Optional[str] = None) -> Dict[str, Any]:
+    send = HttpSender(url) if url else local_sender('tests-json')
+    failures = []
+    for name, event, expected_status in load_test_cases(path):
+        status = send(event)
+        if status != expected_status:
+            failures.append({'name': name, 'status': status, 'expected': expected_status})
+    return {'cases': len(load_test_cases(path)), 'failures': failures}
+
+# (path into the report, True when larger is better)
+REGRESSION_METRICS: List[Tuple[Tuple[str, ...], bool]] = [
+    (('load', 'throughput_rps'), True),
+    (('load', 'latency', 'p95_ms'), False),
+    (('load', 'latency', 'p99_ms'), False),
+    (('cold_import', 'median_ms'), False),
+]
+
+def lookup(report: Dict[str, Any], path: Tuple[str, ...]) -> Optional[float]:
+    for key in path:
+        if not isinstance(report, dict) or key not in report:
+            return None
+        report = report[key]
+    return report
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any], threshold: float) -> List[str]:
+    paths = list(REGRESSION_METRICS)
+    for name in report.get('load', {}).get('scenarios', {}):
+        paths.append((('load', 'scenarios', name, 'p95_ms'), False))
+    for name in report.get('allocations', {}):
+        paths.append((('allocations', name, 'alloc_peak_kib'), False))
+
+    regressions = []
+    for path, higher_is_better in paths:
+        current, previous = lookup(report, path), lookup(baseline, path)
+        if not current or not previous:
+            continue
+        change = (previous - current) / previous if higher_is_better else (current - previous) / previous
+        if change > threshold:
+            regressions.append(f"{'.'.join(path)}: {previous} -> {current} ({change:+.0%} worse)")
+    return regressions
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--mix', default='autocomplete=5,search=3,hotels=1,calendar=1,static=2',
+                        help='comma-separated scenario=weight pairs')
+    parser.add_argument('--concurrency', type=int, default=4, help='threads per client process')
+    parser.add_argument('--url', help='load a running server.py over HTTP instead of calling handler() in-process')
+    parser.add_argument('--processes', type=int, default=1, help='client processes (with --url)')
+    parser.add_argument('--seconds', type=float, default=5.0)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--alloc-samples', type=int, default=50, help='requests per scenario for tracemalloc; 0 skips')
+    parser.add_argument('--import-runs', type=int, default=5, help='cold imports to time; 0 skips')
+    parser.add_argument('--tests', default=os.path.join(HERE, 'tests.json'), help='tests.json to replay first')
+    parser.add_argument('--output', help='write the JSON report here')
+    parser.add_argument('--baseline', help='earlier JSON report to compare against')
+    parser.add_argument('--threshold', type=float, default=0.2, help='allowed relative regression')
+    args = parser.parse_args()
+
+    if args.processes > 1 and not args.url:
+        parser.error('--processes needs --url')
+
+    mix = parse_mix(args.mix)
+    report: Dict[str, Any] = {
+        'config': {'mix': mix, 'concurrency': args.concurrency, 'seconds': args.seconds, 'seed': args.seed,
+                   'python': sys.version.split()[0], 'metrics_enabled': index.METRICS_ENABLED,
+                   'url': args.url, 'processes': args.processes},
+        'tests_json': check_test_cases(args.tests, args.url) if args.tests else None,
+        'load': Runner(mix, args.seed, args.url).run(args.concurrency, args.seconds, args.processes),
+    }
+    # Allocations are only visible in-process
+    if args.alloc_samples and not args.url:
+        report['allocations'] = measure_allocations(mix, args.seed, args.alloc_samples)
+    if args.import_runs:
+        report['cold_import'] = measure_cold_import(args.import_runs)
+
+    rendered = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as handle:
+            handle.write(rendered + '\n')
+    print(rendered)
+
+    failed = bool(report['tests_json'] and report['tests_json']['failures'])
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as handle:
+            regressions = compare(report, json.load(handle), args.threshold)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        failed = failed or bool(regressions)
+    sys.exit(1 if failed else 0)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,200 @@
+'''
+Upstream fare providers: concurrent fan-out over a shared keep-alive
+connection pool with per-provider deadlines and hedged retries.
+
+Providers are configured through the FARE_PROVIDERS environment variable, a
+JSON list such as
+    [{"name": "alpha", "url": "https://fares.example/search", "timeout": 0.8, "hedge_after": 0.25}]
+Each provider is called as GET <url>?from=MOW&to=PAR&date=2025-01-10 and must
+answer {"offers": [{"airline", "flight_number", "departure_time", "arrival_time",
+"duration_minutes", "price", "stops", "aircraft"}, ...]}. Connecting offers may
+add "segments" (each with flight_number, origin, destination, departure_time,
+arrival_time and duration_minutes), "via" and "arrival_day_offset"; missing ones
+are derived so upstream offers match the generated schema.
+'''
+import json
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+class FareProvider:
+    def __init__(self, name: str, url: str, timeout: float = 1.0, hedge_after: Optional[float] = None,
+                 markup: float = 1.0):
+        self.name = name
+        self.url = url
+        # Seconds from the start of the search after which the provider is given up on
+        self.timeout = timeout
+        # Seconds after which a second, hedged request is sent if the first has not answered
+        self.hedge_after = hedge_after
+        self.markup = markup
+
+class FareClient:
+    '''
+    Shared by all requests of a function instance: one requests.Session whose
+    connection pool keeps upstream connections alive between invocations, and
+    one thread pool for the concurrent provider calls.
+    '''
+
+    def __init__(self, providers: List[FareProvider], pool_size: int = 16):
+        self.providers = providers
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=max(len(providers), 1), pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.executor = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix='fare-provider')
+        self.stats = {'requests': 0, 'hedged': 0, 'errors': 0, 'timeouts': 0}
+        # Updated from fetch threads and from every concurrent search
+        self._stats_lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> Optional['FareClient']:
+        config = os.environ.get('FARE_PROVIDERS')
+        if not config:
+            return None
+        providers = [FareProvider(**entry) for entry in json.loads(config)]
+        return cls(providers, pool_size=int(os.environ.get('FARE_POOL_SIZE', '16')))
+
+    def _count(self, name: str) -> None:
+        with self._stats_lock:
+            self.stats[name] += 1
+
+    def _fetch(self, provider: FareProvider, params: Dict[str, str]) -> List[Dict[str, Any]]:
+        self._count('requests')
+        response = self.session.get(provider.url, params=params, timeout=provider.timeout)
+        response.raise_for_status()
+        return response.json()['offers']
+
+    def search(self, origin: str, destination: str, date: str) -> Tuple[List[Dict[str, Any]], Dict[str, str]]:
+        '''
+        Queries every provider at once and returns whatever arrived before each
+        provider's deadline, converted to flight offers and sorted by price, plus
+        a status per provider: ok, error or timeout.
+        '''
+        params = {'from': origin, 'to': destination, 'date': date}
+        started = time.monotonic()
+        pending: Dict[Future, FareProvider] = {}
+        hedged: Set[str] = set()
+        unresolved = {provider.name: provider for provider in self.providers}
+        results: Dict[str, List[Dict[str, Any]]] = {}
+        status = dict.fromkeys(unresolved, 'timeout')
+
+        def launch(provider: FareProvider) -> None:
+            pending[self.executor.submit(self._fetch, provider, params)] = provider
+
+        for provider in self.providers:
+            launch(provider)
+
+        while unresolved:
+            elapsed = time.monotonic() - started
+            for name, provider in list(unresolved.items()):
+                if elapsed >= provider.timeout:
+                    del unresolved[name]
+                    self._count('timeouts')
+                elif provider.hedge_after is not None and name not in hedged and elapsed >= provider.hedge_after:
+                    hedged.add(name)
+                    self._count('hedged')
+                    launch(provider)
+            if not unresolved:
+                break
+
+            wakeups = [provider.timeout for provider in unresolved.values()]
+            wakeups += [provider.hedge_after for name, provider in unresolved.items()
+                        if provider.hedge_after is not None and name not in hedged]
+            live = [future for future, provider in pending.items() if provider.name in unresolved]
+            done, _ = wait(live, timeout=max(min(wakeups) - elapsed, 0), return_when=FIRST_COMPLETED)
+
+            for future in done:
+                provider = pending.pop(future)
+                if provider.name not in unresolved:
+                    continue
+                if future.exception() is None:
+                    results[provider.name] = future.result()
+                    status[provider.name] = 'ok'
+                    del unresolved[provider.name]
+                elif provider.name not in hedged:
+                    # A fast failure is retried right away as the hedge
+                    hedged.add(provider.name)
+                    self._count('hedged')
+                    launch(provider)
+                elif not any(other is provider for other in pending.values()):
+                    status[provider.name] = 'error'
+                    self._count('errors')
+                    del unresolved[provider.name]
+
+        return merge_offers(self.providers, results, origin, destination), status
+
+def clock_time(value: Any) -> Tuple[str, int]:
+    '''
+    'H:MM' or 'HH:MM' -> ('HH:MM', minutes after midnight); anything else is a
+    ValueError, so merge_offers drops the offer.
+    '''
+    hours, minutes = (int(part) for part in str(value).split(':'))
+    if not (0 <= hours < 24 and 0 <= minutes < 60):
+        raise ValueError(f"invalid time {value!r}")
+    return f"{hours:02d}:{minutes:02d}", hours * 60 + minutes
+
+def to_flight_offer(provider: FareProvider, raw: Dict[str, Any], origin: str, destination: str) -> Dict[str, Any]:
+    price = int(raw['price'] * provider.markup)
+    market_price = int(price / 0.8)
+    duration_minutes = int(raw['duration_minutes'])
+    departure_time, departure_minute = clock_time(raw['departure_time'])
+    arrival_time, _ = clock_time(raw['arrival_time'])
+    stops = int(raw.get('stops', 0))
+    segments = raw.get('segments')
+    if not isinstance(segments, list):
+        # A nonstop offer is its own single segment; a connection without details has none
+        segments = [] if stops else [{
+            'flight_number': raw['flight_number'],
+            'origin': origin,
+            'destination': destination,
+            'departure_time': departure_time,
+            'arrival_time': arrival_time,
+            'duration_minutes': duration_minutes
+        }]
+    via = raw.get('via')
+    if not isinstance(via, list):
+        via = [segment['destination'] for segment in segments[:-1]]
+    arrival_day_offset = raw.get('arrival_day_offset')
+    if arrival_day_offset is None:
+        arrival_day_offset = (departure_minute + duration_minutes) // 1440
+    return {
+        'id': raw['flight_number'],
+        'airline': raw['airline'],
+        'origin': origin,
+        'destination': destination,
+        'departure_time': departure_time,
+        'arrival_time': arrival_time,
+        'arrival_day_offset': int(arrival_day_offset),
+        'duration': f"{duration_minutes // 60}ч {duration_minutes % 60}м",
+        'duration_minutes': duration_minutes,
+        'price': price,
+        'market_price': market_price,
+        'savings': market_price - price,
+        'discount_percent': 20,
+        'currency': '₽',
+        'stops': stops,
+        'via': via,
+        'segments': segments,
+        'aircraft': raw.get('aircraft', ''),
+        'provider': provider.name
+    }
+
+def merge_offers(providers: List[FareProvider], results: Dict[str, List[Dict[str, Any]]],
+                 origin: str, destination: str) -> List[Dict[str, Any]]:
+    # The same flight sold by several providers is kept once, at its lowest price
+    best: Dict[str, Dict[str, Any]] = {}
+    for provider in providers:
+        for raw in results.get(provider.name, ()):
+            try:
+                offer = to_flight_offer(provider, raw, origin, destination)
+            except (KeyError, TypeError, ValueError):
+                continue
+            current = best.get(offer['id'])
+            if current is None or offer['price'] < current['price']:
+                best[offer['id']] = offer
+    return sorted(best.values(), key=lambda offer: offer['price'])
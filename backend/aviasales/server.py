@@ -0,0 +1,320 @@
+'''
+Self-hosted HTTP server for the aviasales function. Adapts real HTTP requests to
+the event/context dicts handler() expects and serves them from a pre-fork pool
+of worker processes, one per core by default.
+
+    python server.py --port 8080 --workers 4
+    kill -HUP <master pid>     # graceful reload: fresh workers take over, old ones drain
+    kill -TERM <master pid>    # graceful stop
+
+The master only binds the socket and supervises. index is imported by each
+worker after the fork, so every worker has its own warm caches and thread pools
+(shared-nothing; only CACHE_DB_PATH, when set, is common to all of them) and a
+reload picks up changed code. Old workers are stopped only once every new worker
+has imported index, so a broken deploy keeps the old generation serving.
+'''
+import argparse
+import base64
+import json
+import os
+import select
+import signal
+import socket
+import sys
+import threading
+import time
+import traceback
+import uuid
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from types import SimpleNamespace
+from typing import Any, Dict, Iterable, List, Tuple
+from urllib.parse import parse_qsl, urlsplit
+
+READY_TIMEOUT_SECONDS = 60.0
+
+class FunctionRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+    server_version = 'aviasales'
+
+    def setup(self) -> None:
+        # Idle keep-alive connections are closed after this many seconds
+        self.timeout = self.server.keepalive
+        super().setup()
+
+    def serve(self) -> None:
+        server = self.server
+        if 'chunked' in self.headers.get('Transfer-Encoding', '').lower():
+            self.close_connection = True
+            self.reply({'statusCode': 411, 'headers': {'Content-Type': 'application/json'},
+                        'body': json.dumps({'error': 'Content-Length required'})})
+            return
+
+        # http.server decodes the request line as latin-1; unescaped UTF-8 is recovered here
+        url = urlsplit(self.path.encode('iso-8859-1').decode('utf-8', 'replace'))
+        length_header = (self.headers.get('Content-Length') or '0').strip()
+        if not length_header.isdigit():
+            # The body cannot be delimited, so the connection cannot be reused either
+            self.close_connection = True
+            self.reply({'statusCode': 400, 'headers': {'Content-Type': 'application/json'},
+                        'body': json.dumps({'error': 'Invalid Content-Length'})})
+            return
+        length = int(length_header)
+        raw = self.rfile.read(length) if length else b''
+        try:
+            body, encoded = raw.decode('utf-8'), False
+        except UnicodeDecodeError:
+            body, encoded = base64.b64encode(raw).decode('ascii'), True
+        event = {
+            'httpMethod': self.command,
+            'path': url.path,
+            'headers': dict(self.headers.items()),
+            'queryStringParameters': dict(parse_qsl(url.query, keep_blank_values=True)),
+            'body': body,
+            'isBase64Encoded': encoded,
+            'requestContext': {'identity': {'sourceIp': self.client_address[0]}},
+            # Chunked transfer coding needs HTTP/1.1; older clients get the joined body
+            'streaming': self.request_version == 'HTTP/1.1'
+        }
+        context = SimpleNamespace(request_id=uuid.uuid4().hex, function_name='aviasales',
+                                  function_version='self-hosted')
+
+        with server.active_lock:
+            server.active += 1
+        try:
+            try:
+                response = server.index.handler(event, context)
+            except Exception:
+                traceback.print_exc()
+                response = {'statusCode': 500, 'headers': {'Content-Type': 'application/json'},
+                            'body': json.dumps({'error': 'Internal server error'})}
+            self.reply(response)
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True
+        finally:
+            with server.active_lock:
+                server.active -= 1
+                server.active_lock.notify_all()
+
+    do_GET = do_POST = do_PUT = do_PATCH = do_DELETE = do_OPTIONS = serve
+
+    def reply(self, response: Dict[str, Any]) -> None:
+        self.send_response(response.get('statusCode', 200))
+        for name, value in (response.get('headers') or {}).items():
+            self.send_header(name, str(value))
+        if self.server.draining:
+            self.send_header('Connection', 'close')
+            self.close_connection = True
+
+        body = response.get('body')
+        if body is None or isinstance(body, str):
+            body = body or ''
+            data = base64.b64decode(body) if response.get('isBase64Encoded') else body.encode('utf-8')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+            return
+
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        self.write_chunks(body)
+
+    def write_chunks(self, chunks: Iterable[Any]) -> None:
+        for chunk in chunks:
+            data = chunk.encode('utf-8') if isinstance(chunk, str) else chunk
+            if data:
+                self.wfile.write(b'%x\r\n%s\r\n' % (len(data), data))
+        self.wfile.write(b'0\r\n\r\n')
+
+    def log_request(self, code: Any = '-', size: Any = '-') -> None:
+        if self.server.access_log:
+            super().log_request(code, size)
+
+class WorkerServer(ThreadingMixIn, HTTPServer):
+    # One thread per connection; draining waits for in-flight requests, not idle connections
+    daemon_threads = True
+
+    def __init__(self, listener: socket.socket, module: Any, keepalive: float, access_log: bool):
+        super().__init__(listener.getsockname()[:2], FunctionRequestHandler, bind_and_activate=False)
+        self.socket.close()
+        self.socket = listener
+        self.server_address = listener.getsockname()
+        self.index = module
+        self.keepalive = keepalive
+        self.access_log = access_log
+        self.draining = False
+        self.active = 0
+        self.active_lock = threading.Condition()
+
+    def handle_error(self, request: Any, client_address: Any) -> None:
+        # A client dropping an idle keep-alive connection is not worth a traceback
+        if not isinstance(sys.exc_info()[1], (BrokenPipeError, ConnectionResetError)):
+            super().handle_error(request, client_address)
+
+    def drain(self, timeout: float) -> None:
+        with self.active_lock:
+            self.active_lock.wait_for(lambda: self.active == 0, timeout)
+
+def run_worker(listener: socket.socket, ready_fd: int, args: argparse.Namespace) -> int:
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+    # Imported after the fork: each worker warms its own caches
+    import index
+
+    server = WorkerServer(listener, index, args.keepalive, args.access_log)
+
+    def stop(signum: int, frame: Any) -> None:
+        server.draining = True
+        # shutdown() blocks until serve_forever() returns, so not from the loop's own thread
+        threading.Thread(target=server.shutdown, daemon=True).start()
+
+    signal.signal(signal.SIGTERM, stop)
+    try:
+        os.write(ready_fd, b'1')
+    except BrokenPipeError:
+        # Replacement workers are not waited for
+        pass
+    os.close(ready_fd)
+    server.serve_forever(poll_interval=0.5)
+    server.drain(args.graceful_timeout)
+    return 0
+
+def signal_worker(pid: int, signum: int) -> None:
+    try:
+        os.kill(pid, signum)
+    except ProcessLookupError:
+        # Exited and already reaped
+        pass
+
+class Master:
+    def __init__(self, listener: socket.socket, args: argparse.Namespace):
+        self.listener = listener
+        self.args = args
+        self.workers: Dict[int, int] = {}
+        self.generation = 0
+        self.reload_requested = False
+        self.stop_requested = False
+
+    def log(self, message: str) -> None:
+        print(f"[master {os.getpid()}] {message}", file=sys.stderr, flush=True)
+
+    def spawn(self, generation: int) -> Tuple[int, int]:
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_fd)
+            code = 1
+            try:
+                code = run_worker(self.listener, write_fd, self.args)
+            except BaseException:
+                traceback.print_exc()
+            finally:
+                sys.stderr.flush()
+                os._exit(code)
+        os.close(write_fd)
+        self.workers[pid] = generation
+        return pid, read_fd
+
+    def wait_ready(self, pending: List[Tuple[int, int]]) -> bool:
+        fds = {read_fd: pid for pid, read_fd in pending}
+        deadline = time.monotonic() + READY_TIMEOUT_SECONDS
+        ready = True
+        while fds and time.monotonic() < deadline:
+            readable, _, _ = select.select(list(fds), [], [], max(deadline - time.monotonic(), 0))
+            for read_fd in readable:
+                # A worker that dies while importing closes the pipe without writing
+                ready = ready and os.read(read_fd, 1) == b'1'
+                os.close(read_fd)
+                del fds[read_fd]
+        for read_fd in fds:
+            os.close(read_fd)
+        return ready and not fds
+
+    def start_generation(self) -> bool:
+        generation = self.generation + 1
+        pending = [self.spawn(generation) for _ in range(self.args.workers)]
+        if not self.wait_ready(pending):
+            self.log(f"generation {generation} failed to start; keeping generation {self.generation}")
+            self.signal_generation(generation, signal.SIGKILL)
+            return False
+        previous, self.generation = self.generation, generation
+        self.signal_generation(previous, signal.SIGTERM)
+        self.log(f"generation {generation}: {self.args.workers} workers on {self.address()}")
+        return True
+
+    def signal_generation(self, generation: int, signum: int) -> None:
+        for pid, worker_generation in list(self.workers.items()):
+            if worker_generation == generation:
+                signal_worker(pid, signum)
+
+    def address(self) -> str:
+        host, port = self.listener.getsockname()[:2]
+        return f"http://{host}:{port}/"
+
+    def reap(self) -> List[int]:
+        exited = []
+        while self.workers:
+            try:
+                pid, _ = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if pid == 0:
+                break
+            if self.workers.pop(pid, None) == self.generation:
+                exited.append(pid)
+        return exited
+
+    def run(self) -> int:
+        signal.signal(signal.SIGHUP, lambda signum, frame: setattr(self, 'reload_requested', True))
+        signal.signal(signal.SIGTERM, lambda signum, frame: setattr(self, 'stop_requested', True))
+        signal.signal(signal.SIGINT, lambda signum, frame: setattr(self, 'stop_requested', True))
+        if not self.start_generation():
+            return 1
+
+        while not self.stop_requested:
+            time.sleep(0.2)
+            if self.reload_requested:
+                self.reload_requested = False
+                self.log('reloading')
+                self.start_generation()
+            for pid in self.reap():
+                if not self.stop_requested:
+                    self.log(f"worker {pid} exited; replacing it")
+                    _, read_fd = self.spawn(self.generation)
+                    os.close(read_fd)
+
+        self.log('stopping')
+        for pid in list(self.workers):
+            signal_worker(pid, signal.SIGTERM)
+        deadline = time.monotonic() + self.args.graceful_timeout + 1
+        while self.workers and time.monotonic() < deadline:
+            self.reap()
+            time.sleep(0.05)
+        for pid in list(self.workers):
+            signal_worker(pid, signal.SIGKILL)
+        return 0
+
+def listen(host: str, port: int, backlog: int) -> socket.socket:
+    listener = socket.create_server((host, port), backlog=backlog)
+    # Every worker polls the same socket; whoever loses the accept race must not block in accept()
+    listener.setblocking(False)
+    return listener
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='worker processes (default: one per core)')
+    parser.add_argument('--backlog', type=int, default=1024)
+    parser.add_argument('--keepalive', type=float, default=5.0, help='seconds an idle connection is kept open')
+    parser.add_argument('--graceful-timeout', type=float, default=30.0,
+                        help='seconds a stopping worker waits for in-flight requests')
+    parser.add_argument('--access-log', action='store_true')
+    args = parser.parse_args()
+    if args.workers < 1:
+        parser.error('--workers must be at least 1')
+    sys.exit(Master(listen(args.host, args.port, args.backlog), args).run())
+
+if __name__ == '__main__':
+    main()